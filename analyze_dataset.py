@@ -1,40 +1,24 @@
-from datasets import load_from_disk
-import numpy as np
+from dataset_index import load_index, dataset_stats
 
 def analyze_squad(path="datasets/squad_v2"):
-    print(f"Loading dataset from {path}...")
+    # SQuAD 2.0 has 'train' and 'validation' splits; statistics come from the
+    # memory-mapped index (built on first use), not from decoding every row.
+    split = 'validation'
+    print(f"Loading dataset index for {path}...")
     try:
-        dataset = load_from_disk(path)
+        index = load_index(path, split)
     except Exception as e:
         print(f"Error loading dataset: {e}")
         return
 
-    # SQuAD 2.0 has 'train' and 'validation' splits
-    split = 'validation'
-    if split not in dataset:
-        print(f"Split '{split}' not found. Available: {dataset.keys()}")
-        return
-
-    data = dataset[split]
-    total = len(data)
+    stats = dataset_stats(index)
+    total = stats["total"]
     
     print(f"\n--- Analysis of SQuAD 2.0 ({split}) ---")
     print(f"Total Examples: {total}")
 
-    # Count unanswerable
-    # In SQuAD 2.0, unanswerable questions have empty 'answers' text or start index
-    unanswerable_count = 0
-    question_lengths = []
-    context_lengths = []
-
-    for example in data:
-        is_impossible = len(example['answers']['answer_start']) == 0
-        if is_impossible:
-            unanswerable_count += 1
-        
-        question_lengths.append(len(example['question'].split()))
-        context_lengths.append(len(example['context'].split()))
-
+    # Unanswerable questions have an empty 'answers' start index list
+    unanswerable_count = stats["unanswerable"]
     answerable_count = total - unanswerable_count
     
     print(f"\nClass Distribution:")
@@ -44,8 +28,8 @@ def analyze_squad(path="datasets/squad_v2"):
     print(f"  -> Baseline Accuracy (Always 'Abstain'): {unanswerable_count/total:.2%}")
 
     print(f"\nLength Statistics (Words):")
-    print(f"  Avg Question Length: {np.mean(question_lengths):.2f}")
-    print(f"  Avg Context Length:  {np.mean(context_lengths):.2f}")
+    print(f"  Avg Question Length: {stats['avg_question_words']:.2f}")
+    print(f"  Avg Context Length:  {stats['avg_context_words']:.2f}")
 
 if __name__ == "__main__":
     analyze_squad()
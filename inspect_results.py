@@ -1,67 +1,86 @@
-import json
 import argparse
 import os
 import random
+from results_io import read_columns, result_columns
 
-def inspect_results(results_file, mode='all', n=5):
+def inspect_results(results_file, mode='all', n=5, threshold=0.5):
     if not os.path.exists(results_file):
         print(f"File {results_file} not found.")
         return
 
-    with open(results_file, 'r') as f:
-        data = json.load(f)
-
-    print(f"Loaded {len(data)} results from {results_file}")
-
     # Categorize
     # TP: Abstain = True, Impossible = True (Correctly recognized impossibility)
     # TN: Abstain = False, Impossible = False (Correctly answered)
     # FP: Abstain = True, Impossible = False (Refused to answer a valid question)
     # FN: Abstain = False, Impossible = True (Hallucinated an answer)
+    # Categories come from the score/flag columns alone; each keeps a count
+    # and a reservoir sample of n row indices, and only the sampled rows'
+    # text is read afterwards. Runs without an `abstain` field abstain when
+    # the score is above `threshold`.
+    names = {
+        (True, True): 'TP (Correct Abstain)',
+        (False, False): 'TN (Correct Answer)',
+        (True, False): 'FP (False Refusal)',
+        (False, True): 'FN (Hallucination)'
+    }
+    counts = {name: 0 for name in names.values()}
+    categories = {name: [] for name in names.values()}
 
-    tp = [d for d in data if d['abstain'] and d['is_impossible']]
-    tn = [d for d in data if not d['abstain'] and not d['is_impossible']]
-    fp = [d for d in data if d['abstain'] and not d['is_impossible']]
-    fn = [d for d in data if not d['abstain'] and d['is_impossible']]
+    available = result_columns(results_file)
+    flags = read_columns(results_file, ['consistency_score', 'is_impossible'] + (['abstain'] if 'abstain' in available else []))
+    scores = flags['consistency_score']
+    abstains = flags['abstain'] if 'abstain' in flags else scores > threshold
 
-    categories = {
-        'TP (Correct Abstain)': tp,
-        'TN (Correct Answer)': tn,
-        'FP (False Refusal)': fp,
-        'FN (Hallucination)': fn
-    }
+    total = len(scores)
+    for i, (abstain, impossible) in enumerate(zip(abstains, flags['is_impossible'])):
+        cat = names[(bool(abstain), bool(impossible))]
+        counts[cat] += 1
+        if len(categories[cat]) < n:
+            categories[cat].append(i)
+        else:
+            j = random.randrange(counts[cat])
+            if j < n:
+                categories[cat][j] = i
+
+    print(f"Loaded {total} results from {results_file}")
 
     print(f"\nStats:")
-    for cat, items in categories.items():
-        print(f"  {cat}: {len(items)}")
+    for cat, count in counts.items():
+        print(f"  {cat}: {count}")
 
     if mode == 'stats':
         return
 
     selected_cats = categories.keys() if mode == 'all' else [mode]
+    answer_field = 'greedy_answer' if 'greedy_answer' in available else 'generated_answer'
+    text_fields = [f for f in ['question', 'context', answer_field, 'sampled_answers'] if f in available]
+    text = read_columns(results_file, text_fields)
     
     for cat in selected_cats:
         if cat not in categories: continue
         
-        items = categories[cat]
-        if not items: continue
+        rows = categories[cat]
+        if not rows: continue
 
         print(f"\n=== Inspecting: {cat} ===")
-        sample = random.sample(items, min(n, len(items)))
-        
-        for i, item in enumerate(sample):
-            print(f"\n[{i+1}] Question: {item['question']}")
-            print(f"    Context Snippet: {item.get('context', 'N/A')[:50]}...")
-            print(f"    Greedy Answer: {item['generated_answer']}")
-            print(f"    Sampled Answers: {item['sampled_answers']}")
-            print(f"    Score: {item['consistency_score']:.4f}")
-            print(f"    Decision: {'Abstain' if item['abstain'] else 'Answer'}")
+        for i, row in enumerate(rows):
+            context = text['context'][row] if 'context' in text else 'N/A'
+            print(f"\n[{i+1}] Question: {text['question'][row]}")
+            print(f"    Context Snippet: {context[:50]}...")
+            print(f"    Greedy Answer: {text[answer_field][row]}")
+            print(f"    Sampled Answers: {text['sampled_answers'][row]}")
+            print(f"    Score: {scores[row]:.4f}")
+            print(f"    Decision: {'Abstain' if abstains[row] else 'Answer'}")
 
-if __name__ == "__main__":
+def main(argv=None):
     parser = argparse.ArgumentParser()
-    parser.add_argument("--file", type=str, default="results/experiment_results.json")
+    parser.add_argument("--file", type=str, default="results/experiment_results.jsonl")
     parser.add_argument("--mode", type=str, default="all", help="all, stats, or specific category like 'FN (Hallucination)'")
     parser.add_argument("--n", type=int, default=3, help="Number of examples to show per category")
-    args = parser.parse_args()
+    parser.add_argument("--threshold", type=float, default=0.5, help="Abstain above this score when rows have no `abstain` field")
+    args = parser.parse_args(argv)
 
-    inspect_results(args.file, args.mode, args.n)
+    inspect_results(args.file, args.mode, args.n, args.threshold)
+
+if __name__ == "__main__":
+    main()
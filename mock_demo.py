@@ -1,8 +1,14 @@
+import argparse
 from scoring_utils import calculate_inconsistency_score
+from selective_metrics import load_threshold
 
-def run_mock_demo():
+# What the system says instead of an answer when it abstains.
+ABSTAIN_OUTPUT = "I don't know"
+
+def run_mock_demo(threshold=0.5):
     print("=== Mock Experiment Demo ===")
-    print("Demonstrating the Abstention Logic without loading an LLM.\n")
+    print("Demonstrating the Abstention Logic without loading an LLM.")
+    print(f"Abstaining above an inconsistency score of {threshold:.4f}\n")
 
     # Example 1: Consistent / Confident Answer
     print("--- Example 1: Consistent (Confident) ---")
@@ -11,14 +17,14 @@ def run_mock_demo():
     samples_1 = ["Paris", "paris", "It is Paris"]
     
     score_1 = calculate_inconsistency_score(greedy_1, samples_1)
-    abstain_1 = score_1 > 0.5
+    abstain_1 = score_1 > threshold
     
     print(f"Question: {question_1}")
     print(f"Greedy Answer: {greedy_1}")
     print(f"Sampled Answers: {samples_1}")
     print(f"Inconsistency Score: {score_1:.4f}")
     print(f"Decision: {'ABSTAIN' if abstain_1 else 'ANSWER'}")
-    print(f"Final Output: {'I don't know' if abstain_1 else greedy_1}")
+    print(f"Final Output: {ABSTAIN_OUTPUT if abstain_1 else greedy_1}")
     print("\n")
 
     # Example 2: Inconsistent / Hallucinating Answer
@@ -28,14 +34,14 @@ def run_mock_demo():
     samples_2 = ["Jane Doe", "The Rock", "I don't know"]
     
     score_2 = calculate_inconsistency_score(greedy_2, samples_2)
-    abstain_2 = score_2 > 0.5
+    abstain_2 = score_2 > threshold
     
     print(f"Question: {question_2}")
     print(f"Greedy Answer: {greedy_2}")
     print(f"Sampled Answers: {samples_2}")
     print(f"Inconsistency Score: {score_2:.4f}")
     print(f"Decision: {'ABSTAIN' if abstain_2 else 'ANSWER'}")
-    print(f"Final Output: {'I don't know' if abstain_2 else greedy_2}")
+    print(f"Final Output: {ABSTAIN_OUTPUT if abstain_2 else greedy_2}")
     print("\n")
 
     # Example 3: Empty/Failed Generation
@@ -45,7 +51,7 @@ def run_mock_demo():
     samples_3 = ["42", "To be happy"]
     
     score_3 = calculate_inconsistency_score(greedy_3, samples_3)
-    abstain_3 = score_3 > 0.5
+    abstain_3 = score_3 > threshold
     
     print(f"Question: {question_3}")
     print(f"Greedy Answer: '{greedy_3}'")
@@ -53,5 +59,13 @@ def run_mock_demo():
     print(f"Decision: {'ABSTAIN' if abstain_3 else 'ANSWER'}")
     print("\n")
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Abstention decisions on hand-written answers (no model needed)")
+    parser.add_argument("--metrics_file", type=str, default=None,
+                        help="Use the recommended threshold from an analyze_results.py metrics.json")
+    parser.add_argument("--threshold", type=float, default=None, help="Abstention threshold (default 0.5)")
+    args = parser.parse_args(argv)
+    run_mock_demo(args.threshold if args.threshold is not None else load_threshold(args.metrics_file))
+
 if __name__ == "__main__":
-    run_mock_demo()
+    main()
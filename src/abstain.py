@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import argparse
+import importlib
+import importlib.util
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Subcommand -> (module, script path relative to the repo root, help). A
+# module is imported only when its subcommand runs, so short jobs never load
+# openai, datasets, matplotlib or sklearn; each module's main(argv) parses
+# the remaining arguments.
+COMMANDS = {
+    "run": ("experiment_runner", "src/experiment_runner.py", "Query a model and score its answers"),
+    "analyze": ("analyze_results", "src/analyze_results.py", "Metrics (and plots) for a results file; --k rescores"),
+    "plot": ("plot_results", "plot_results.py", "Risk-coverage curve of a results file"),
+    "inspect": ("inspect_results", "inspect_results.py", "Show example hallucinations, refusals and abstentions"),
+    "demo": ("mock_demo", "mock_demo.py", "Abstention decisions on hand-written answers"),
+    "serve": ("abstain_service", "src/abstain_service.py", "HTTP answer-or-abstain service"),
+}
+
+# Startup-time budget per subcommand in seconds: interpreter start, imports
+# and argument parsing, measured as `abstain.py <command> --help`.
+STARTUP_BUDGETS = {"run": 1.5, "analyze": 0.75, "plot": 2.0, "inspect": 0.5, "demo": 0.5, "serve": 1.5}
+
+
+def load_command(command):
+    """Import the module behind a subcommand (scripts at the repo root by path)."""
+    module_name, script, _ = COMMANDS[command]
+    if module_name in sys.modules or os.path.dirname(script):
+        return importlib.import_module(module_name)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_ROOT, script))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure_startup(command, repeat=3):
+    """Best-of-`repeat` wall time of `abstain.py <command> --help` in a fresh interpreter."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(__file__), os.environ.get("PYTHONPATH")])))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.abspath(__file__), command, "--help"], env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def check_startup(commands=None, repeat=3):
+    """Print each subcommand's startup time against its budget; returns True if all fit."""
+    ok = True
+    for command in commands or STARTUP_BUDGETS:
+        seconds = measure_startup(command, repeat)
+        budget = STARTUP_BUDGETS[command]
+        status = "ok" if seconds <= budget else "OVER BUDGET"
+        ok = ok and seconds <= budget
+        print(f"{command:>8}: {seconds * 1000:6.0f} ms (budget {budget * 1000:.0f} ms) {status}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="abstain", description="Abstention experiments: run, analyze, plot, inspect, demo, serve",
+        epilog="Run `abstain <command> --help` for a command's options."
+    )
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for command, (_, _, help_text) in COMMANDS.items():
+        # Options are parsed by the command's own module once it is loaded.
+        commands.add_parser(command, help=help_text, add_help=False)
+    startup = commands.add_parser("startup", help="Measure each command's startup time against its budget")
+    startup.add_argument("commands", nargs="*", help=f"Commands to time (default: all of {', '.join(STARTUP_BUDGETS)})")
+    startup.add_argument("--repeat", type=int, default=3)
+
+    args, rest = parser.parse_known_args(argv)
+    if args.command == "startup":
+        unknown = rest + [c for c in args.commands if c not in STARTUP_BUDGETS]
+        if unknown:
+            parser.error(f"unrecognized arguments: {' '.join(unknown)}")
+        sys.exit(0 if check_startup(args.commands, args.repeat) else 1)
+    sys.argv[0] = f"abstain {args.command}"
+    load_command(args.command).main(rest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from http import HTTPStatus
+from collections import OrderedDict
+import experiment_runner as runner
+from prompts import build_messages
+from rate_limiter import RateLimiter, RequestFailedError
+from scoring_utils import calculate_inconsistency_score, should_stop_sampling
+from selective_metrics import load_threshold
+from telemetry import LatencyHistogram
+
+# What the service says instead of an answer when it abstains.
+ABSTAIN_OUTPUT = "I don't know"
+GREEDY_TEMPERATURE = 0.0
+SAMPLED_TEMPERATURE = 0.7
+MAX_TOKENS = 100
+MAX_BODY_BYTES = 1 << 20
+
+
+def decision_key(model, k, context, question):
+    return hashlib.sha256(json.dumps([model, k, context, question]).encode("utf-8")).hexdigest()
+
+
+class DecisionCache:
+    """LRU of recent decisions, each served for at most `ttl` seconds."""
+
+    def __init__(self, max_entries=10000, ttl=600.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored, decision = entry
+        if self.clock() - stored > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return decision
+
+    def put(self, key, decision):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (self.clock(), decision)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class AbstainService:
+    """
+    Answer-or-abstain decisions for (context, question) pairs.
+
+    A decision runs the greedy call and `k` sampled calls concurrently
+    through the runner's request path (rate limiter, hedging, telemetry)
+    and abstains when the inconsistency score of the greedy answer against
+    the samples is above `threshold`. Samples are requested
+    `samples_per_call` at a time (n > 1), one per call by default so that
+    those which have arrived can be used when the deadline passes; larger
+    batches need fewer calls but arrive all at once.
+
+    - Requests identical to one still being decided wait for its result
+      instead of calling the model again (coalescing).
+    - Decisions made before the deadline are kept in a DecisionCache; a
+      deadline-cut decision is not cached, so the question is retried.
+    - At the deadline, pending calls are cancelled and the decision is made
+      from the samples that have arrived. Without a greedy answer or with
+      fewer than `min_samples` samples the service abstains.
+    - With `confidence` set, sampling stops as soon as the decision is
+      settled (see should_stop_sampling) instead of waiting for all k.
+
+    The persistent response cache is not consulted: repeated questions are
+    served from the decision cache, and fresh ones get fresh samples.
+    """
+
+    def __init__(self, model, k=5, threshold=0.5, deadline=2.0, min_samples=1, confidence=None,
+                 samples_per_call=1, cache=None, limiter=None):
+        self.model = model
+        self.k = k
+        self.samples_per_call = max(samples_per_call, 1)
+        self.threshold = threshold
+        self.deadline = deadline
+        self.min_samples = min_samples
+        self.confidence = confidence
+        self.cache = cache if cache is not None else DecisionCache()
+        self.limiter = limiter
+        self.in_flight = {}
+        self.latency = LatencyHistogram()
+        self.stats = {"requests": 0, "decisions": 0, "coalesced": 0, "cache_hits": 0, "deadline_hits": 0,
+                      "settled_early": 0, "abstained": 0, "failed_samples": 0, "failures": 0}
+
+    async def decide(self, context, question, deadline=None):
+        """
+        Decision for one question; `deadline` (seconds) overrides the
+        service default. Coalesced requests share the deadline of the
+        request that started the decision. Raises RequestFailedError when
+        the greedy call fails.
+        """
+        started = time.perf_counter()
+        self.stats["requests"] += 1
+        key = decision_key(self.model, self.k, context, question)
+        decision = self.cache.get(key)
+        if decision is not None:
+            self.stats["cache_hits"] += 1
+            source = "cache"
+        else:
+            task = self.in_flight.get(key)
+            if task is not None:
+                self.stats["coalesced"] += 1
+                source = "coalesced"
+            else:
+                source = "model"
+                task = asyncio.ensure_future(self._decide(key, context, question, self.deadline if deadline is None else deadline))
+                self.in_flight[key] = task
+                task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+            # Shielded: a client that disconnects does not cancel the
+            # decision for the others waiting on it.
+            try:
+                decision = await asyncio.shield(task)
+            except RequestFailedError:
+                self.stats["failures"] += 1
+                raise
+        self.latency.record(time.perf_counter() - started)
+        return dict(decision, source=source, latency_ms=(time.perf_counter() - started) * 1000)
+
+    async def _sample(self, messages, temperature, n=1):
+        choices, _ = await runner.request_choices_async(self.model, messages, temperature, MAX_TOKENS, n, self.limiter)
+        return choices
+
+    def _arrived(self, samples, count_failures=True):
+        """Sample texts of the calls that have completed successfully."""
+        answers = []
+        for task in samples:
+            if not task.done() or task.cancelled():
+                continue
+            if task.exception() is not None:
+                self.stats["failed_samples"] += int(count_failures)
+            else:
+                answers.extend(task.result())
+        return answers[:self.k]
+
+    async def _decide(self, key, context, question, deadline):
+        messages = build_messages({"context": context, "question": question})
+        greedy = asyncio.ensure_future(self._sample(messages, GREEDY_TEMPERATURE))
+        samples = [
+            asyncio.ensure_future(self._sample(messages, SAMPLED_TEMPERATURE, min(self.samples_per_call, self.k - i)))
+            for i in range(0, self.k, self.samples_per_call)
+        ]
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        pending = {greedy, *samples}
+        settled = False
+        try:
+            while pending and loop.time() < end:
+                _, pending = await asyncio.wait(pending, timeout=end - loop.time(), return_when=asyncio.FIRST_COMPLETED)
+                if greedy.done() and greedy.exception() is not None:
+                    self._arrived(samples)
+                    raise greedy.exception()
+                if self.confidence and greedy.done() and pending:
+                    arrived = self._arrived(samples, count_failures=False)
+                    if len(arrived) >= max(self.min_samples, 1) and should_stop_sampling(
+                            (greedy.result() or [""])[0], arrived, self.threshold, self.confidence):
+                        settled = True
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+
+        greedy_answer = (greedy.result() or [""])[0] if greedy.done() else None
+        answers = self._arrived(samples)
+        deadline_hit = bool(pending) and not settled
+        if greedy_answer is None or len(answers) < self.min_samples:
+            score = None
+            abstain = True
+        else:
+            score = calculate_inconsistency_score(greedy_answer, answers)
+            abstain = score > self.threshold
+        decision = {
+            "decision": "abstain" if abstain else "answer",
+            "output": ABSTAIN_OUTPUT if abstain else greedy_answer,
+            "greedy_answer": greedy_answer,
+            "score": score,
+            "threshold": self.threshold,
+            "samples_used": len(answers),
+            "samples_requested": self.k,
+            "deadline_hit": deadline_hit,
+        }
+        self.stats["decisions"] += 1
+        self.stats["abstained"] += int(abstain)
+        self.stats["deadline_hits"] += int(deadline_hit)
+        self.stats["settled_early"] += int(settled)
+        if not deadline_hit:
+            self.cache.put(key, decision)
+        return decision
+
+    def summary(self):
+        return dict(self.stats, in_flight=len(self.in_flight), cached=len(self.cache), latency=self.latency.summary(),
+                    calls=runner.telemetry.summary()["calls"])
+
+    async def route(self, method, path, body):
+        """(status, JSON payload) for one HTTP request."""
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "model": self.model, "k": self.k, "threshold": self.threshold}
+        if method == "GET" and path == "/stats":
+            return 200, self.summary()
+        if path != "/v1/decide":
+            return 404, {"error": {"message": "not found"}}
+        if method != "POST":
+            return 405, {"error": {"message": "use POST"}}
+        try:
+            request = json.loads(body or b"{}")
+            question = request["question"]
+            context = request.get("context", "")
+            deadline = float(request["deadline_ms"]) / 1000 if request.get("deadline_ms") is not None else None
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": {"message": f"expected JSON with 'question', 'context' and optional 'deadline_ms' ({e})"}}
+        try:
+            return 200, await self.decide(context, question, deadline)
+        except RequestFailedError as e:
+            return 502, {"error": {"message": str(e)}}
+
+    async def handle(self, reader, writer):
+        """One client connection: HTTP/1.1 requests with keep-alive."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    status, payload = 413, {"error": {"message": "request body too large"}}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.route(method, target.split("?", 1)[0].rstrip("/"), body)
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start(service, host="127.0.0.1", port=0):
+    """Start serving `service`; returns (asyncio server, base URL)."""
+    server = await asyncio.start_server(service.handle, host, port)
+    return server, f"http://{host}:{server.sockets[0].getsockname()[1]}"
+
+
+class ServiceClient:
+    """Minimal keep-alive JSON client for the service (one request at a time)."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        """Returns (status, decoded JSON body)."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            header = await self.reader.readline()
+            if header in (b"\r\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    async def decide(self, context, question, deadline_ms=None):
+        payload = {"context": context, "question": question}
+        if deadline_ms is not None:
+            payload["deadline_ms"] = deadline_ms
+        return await self.request("POST", "/v1/decide", payload)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader = self.writer = None
+
+
+async def serve_forever(service, host, port):
+    server, url = await start(service, host, port)
+    print(f"Answer-or-abstain service listening on {url}/v1/decide "
+          f"(model {service.model}, k={service.k}, threshold {service.threshold:.4f}, "
+          f"deadline {service.deadline * 1000:.0f} ms)", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP answer-or-abstain service: POST {context, question} to /v1/decide")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--model_name", type=str, default="meta-llama/llama-3-8b-instruct", help="OpenRouter model ID")
+    parser.add_argument("--base_url", type=str, default=None,
+                        help="OpenAI-compatible endpoint to use instead of OpenRouter (e.g. a mock_llm_server.py URL)")
+    parser.add_argument("--num_generations", type=int, default=5, help="Samples per decision")
+    parser.add_argument("--metrics_file", type=str, default="results/metrics.json",
+                        help="analyze_results.py metrics whose recommended threshold is used")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Abstain above this score (default: from --metrics_file, else 0.5)")
+    parser.add_argument("--deadline_ms", type=float, default=2000, help="Per-request deadline; requests may override it")
+    parser.add_argument("--samples_per_call", type=int, default=1,
+                        help="Samples requested per call (n); more means fewer calls but coarser deadline cut-offs")
+    parser.add_argument("--min_samples", type=int, default=1, help="Abstain when fewer samples arrive by the deadline")
+    parser.add_argument("--confidence", type=float, default=None,
+                        help="Stop sampling once the decision is settled with this posterior confidence")
+    parser.add_argument("--cache_size", type=int, default=10000, help="Recent decisions kept (0 disables)")
+    parser.add_argument("--cache_ttl", type=float, default=600.0, help="Seconds a cached decision is served")
+    parser.add_argument("--concurrency", type=int, default=32, help="Maximum number of API requests in flight")
+    parser.add_argument("--requests_per_second", type=float, default=None, help="Client-side request rate limit")
+    parser.add_argument("--tokens_per_minute", type=float, default=None, help="Client-side token rate limit")
+    parser.add_argument("--max_retries", type=int, default=2, help="Attempts per call (the deadline still applies)")
+    parser.add_argument("--hedge_percentile", type=float, default=None,
+                        help="Duplicate calls still running past this latency percentile (e.g. 95)")
+    parser.add_argument("--hedge_budget", type=float, default=0.05, help="Maximum fraction of calls that may be hedged")
+    args = parser.parse_args(argv)
+
+    threshold = args.threshold if args.threshold is not None else load_threshold(args.metrics_file)
+    if args.base_url:
+        runner.client, runner.async_client = runner.make_clients(args.base_url)
+    else:
+        try:
+            runner.ensure_clients()
+        except RuntimeError as e:
+            print(e)
+            return
+    if args.hedge_percentile:
+        from hedging import Hedger
+        runner.hedger = Hedger(args.hedge_percentile, args.hedge_budget)
+    limiter = RateLimiter(
+        requests_per_second=args.requests_per_second,
+        tokens_per_minute=args.tokens_per_minute,
+        max_concurrency=args.concurrency,
+        max_retries=args.max_retries
+    )
+    service = AbstainService(
+        args.model_name, k=args.num_generations, threshold=threshold, deadline=args.deadline_ms / 1000,
+        min_samples=args.min_samples, confidence=args.confidence, samples_per_call=args.samples_per_call,
+        cache=DecisionCache(args.cache_size, args.cache_ttl), limiter=limiter
+    )
+    try:
+        asyncio.run(serve_forever(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    print(f"Service: {service.summary()}")
+
+
+if __name__ == "__main__":
+    main()
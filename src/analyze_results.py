@@ -1,119 +1,117 @@
 import json
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.metrics import roc_auc_score, roc_curve, auc
+from scoring_utils import SCORERS, calculate_scores
+from results_io import read_columns, result_columns
+from selective_metrics import RiskCoverage
+from bootstrap import bootstrap_ci
+# Answer matching lives in a module without plotting/sklearn imports; it is
+# re-exported here, where callers have always imported it from.
+from answer_matching import normalize_text, normalized_golds, match, match_many, is_error
 
-def normalize_text(s):
-    """Lower text and remove punctuation, articles and extra whitespace."""
-    import string, re
-    def remove_articles(text):
-        return re.sub(r'\b(a|an|the)\b', ' ', text)
-    def white_space_fix(text):
-        return ' '.join(text.split())
-    def remove_punc(text):
-        exclude = set(string.punctuation)
-        return ''.join(ch for ch in text if ch not in exclude)
-    def lower(text):
-        return text.lower()
-    return white_space_fix(remove_articles(remove_punc(lower(s))))
+# Coverage levels at which selective accuracy is reported.
+TARGET_COVERAGES = (0.5, 0.8, 0.9)
 
-def match(prediction, ground_truths):
-    """Check if prediction matches any ground truth (Exact Match logic after normalization)."""
-    norm_pred = normalize_text(prediction)
-    for truth in ground_truths:
-        norm_truth = normalize_text(truth)
-        if norm_truth in norm_pred or norm_pred in norm_truth: # Relaxed inclusion
-             return True
-    return False
+def load_labels(path, extra_columns=()):
+    """
+    Read the scores, impossibility flags and error labels of a results file
+    plus `extra_columns`, and nothing else. Columnar files converted by
+    results_io carry a precomputed `is_error` column, so no answer text is
+    read; otherwise errors are labelled here with is_error's definition.
+    """
+    extra = [c for c in extra_columns if c not in ("consistency_score", "is_impossible", "is_error")]
+    if "is_error" in result_columns(path):
+        return read_columns(path, ["consistency_score", "is_impossible", "is_error"] + extra)
+
+    text = [c for c in ("greedy_answer", "gold_answers") if c not in extra]
+    data = read_columns(path, ["consistency_score", "is_impossible"] + extra + text)
+    data["is_error"] = np.fromiter(
+        (impossible or not match(greedy, golds) for impossible, greedy, golds
+         in zip(data["is_impossible"], data["greedy_answer"], data["gold_answers"])),
+        dtype=bool, count=len(data["is_impossible"])
+    )
+    return data
 
 def analyze(args):
-    with open(args.input_file, 'r') as f:
-        data = json.load(f)
-        
-    # Lists to store metrics
-    consistency_scores = []
-    is_hallucination = [] # 1 if Wrong or Impossible, 0 if Correct
-    
-    answerable_total = 0
-    answerable_correct = 0
-    impossible_total = 0
-    
-    for item in data:
-        score = item['consistency_score']
-        greedy = item['greedy_answer']
-        is_imp = item['is_impossible']
-        golds = item['gold_answers']
-        
-        consistency_scores.append(score)
-        
-        if is_imp:
-            # Impossible question.
-            # Since we forced the model to answer, ANY answer is technically a "hallucination" 
-            # or unsupported by context.
-            is_hallucination.append(1)
-            impossible_total += 1
-        else:
-            # Answerable question.
-            # Check correctness
-            if match(greedy, golds):
-                is_hallucination.append(0) # Correct
-                answerable_correct += 1
-            else:
-                is_hallucination.append(1) # Wrong
-            answerable_total += 1
+    rescore = args.k is not None or args.scorer != "exact"
+    data = load_labels(args.input_file, ["greedy_answer", "sampled_answers"] if rescore else [])
+    scores = np.asarray(data["consistency_score"], dtype=float)
+    if rescore:
+        # Rescore every row (from its first k samples) in one batch
+        samples = [s[:args.k] for s in data["sampled_answers"]] if args.k is not None else list(data["sampled_answers"])
+        store = None
+        if args.scorer != "exact":
+            from minhash_scoring import MinHasher, SignatureStore
+            store = (SignatureStore.load(args.signature_cache, args.num_perm) if args.signature_cache
+                     else SignatureStore(MinHasher(args.num_perm)))
+            print(f"Scorer: {args.scorer} ({args.num_perm} permutations)")
+        scores = calculate_scores(list(data["greedy_answer"]), samples, args.scorer, store)
+        if store is not None and args.signature_cache:
+            store.save(args.signature_cache)
+    labels = data["is_error"].astype(int)  # 1 if Wrong or Impossible, 0 if Correct
+    impossible = data["is_impossible"].astype(bool)
 
-    # Convert to numpy
-    scores = np.array(consistency_scores)
-    labels = np.array(is_hallucination)
+    answerable_total = int(np.sum(~impossible))
+    answerable_correct = int(np.sum(~impossible & (labels == 0)))
+    impossible_total = int(np.sum(impossible))
     
     # 1. AUC-ROC for detecting Hallucinations/Errors
-    if len(np.unique(labels)) > 1:
-        roc_auc = roc_auc_score(labels, scores)
-    else:
-        roc_auc = 0.5
-        
-    print(f"Total Samples: {len(data)}")
+    rc = RiskCoverage(scores, labels)
+    roc_auc = rc.roc_auc if len(np.unique(labels)) > 1 else 0.5
+
+    print(f"Total Samples: {len(labels)}")
     print(f"Answerable: {answerable_total} (Acc: {answerable_correct/answerable_total if answerable_total else 0:.2%})")
     print(f"Impossible: {impossible_total}")
     print(f"Hallucination/Error Rate (Base): {sum(labels)/len(labels):.2%}")
     print(f"ROC-AUC for Uncertainty Score: {roc_auc:.4f}")
     
     # 2. Risk-Coverage Curve
-    # Sort by score (ascending: low score = confident)
-    # We want to abstain when score is HIGH.
-    # So we sort by score ascending. The first k samples are the ones we KEEP (answer).
-    
-    sorted_indices = np.argsort(scores) # Low to high
-    sorted_labels = labels[sorted_indices] # 0=Correct, 1=Error
-    
-    risks = []
-    coverages = []
-    
-    n = len(labels)
-    current_errors = 0
-    
-    # Iterate from keeping 1 sample to keeping all
-    # Actually, efficient way: cumulative sum
-    cum_errors = np.cumsum(sorted_labels)
-    
-    for k in range(1, n + 1):
-        # Keeping k samples (lowest uncertainty)
-        coverage = k / n
-        error_count = cum_errors[k-1]
-        risk = error_count / k
-        
-        coverages.append(coverage)
-        risks.append(risk)
-        
-    # Calculate AURC (Area Under Risk-Coverage)
-    # Ideally Risk decreases as Coverage decreases.
-    aurc = auc(coverages, risks) # Note: this standard calculation might vary, usually we want low area under Risk vs Coverage?
-    # Actually AURC usually defined as Area under the Risk(Coverage) curve.
-    
+    # We abstain when the score is HIGH: answering every question with
+    # score <= t gives one point per distinct score, tied scores together.
+    coverages, risks, aurc = rc.coverage, rc.risk, rc.aurc
     print(f"AURC: {aurc:.4f}")
-    
-    # Save Plot
+
+    # 3. Bootstrap confidence intervals
+    ci = None
+    if args.bootstrap > 0 and len(labels) > 1:
+        ci = bootstrap_ci(scores, labels, num_resamples=args.bootstrap, workers=args.bootstrap_workers)
+        print(f"ROC-AUC 95% CI: [{ci['roc_auc'][0]:.4f}, {ci['roc_auc'][1]:.4f}] ({args.bootstrap} resamples)")
+        print(f"AURC 95% CI: [{ci['aurc'][0]:.4f}, {ci['aurc'][1]:.4f}]")
+
+    _, achieved, _, selective_acc = rc.at_coverages(TARGET_COVERAGES)
+    for target, cov, acc in zip(TARGET_COVERAGES, achieved, selective_acc):
+        print(f"Selective Accuracy @ {target:.0%} coverage: {acc:.2%} (actual coverage {cov:.2%})")
+
+    recommended = rc.recommended_threshold(args.target_risk)
+    if recommended["threshold"] is not None:
+        print(f"Recommended threshold: abstain above {recommended['threshold']:.4f} "
+              f"(coverage {recommended['coverage']:.2%}, risk {recommended['risk']:.2%}, target {args.target_risk:.2%}"
+              f"{'' if recommended['meets_target'] else ', not reached'})")
+
+    if args.output_plot:
+        save_plot(scores, labels, coverages, risks, aurc, args.output_plot)
+
+    # Save metrics
+    metrics = {
+        "total_samples": len(labels),
+        "base_error_rate": float(sum(labels)/len(labels)),
+        "roc_auc": float(roc_auc),
+        "aurc": float(aurc),
+        "answerable_acc": float(answerable_correct/answerable_total) if answerable_total else 0,
+        "selective_accuracy": {f"{target:.2f}": float(acc) for target, acc in zip(TARGET_COVERAGES, selective_acc)},
+        "recommended_threshold": recommended,
+        "scorer": args.scorer,
+    }
+    if ci is not None:
+        metrics["roc_auc_ci"] = list(ci["roc_auc"])
+        metrics["aurc_ci"] = list(ci["aurc"])
+    with open("results/metrics.json", "w") as f:
+        json.dump(metrics, f, indent=2)
+
+def save_plot(scores, labels, coverages, risks, aurc, output_plot):
+    """Risk-coverage curve and score histograms side by side."""
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(10, 5))
     
     # Subplot 1: Risk-Coverage
@@ -134,23 +132,25 @@ def analyze(args):
     plt.legend()
     
     plt.tight_layout()
-    plt.savefig(args.output_plot)
-    print(f"Plot saved to {args.output_plot}")
-    
-    # Save metrics
-    metrics = {
-        "total_samples": len(data),
-        "base_error_rate": float(sum(labels)/len(labels)),
-        "roc_auc": float(roc_auc),
-        "aurc": float(aurc),
-        "answerable_acc": float(answerable_correct/answerable_total) if answerable_total else 0
-    }
-    with open("results/metrics.json", "w") as f:
-        json.dump(metrics, f, indent=2)
+    plt.savefig(output_plot)
+    print(f"Plot saved to {output_plot}")
 
-if __name__ == "__main__":
+def main(argv=None):
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input_file", type=str, default="results/experiment_results_100.json")
-    parser.add_argument("--output_plot", type=str, default="results/analysis_plot.png")
-    args = parser.parse_args()
-    analyze(args)
\ No newline at end of file
+    parser.add_argument("--input_file", type=str, default="results/experiment_results_100.jsonl",
+                        help="JSONL results, or a .arrow/.parquet file converted with results_io.py")
+    parser.add_argument("--output_plot", type=str, default="results/analysis_plot.png",
+                        help="Where to save the plots; pass '' for metrics only (skips importing matplotlib)")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="Bootstrap resamples for confidence intervals (0 disables)")
+    parser.add_argument("--bootstrap_workers", type=int, default=None, help="Processes for bootstrap chunks")
+    parser.add_argument("--k", type=int, default=None, help="Score with only the first k sampled answers")
+    parser.add_argument("--scorer", choices=SCORERS, default="exact",
+                        help="Rescore with the exact token overlap or a MinHash estimate (greedy vs samples, all pairs, or clusters)")
+    parser.add_argument("--num_perm", type=int, default=128, help="MinHash permutations per signature")
+    parser.add_argument("--signature_cache", type=str, default=None,
+                        help="Reuse answer signatures from (and save them to) this .npz file")
+    parser.add_argument("--target_risk", type=float, default=0.1, help="Risk the recommended threshold must stay within")
+    analyze(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import re
+import string
+import functools
+import numpy as np
+
+# Compiled once: punctuation deletion table and the SQuAD article pattern.
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+ARTICLES_RE = re.compile(r'\b(a|an|the)\b')
+
+# Distinct gold answer lists whose normalized form is kept.
+GOLD_CACHE_SIZE = 65536
+
+def normalize_text(s):
+    """Lower text and remove punctuation, articles and extra whitespace."""
+    return ' '.join(ARTICLES_RE.sub(' ', s.lower().translate(PUNCTUATION_TABLE)).split())
+
+@functools.lru_cache(maxsize=GOLD_CACHE_SIZE)
+def _normalized_golds(ground_truths):
+    golds = tuple(normalize_text(truth) for truth in ground_truths)
+    return golds, '\n'.join(golds)
+
+def normalized_golds(ground_truths):
+    """
+    Normalized gold answers, cached (LRU) by the gold answers themselves.
+    Returns (golds, joined) where `joined` holds every gold separated by
+    newlines, which normalized text never contains.
+    """
+    return _normalized_golds(tuple(ground_truths))
+
+def match(prediction, ground_truths):
+    """Check if prediction matches any ground truth (Exact Match logic after normalization)."""
+    golds, joined = normalized_golds(ground_truths)
+    if not golds:
+        return False
+    norm_pred = normalize_text(prediction)
+    # Relaxed inclusion: prediction inside any gold is one scan of the joined
+    # golds; any gold inside the prediction is checked per gold.
+    return norm_pred in joined or any(gold in norm_pred for gold in golds)
+
+def match_many(predictions, gold_lists):
+    """match() over a full result set; returns a boolean array."""
+    return np.fromiter(
+        (match(p, g) for p, g in zip(predictions, gold_lists)),
+        dtype=bool, count=len(predictions)
+    )
+
+def is_error(item):
+    """
+    Error definition shared by every analysis script: answering an impossible
+    question (we forced the model to answer, so ANY answer is unsupported by
+    the context), or a wrong answer to an answerable one.
+    """
+    if item['is_impossible']:
+        return True
+    return not match(item['greedy_answer'], item['gold_answers'])
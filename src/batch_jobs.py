@@ -0,0 +1,247 @@
+import os
+import io
+import json
+import time
+import hashlib
+import experiment_runner as runner
+from prompts import build_messages
+from response_cache import request_key
+from sample_pool import SamplePool
+
+# A batch job is over once it reaches one of these states.
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+# Final states of a job that did not run its requests; never reused.
+FAILED_STATUSES = ("failed", "expired", "cancelled")
+ENDPOINT = "/v1/chat/completions"
+
+GREEDY_TEMPERATURE = 0.0
+SAMPLED_TEMPERATURE = 0.7
+MAX_TOKENS = 100
+
+
+def greedy_id(example_id):
+    return f"{example_id}/greedy"
+
+
+def samples_id(example_id, slots):
+    """Custom id of a request filling sample slots `slots` (one choice each)."""
+    return f"{example_id}/samples/{','.join(str(j) for j in slots)}"
+
+
+def parse_custom_id(custom_id):
+    """custom id -> (example id, sample slots); slots are None for the greedy request."""
+    head, kind = custom_id.rsplit("/", 1)
+    if kind == "greedy":
+        return head, None
+    example_id, _ = head.rsplit("/", 1)
+    return example_id, [int(j) for j in kind.split(",")]
+
+
+def batch_line(custom_id, model, messages, temperature, n=1):
+    body = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": MAX_TOKENS}
+    if n > 1:
+        body["n"] = n
+    return {"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body}
+
+
+class BatchState:
+    """
+    Answers gathered so far for every example of a batch run, and the
+    requests still needed to complete them.
+
+    Greedy answers and samples already in the response cache are taken from
+    there, so only missing requests are ever submitted; every answer that
+    comes back is written to the cache and the sample pool as well.
+    """
+
+    def __init__(self, eval_data, model, num_samples, native_n=True):
+        self.eval_data = eval_data
+        self.model = model
+        self.num_samples = num_samples
+        self.pool = SamplePool(runner.response_cache)
+        self.position = {example_id: i for i, example_id in enumerate(eval_data["id"])}
+        self.greedy = {}
+        self.samples = {}
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        # Largest n the model is known to honour; lowered when fewer choices come back.
+        known = runner.response_cache.get_max_n(model) if runner.response_cache is not None else None
+        self.max_n = (known or num_samples) if native_n else 1
+
+        cached = 0
+        for example in eval_data:
+            messages = build_messages(example)
+            _, greedy = runner.cache_lookup(model, messages, GREEDY_TEMPERATURE, MAX_TOKENS, 1, None)
+            if greedy is not None:
+                self.greedy[example["id"]] = greedy[0]
+            self.samples[example["id"]] = self.pool.lookup(
+                model, messages, SAMPLED_TEMPERATURE, MAX_TOKENS, num_samples)
+            # cache_lookup has already counted the greedy hit.
+            cached += sum(s is not None for s in self.samples[example["id"]])
+        if cached:
+            runner.telemetry.record_cache_hits("batch", cached)
+
+    def messages(self, example_id):
+        return build_messages(self.eval_data[self.position[example_id]])
+
+    def pending_requests(self):
+        """Batch lines for every missing greedy answer and sample slot."""
+        for example in self.eval_data:
+            example_id = example["id"]
+            messages = None
+            if example_id not in self.greedy:
+                messages = build_messages(example)
+                yield batch_line(greedy_id(example_id), self.model, messages, GREEDY_TEMPERATURE)
+            missing = [j for j, sample in enumerate(self.samples[example_id]) if sample is None]
+            for start in range(0, len(missing), self.max_n):
+                slots = missing[start:start + self.max_n]
+                messages = messages or build_messages(example)
+                yield batch_line(samples_id(example_id, slots), self.model, messages, SAMPLED_TEMPERATURE, len(slots))
+
+    def apply(self, custom_id, body):
+        """Store the answers of one successful batch response."""
+        example_id, slots = parse_custom_id(custom_id)
+        choices = [choice["message"]["content"] for choice in body.get("choices", [])]
+        usage = {k: (body.get("usage") or {}).get(k) or 0 for k in self.usage}
+        for k in self.usage:
+            self.usage[k] += usage[k]
+        if not choices:
+            return
+        messages = self.messages(example_id)
+        if slots is None:
+            self.greedy[example_id] = choices[0]
+            if runner.response_cache is not None:
+                key = request_key(self.model, messages, GREEDY_TEMPERATURE, MAX_TOKENS, 1, None)
+                runner.response_cache.put(key, self.model, choices[:1], usage)
+            return
+        if len(slots) > 1 and len(choices) < len(slots):
+            # The model ignored or capped n; later rounds ask for fewer per request.
+            self.max_n = min(self.max_n, len(choices))
+            runner.lower_capacity(self.model, len(choices))
+        for i, (j, text) in enumerate(zip(slots, choices)):
+            self.samples[example_id][j] = text
+            self.pool.store(self.model, messages, SAMPLED_TEMPERATURE, MAX_TOKENS, j, text, usage if i == 0 else None)
+
+    def complete(self, example_id):
+        return example_id in self.greedy and all(s is not None for s in self.samples[example_id])
+
+
+def submit(client, lines, path, state_path):
+    """
+    Write `lines` to a batch input file and start a job for it. A job whose
+    input hash is recorded in `state_path` is reused instead, so a rerun
+    after a crash picks up jobs that are already running or done; a job
+    that ended failed, expired or cancelled is dropped and submitted again.
+    """
+    data = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    jobs = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            jobs = json.load(f)
+    if digest in jobs:
+        status = client.batches.retrieve(jobs[digest]).status
+        if status not in FAILED_STATUSES:
+            print(f"Reusing batch job {jobs[digest]} ({status}) for {path}")
+            return jobs[digest]
+        print(f"Batch job {jobs[digest]} for {path} ended as {status}; submitting it again")
+        del jobs[digest]
+
+    with open(path, "wb") as f:
+        f.write(data)
+    upload = client.files.create(file=(os.path.basename(path), io.BytesIO(data)), purpose="batch")
+    batch = client.batches.create(input_file_id=upload.id, endpoint=ENDPOINT, completion_window="24h")
+    jobs[digest] = batch.id
+    with open(state_path + ".tmp", "w") as f:
+        json.dump(jobs, f, indent=2)
+    os.replace(state_path + ".tmp", state_path)
+    print(f"Submitted batch job {batch.id}: {len(lines)} requests from {path}")
+    return batch.id
+
+
+def wait_for(client, job_ids, poll_seconds=30.0):
+    """Poll jobs until every one is in a final state; returns their final Batch objects."""
+    done = {}
+    while len(done) < len(job_ids):
+        for job_id in job_ids:
+            if job_id in done:
+                continue
+            batch = client.batches.retrieve(job_id)
+            counts = batch.request_counts
+            progress = f"{counts.completed + counts.failed}/{counts.total}" if counts else "?"
+            print(f"Batch {job_id}: {batch.status} ({progress} requests)", flush=True)
+            if batch.status in FINAL_STATUSES:
+                done[job_id] = batch
+        if len(done) < len(job_ids):
+            time.sleep(poll_seconds)
+    return [done[job_id] for job_id in job_ids]
+
+
+def output_lines(client, batch):
+    """Stream the parsed lines of a finished job's output and error files."""
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).iter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+
+def run_batch(eval_data, args, writer, stem):
+    """
+    Answer every example through batch jobs instead of interactive calls.
+
+    Each round compiles the missing greedy and sampled requests (n > 1 per
+    example unless --no_native_n) into JSONL files of stable custom ids,
+    submits them, polls until the jobs finish and streams their output
+    back. Failed requests, and slots a model left unfilled by returning
+    fewer choices than n, are requested again in the next round, up to
+    `args.batch_rounds`. Rows are then scored and written in dataset order
+    like a normal run. Input files go to `<stem>_batch<round>_<i>.jsonl` and
+    submitted job ids to `<stem>_batches.json`. Returns (written, failures).
+    """
+    runner.ensure_clients()
+    client = runner.client
+    num_samples = max([args.num_generations] + (args.k_values or []))
+    state = BatchState(eval_data, args.model_name, num_samples, native_n=not args.no_native_n)
+    state_path = f"{stem}_batches.json"
+    errors = {}
+    stats = {"jobs": 0, "requests": 0, "failed_requests": 0, "rounds": 0}
+    started = time.perf_counter()
+
+    for round_number in range(1, args.batch_rounds + 1):
+        lines = list(state.pending_requests())
+        if not lines:
+            break
+        stats["rounds"] = round_number
+        chunks = [lines[i:i + args.batch_max_requests] for i in range(0, len(lines), args.batch_max_requests)]
+        job_ids = [submit(client, chunk, f"{stem}_batch{round_number}_{i}.jsonl", state_path)
+                   for i, chunk in enumerate(chunks)]
+        stats["jobs"] += len(job_ids)
+        stats["requests"] += len(lines)
+        for batch in wait_for(client, job_ids, args.batch_poll_seconds):
+            if batch.status != "completed":
+                print(f"Batch {batch.id} ended as {batch.status}; its missing requests go to the next round")
+            for line in output_lines(client, batch):
+                response = line.get("response") or {}
+                if response.get("status_code") == 200:
+                    state.apply(line["custom_id"], response["body"])
+                else:
+                    stats["failed_requests"] += 1
+                    error = line.get("error") or (response.get("body") or {}).get("error") or {}
+                    errors[parse_custom_id(line["custom_id"])[0]] = error.get("message", f"HTTP {response.get('status_code')}")
+
+    written = 0
+    failures = []
+    for example in eval_data:
+        example_id = example["id"]
+        if state.complete(example_id):
+            row = runner.build_row(example, state.greedy[example_id], state.samples[example_id], args)
+            written += runner.write_rows(writer, [row], args)
+        else:
+            error = errors.get(example_id, "no response")
+            failures.append({"id": example_id, "error": f"batch requests unanswered after {stats['rounds']} rounds: {error}"})
+
+    stats.update(state.usage, elapsed_seconds=time.perf_counter() - started)
+    runner.telemetry.annotate("batch", stats)
+    print(f"Batch mode: {stats}")
+    return written, failures
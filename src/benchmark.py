@@ -0,0 +1,443 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import importlib.util
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+WORDS = ("paris france london city river year century king queen war battle army church music art team "
+         "game school state law court company market bank water island mountain north south east west").split()
+
+
+def parse_sizes(text):
+    """'1k,100k,1M' -> [1000, 100000, 1000000]."""
+    sizes = []
+    for part in text.split(","):
+        part = part.strip().lower()
+        scale = SIZE_SUFFIXES.get(part[-1:], 1)
+        sizes.append(int(float(part[:-1] if scale > 1 else part) * scale))
+    return sizes
+
+
+def _phrase(rng, low=1, high=4):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def synthetic_results(n, k=5, seed=0):
+    """
+    Result rows shaped like the runner's output. About a third of the
+    questions are unanswerable; sampled answers drift from the greedy
+    answer more often for those, so scores carry signal.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        impossible = rng.random() < 1 / 3
+        gold = [] if impossible else [_phrase(rng) for _ in range(rng.randint(1, 3))]
+        greedy = gold[0] if gold and rng.random() < 0.7 else _phrase(rng)
+        drift = 0.6 if impossible else 0.2
+        sampled = [_phrase(rng) if rng.random() < drift else greedy for _ in range(k)]
+        rows.append({
+            "id": f"q{i:07d}",
+            "question": f"What is {_phrase(rng)}?",
+            "is_impossible": impossible,
+            "greedy_answer": greedy,
+            "sampled_answers": sampled,
+            "consistency_score": 0.0,
+            "gold_answers": gold,
+        })
+    return rows
+
+
+def synthetic_long_answers(n, k=20, length=60, seed=0):
+    """
+    Long-form greedy answers and k samples per question (TruthfulQA-style
+    generations): samples rewrite some of the greedy answer's words, and
+    rewrite more of them for about a third of the questions.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"{w}{i}" for w in WORDS for i in range(50)]
+    greedy_answers, sampled_answers = [], []
+    for _ in range(n):
+        greedy = [rng.choice(vocabulary) for _ in range(length)]
+        drift = 0.6 if rng.random() < 1 / 3 else 0.15
+        greedy_answers.append(" ".join(greedy))
+        sampled_answers.append([" ".join(rng.choice(vocabulary) if rng.random() < drift else w for w in greedy)
+                                for _ in range(k)])
+    return greedy_answers, sampled_answers
+
+
+def synthetic_examples(n, per_context=5, seed=0):
+    """SQuAD-style examples (context, question, answers) for runner benchmarks."""
+    rng = random.Random(seed)
+    examples = []
+    for i in range(n):
+        c = i // per_context
+        year = 1700 + rng.randint(0, 300)
+        context = (f"The town of Town{c} was founded in {year} by Person{c}. "
+                   f"It has {rng.randint(1, 90)}000 residents and a river called River{c}.")
+        if i % 3 == 0:
+            question, answers = f"Who discovered gold in Town{c}?", []
+        else:
+            question, answers = f"When was Town{c} founded?", [str(year)]
+        examples.append({
+            "id": f"q{i:07d}", "title": f"Town{c}", "context": context, "question": question,
+            "answers": {"text": answers, "answer_start": [context.find(a) for a in answers]},
+        })
+    return examples
+
+
+def _write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def _load_plot_results():
+    spec = importlib.util.spec_from_file_location("plot_results", os.path.join(REPO_ROOT, "plot_results.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Each case: (name, maximum rows, setup(rows, path) -> callable). Cases are
+# skipped for sizes above their maximum (e.g. one fsync per row does not
+# scale to a million-row smoke run).
+
+def _scoring_scalar(rows, path):
+    from scoring_utils import calculate_inconsistency_score
+    return lambda: [calculate_inconsistency_score(r["greedy_answer"], r["sampled_answers"]) for r in rows]
+
+
+def _scoring_batch(rows, path):
+    from scoring_utils import calculate_inconsistency_scores
+    greedy = [r["greedy_answer"] for r in rows]
+    sampled = [r["sampled_answers"] for r in rows]
+    return lambda: calculate_inconsistency_scores(greedy, sampled)
+
+
+def _minhash_case(scorer, greedy, sampled):
+    """
+    Timed run of a MinHash scorer with every answer's signature already in
+    the store, as when rescoring from a --signature_cache; scorer
+    "signatures" times building those signatures from scratch instead.
+    """
+    from scoring_utils import calculate_scores
+    from minhash_scoring import SignatureStore
+    answers = [a for g, samples in zip(greedy, sampled) for a in [g, *samples]]
+    if scorer == "signatures":
+        return lambda: SignatureStore().rows(answers)
+    store = SignatureStore()
+    store.rows(answers)
+    return lambda: calculate_scores(greedy, sampled, scorer, store)
+
+
+def _scoring_minhash(scorer):
+    """Setup for a MinHash scorer (or "signatures") on the synthetic rows."""
+    def setup(rows, path):
+        return _minhash_case(scorer, [r["greedy_answer"] for r in rows], [r["sampled_answers"] for r in rows])
+    return setup
+
+
+def _scoring_long_form(scorer):
+    """Setup scoring long-form answers (k=20, 60 words) with `scorer`; `rows` only sets the count."""
+    def setup(rows, path):
+        from scoring_utils import calculate_scores
+        from minhash_scoring import exact_pairwise_scores
+        greedy, sampled = synthetic_long_answers(len(rows))
+        if scorer == "exact_pairwise":
+            return lambda: exact_pairwise_scores(greedy, sampled)
+        if scorer == "exact":
+            return lambda: calculate_scores(greedy, sampled)
+        return _minhash_case(scorer, greedy, sampled)
+    return setup
+
+
+def _labeling_match(rows, path):
+    import answer_matching
+
+    def run():
+        answer_matching._normalized_golds.cache_clear()
+        return [answer_matching.is_error(r) for r in rows]
+    return run
+
+
+def _metrics_risk_coverage(rows, path):
+    from selective_metrics import RiskCoverage
+    from analyze_results import TARGET_COVERAGES
+    from scoring_utils import calculate_inconsistency_scores
+    from answer_matching import is_error
+    scores = calculate_inconsistency_scores([r["greedy_answer"] for r in rows], [r["sampled_answers"] for r in rows])
+    errors = [is_error(r) for r in rows]
+
+    def run():
+        curve = RiskCoverage(scores, errors)
+        return curve.aurc, curve.at_coverages(TARGET_COVERAGES)
+    return run
+
+
+def _metrics_bootstrap(rows, path):
+    from bootstrap import bootstrap_ci
+    from answer_matching import is_error
+    rng = random.Random(1)
+    scores = [round(rng.random(), 2) for _ in rows]
+    errors = [is_error(r) for r in rows]
+    return lambda: bootstrap_ci(scores, errors, num_resamples=200)
+
+
+def _plot(rows, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    plot_results = _load_plot_results()
+    _write_jsonl(path, rows)
+    image = path + ".png"
+
+    def run():
+        plot_results.plot_results(path, image)
+        plt.close("all")
+    return run
+
+
+def _io_save(rows, path):
+    from results_io import ResultWriter
+
+    def run():
+        with ResultWriter(path) as writer:
+            for row in rows:
+                writer.write(row)
+    return run
+
+
+def _io_load(rows, path):
+    from results_io import iter_results
+    _write_jsonl(path, rows)
+    return lambda: sum(1 for _ in iter_results(path))
+
+
+def _io_load_columnar(rows, path):
+    from results_io import convert_results
+    from analyze_results import load_labels
+    _write_jsonl(path, rows)
+    arrow_path = path + ".arrow"
+    convert_results(path, arrow_path)
+    return lambda: load_labels(arrow_path)
+
+
+def start_mock_server(latency="constant:0", **options):
+    """Run mock_llm_server.py in a subprocess. Returns (process, base_url)."""
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_llm_server.py"),
+               "--port", "0", "--latency", latency]
+    for name, value in options.items():
+        command += [f"--{name}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    return process, line.strip().rsplit(" ", 1)[-1]
+
+
+def _runner(rows, path, concurrency=32, num_generations=5):
+    import experiment_runner
+    from rate_limiter import RateLimiter
+    from results_io import ResultWriter
+    examples = synthetic_examples(len(rows))
+    args = SimpleNamespace(
+        model_name="mock", num_generations=num_generations, k_values=None, adaptive=False,
+        group_by_context=False, group_size=5, concurrency=concurrency
+    )
+
+    async def run_async(limiter, writer):
+        try:
+            return await experiment_runner.run_examples(examples, args, limiter, writer)
+        finally:
+            # Close connections on this event loop; each repeat gets a new one.
+            await experiment_runner.async_client.close()
+
+    def run():
+        process, base_url = start_mock_server()
+        try:
+            experiment_runner.client, experiment_runner.async_client = experiment_runner.make_clients(base_url)
+            experiment_runner.response_cache = None
+            limiter = RateLimiter(max_concurrency=concurrency)
+            with ResultWriter(path) as writer:
+                written, failures = asyncio.run(run_async(limiter, writer))
+            return written, limiter.stats["requests"]
+        finally:
+            process.terminate()
+            process.wait()
+    return run
+
+
+def _service(rows, path, clients=32, num_generations=5):
+    """Answer-or-abstain service over HTTP, every question asked twice at once."""
+    import experiment_runner
+    from rate_limiter import RateLimiter
+    from abstain_service import AbstainService, ServiceClient, start
+    examples = synthetic_examples(len(rows))
+    requests = [(e["context"], e["question"]) for e in examples for _ in range(2)]
+
+    async def run_async():
+        service = AbstainService("mock", k=num_generations, deadline=30.0, limiter=RateLimiter(max_concurrency=64))
+        server, url = await start(service)
+        port = int(url.rsplit(":", 1)[1])
+
+        async def client(chunk):
+            connection = ServiceClient("127.0.0.1", port)
+            try:
+                for context, question in chunk:
+                    await connection.decide(context, question)
+            finally:
+                await connection.close()
+        try:
+            await asyncio.gather(*[client(requests[i::clients]) for i in range(clients)])
+        finally:
+            server.close()
+            await server.wait_closed()
+            await experiment_runner.async_client.close()
+        return service.summary()
+
+    def run():
+        process, base_url = start_mock_server()
+        try:
+            experiment_runner.client, experiment_runner.async_client = experiment_runner.make_clients(base_url)
+            experiment_runner.hedger = None
+            return asyncio.run(run_async())
+        finally:
+            process.terminate()
+            process.wait()
+    return run
+
+
+CASES = [
+    ("scoring.scalar", 1_000_000, _scoring_scalar),
+    ("scoring.batch", 1_000_000, _scoring_batch),
+    ("minhash.signatures", 1_000_000, _scoring_minhash("signatures")),
+    ("minhash.scores", 1_000_000, _scoring_minhash("minhash")),
+    ("minhash.pairwise", 100_000, _scoring_minhash("minhash_pairwise")),
+    ("minhash.cluster", 100_000, _scoring_minhash("minhash_cluster")),
+    ("minhash.long_form.exact", 1_000, _scoring_long_form("exact")),
+    ("minhash.long_form.exact_pairwise", 1_000, _scoring_long_form("exact_pairwise")),
+    ("minhash.long_form.signatures", 1_000, _scoring_long_form("signatures")),
+    ("minhash.long_form.minhash", 1_000, _scoring_long_form("minhash")),
+    ("minhash.long_form.minhash_pairwise", 1_000, _scoring_long_form("minhash_pairwise")),
+    ("minhash.long_form.minhash_cluster", 1_000, _scoring_long_form("minhash_cluster")),
+    ("labeling.match", 1_000_000, _labeling_match),
+    ("metrics.risk_coverage", 1_000_000, _metrics_risk_coverage),
+    ("metrics.bootstrap", 100_000, _metrics_bootstrap),
+    ("plot.plot_results", 1_000_000, _plot),
+    ("io.save", 100_000, _io_save),
+    ("io.load", 1_000_000, _io_load),
+    ("io.load_columnar", 1_000_000, _io_load_columnar),
+    ("runner.mock_endpoint", 1_000, _runner),
+    ("service.mock_endpoint", 1_000, _service),
+]
+
+
+def run_benchmarks(sizes, cases=None, repeat=3, workdir=None):
+    """
+    Time every selected case at every size; the best of `repeat` runs is
+    reported. Returns a list of {"name", "rows", "seconds", "rows_per_second"}.
+    """
+    selected = [c for c in CASES if not cases or any(c[0].startswith(prefix) for prefix in cases)]
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for size in sizes:
+            rows = synthetic_results(size)
+            for name, max_rows, setup in selected:
+                if size > max_rows:
+                    continue
+                run = setup(rows, os.path.join(tmp, f"{name}_{size}.jsonl"))
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    run()
+                    timings.append(time.perf_counter() - start)
+                best = min(timings)
+                results.append({"name": name, "rows": size, "seconds": best, "rows_per_second": size / best if best else None})
+                print(f"{name:<24} {size:>9} rows  {best:9.4f}s  {size / best if best else float('inf'):>14,.0f} rows/s")
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    """
+    Cases slower than the baseline by more than `tolerance` (a fraction).
+    Returns [(name, rows, baseline seconds, seconds, ratio)], worst first;
+    cases missing from the baseline are left to missing_from_baseline.
+    """
+    reference = {(r["name"], r["rows"]): r["seconds"] for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        before = reference.get((r["name"], r["rows"]))
+        if before and r["seconds"] > before * (1 + tolerance):
+            regressions.append((r["name"], r["rows"], before, r["seconds"], r["seconds"] / before))
+    return sorted(regressions, key=lambda item: -item[-1])
+
+
+def missing_from_baseline(results, baseline):
+    """(name, rows) of the cases in `results` the baseline has no timing for."""
+    reference = {(r["name"], r["rows"]) for r in baseline["results"]}
+    return [(r["name"], r["rows"]) for r in results if (r["name"], r["rows"]) not in reference]
+
+
+def environment():
+    import numpy
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scoring, metrics, I/O and runner pipeline on synthetic data")
+    parser.add_argument("--sizes", type=str, default="1k,100k", help="Comma-separated row counts, e.g. 1k,100k,1M")
+    parser.add_argument("--cases", type=lambda v: v.split(","), default=None,
+                        help="Only run cases whose name starts with one of these prefixes (e.g. scoring,io)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest is reported")
+    parser.add_argument("--output", type=str, default="results/benchmarks.json")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help="Stored results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs. the baseline (fraction)")
+    parser.add_argument("--save_baseline", action="store_true", help="Overwrite the baseline with this run")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "results": run_benchmarks(parse_sizes(args.sizes), args.cases, args.repeat)}
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to {args.output}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report["results"], baseline, args.tolerance)
+        for name, rows in missing_from_baseline(report["results"], baseline):
+            print(f"NO BASELINE {name} @ {rows} rows (not checked; record one with --save_baseline)")
+        for name, rows, before, after, ratio in regressions:
+            print(f"REGRESSION {name} @ {rows} rows: {before:.4f}s -> {after:.4f}s ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
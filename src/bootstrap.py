@@ -0,0 +1,165 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Upper bound on the elements of one (resamples x rows) weight matrix,
+# which sets how many resamples go into a chunk (~32 MB of float64).
+MAX_CHUNK_ELEMENTS = 4_000_000
+
+
+def _sorted_groups(scores, errors):
+    """Sort order, errors in that order, and the start index of each tie group."""
+    scores = np.asarray(scores, dtype=float)
+    order = np.argsort(scores, kind="stable")
+    sorted_scores = scores[order]
+    starts = np.flatnonzero(np.diff(sorted_scores, prepend=-np.inf) != 0)
+    return order, np.asarray(errors, dtype=float)[order], starts
+
+
+def weighted_metrics(weights, sorted_errors, group_starts):
+    """
+    ROC-AUC and AURC for a batch of resamples at once.
+
+    `weights` is a (B x N) matrix giving how often each row (in score order)
+    appears in each resample. AUC is the Mann-Whitney statistic for errors
+    scoring above correct answers (ties count one half); AURC integrates the
+    tie-aware risk-coverage curve with the trapezoidal rule, exactly as
+    selective_metrics.RiskCoverage does for a single result set.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: AUC and AURC per resample (AUC is nan
+        when a resample holds only one class).
+    """
+    n = weights.shape[1]
+    err = np.add.reduceat(weights * sorted_errors, group_starts, axis=1)
+    total = np.add.reduceat(weights, group_starts, axis=1)
+    correct = total - err
+
+    # AUC: each error outranks the correct answers in lower groups and ties half of its own group.
+    correct_below = np.cumsum(correct, axis=1) - correct
+    pairs = err.sum(axis=1) * correct.sum(axis=1)
+    wins = np.sum(err * (correct_below + 0.5 * correct), axis=1)
+    auc = np.divide(wins, pairs, out=np.full(pairs.shape, np.nan), where=pairs > 0)
+
+    # AURC: one curve point per group; segments starting before anything is answered are skipped.
+    answered = np.cumsum(total, axis=1)
+    risk = np.divide(np.cumsum(err, axis=1), answered, out=np.zeros(answered.shape), where=answered > 0)
+    coverage = answered / n
+    segment = np.diff(coverage, axis=1) * (risk[:, 1:] + risk[:, :-1]) / 2
+    aurc = np.sum(np.where(answered[:, :-1] > 0, segment, 0.0), axis=1)
+    return auc, aurc
+
+
+def _resample_weights(rng, num_resamples, n):
+    """(B x N) multiplicity matrix of B bootstrap resamples of n rows."""
+    index = rng.integers(0, n, size=(num_resamples, n)) + (np.arange(num_resamples) * n)[:, None]
+    return np.bincount(index.ravel(), minlength=num_resamples * n).reshape(num_resamples, n).astype(float)
+
+
+def _run_chunk(task):
+    seed, num_resamples, datasets = task
+    rng = np.random.default_rng(seed)
+    n = datasets[0][0].size
+    weights = _resample_weights(rng, num_resamples, n)
+    # The same resamples are applied to every dataset, which makes comparisons paired.
+    return [weighted_metrics(weights[:, order], sorted_errors, starts) for order, sorted_errors, starts in datasets]
+
+
+def _bootstrap(datasets, num_resamples, seed, workers):
+    n = datasets[0][0].size
+    chunk = max(1, min(num_resamples, MAX_CHUNK_ELEMENTS // max(n, 1)))
+    sizes = [min(chunk, num_resamples - start) for start in range(0, num_resamples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(s, size, datasets) for s, size in zip(seeds, sizes)]
+
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    else:
+        results = [_run_chunk(task) for task in tasks]
+
+    # Per dataset: concatenated AUC and AURC over all chunks.
+    return [
+        tuple(np.concatenate([chunk_result[i][m] for chunk_result in results]) for m in range(2))
+        for i in range(len(datasets))
+    ]
+
+
+def _interval(values, confidence):
+    alpha = (1.0 - confidence) / 2 * 100
+    low, high = np.nanpercentile(values, [alpha, 100 - alpha])
+    return float(low), float(high)
+
+
+def bootstrap_ci(scores, errors, num_resamples=1000, confidence=0.95, seed=0, workers=None):
+    """
+    Percentile bootstrap confidence intervals for ROC-AUC and AURC.
+
+    Resamples are drawn as (B x N) index matrices, processed in chunks that
+    bound memory, optionally on a process pool. Each chunk has its own
+    seed, so results depend on the chunk size but not on the number of
+    workers.
+
+    Returns:
+        dict: {"roc_auc": (low, high), "aurc": (low, high)}
+    """
+    aucs, aurcs = _bootstrap([_sorted_groups(scores, errors)], num_resamples, seed, workers)[0]
+    return {"roc_auc": _interval(aucs, confidence), "aurc": _interval(aurcs, confidence)}
+
+
+def paired_comparison(scores_a, errors_a, scores_b, errors_b, num_resamples=1000, confidence=0.95, seed=0, workers=None):
+    """
+    Paired bootstrap of metric differences (B - A) over the same questions.
+
+    Both result sets must be aligned row by row. Every resample picks the
+    same questions for A and B. The two-sided p-value is twice the smaller
+    tail mass of the difference around zero.
+
+    Returns:
+        dict: per metric, the observed difference, its CI and p-value.
+    """
+    datasets = [_sorted_groups(scores_a, errors_a), _sorted_groups(scores_b, errors_b)]
+    (auc_a, aurc_a), (auc_b, aurc_b) = _bootstrap(datasets, num_resamples, seed, workers)
+    ones = np.ones((1, len(scores_a)))
+    observed = [weighted_metrics(ones[:, order], sorted_errors, starts) for order, sorted_errors, starts in datasets]
+
+    comparison = {}
+    for m, name in enumerate(["roc_auc", "aurc"]):
+        diff = (auc_b - auc_a, aurc_b - aurc_a)[m]
+        diff = diff[~np.isnan(diff)]
+        p_value = min(1.0, 2 * min(np.mean(diff <= 0), np.mean(diff >= 0))) if diff.size else float("nan")
+        comparison[name] = {
+            "difference": float(observed[1][m][0] - observed[0][m][0]),
+            "ci": _interval(diff, confidence),
+            "p_value": float(p_value),
+        }
+    return comparison
+
+
+def _load(path):
+    from analyze_results import load_labels
+    data = load_labels(path, ["id"])
+    return {i: (s, e) for i, s, e in zip(data["id"], data["consistency_score"].tolist(), data["is_error"].tolist())}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paired bootstrap comparison of two result files")
+    parser.add_argument("file_a", type=str)
+    parser.add_argument("file_b", type=str)
+    parser.add_argument("--resamples", type=int, default=10000)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--workers", type=int, default=None, help="Processes for resample chunks")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    a, b = _load(args.file_a), _load(args.file_b)
+    shared = [i for i in a if i in b]
+    print(f"Comparing {len(shared)} shared questions ({len(a)} in A, {len(b)} in B)")
+    result = paired_comparison(
+        [a[i][0] for i in shared], [a[i][1] for i in shared],
+        [b[i][0] for i in shared], [b[i][1] for i in shared],
+        num_resamples=args.resamples, confidence=args.confidence, seed=args.seed, workers=args.workers
+    )
+    for name, r in result.items():
+        low, high = r["ci"]
+        print(f"{name}: B - A = {r['difference']:+.4f} ({args.confidence:.0%} CI [{low:+.4f}, {high:+.4f}], p = {r['p_value']:.4f})")
@@ -0,0 +1,189 @@
+import os
+import glob
+import json
+import argparse
+import numpy as np
+from prompts import SYSTEM_PROMPT
+
+# Runs of characters Python's str.split() treats as words: anything but
+# Unicode whitespace (RE2's \s alone misses \v, \x1c-\x1f, \x85 and \p{Z}).
+WORD_RE = r"[^\t\n\x0b\x0c\r\x1c-\x1f \x85\p{Z}]+"
+
+
+def index_path(dataset_path, split="validation"):
+    """Index file kept next to a saved dataset, e.g. datasets/squad_v2.validation.index.arrow."""
+    return f"{os.path.normpath(dataset_path)}.{split}.index.arrow"
+
+
+def _source_mtime(dataset_path, split):
+    files = glob.glob(os.path.join(dataset_path, split, "*"))
+    return max((os.path.getmtime(f) for f in files), default=0.0)
+
+
+class ArrowSplit:
+    """
+    Read-only view of a split saved with `datasets` `save_to_disk`, read
+    straight from its memory-mapped Arrow files, so the `datasets` package
+    is never imported. Supports what the runner needs from a Dataset:
+    len(), iteration over row dicts, row and column access and select().
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def load(cls, dataset_path, split="validation"):
+        import pyarrow as pa
+        directory = os.path.join(dataset_path, split)
+        with open(os.path.join(directory, "state.json")) as f:
+            files = [entry["filename"] for entry in json.load(f)["_data_files"]]
+        tables = [pa.ipc.open_stream(pa.memory_map(os.path.join(directory, name))).read_all() for name in files]
+        return cls(pa.concat_tables(tables) if len(tables) > 1 else tables[0])
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __iter__(self):
+        for batch in self.table.to_batches(max_chunksize=1024):
+            yield from batch.to_pylist()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.table.column(key).to_pylist()
+        return self.table.slice(key, 1).to_pylist()[0]
+
+    def select(self, positions):
+        import pyarrow as pa
+        return ArrowSplit(self.table.take(pa.array(positions, type=pa.int64())))
+
+
+def build_table(table):
+    """
+    Index columns for one split, computed with Arrow compute kernels:
+
+    - position: row number in the split; id: the `id` column, or the
+      position as a string for datasets without one (nq_open, truthful_qa)
+    - is_impossible: no gold answer (SQuAD `answers.answer_start` or
+      nq_open `answer` is empty)
+    - group_id: dense id of the context in order of first appearance (the
+      question itself for datasets without contexts), so exact duplicates
+      share a group
+    - question_words, context_words: len(text.split())
+    - prompt_tokens: the whole request (system prompt included) at 4
+      characters per token, with the prompt formatted as build_messages
+      does for SQuAD-style rows (question and "Answer:" only otherwise)
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    n = table.num_rows
+    names = table.column_names
+    position = pa.array(np.arange(n, dtype=np.int64))
+    ids = table.column("id") if "id" in names else pc.cast(position, pa.string())
+    question = table.column("question")
+    if "answers" in names:
+        impossible = pc.equal(pc.list_value_length(pc.struct_field(table.column("answers"), "answer_start")), 0)
+    elif "answer" in names:
+        impossible = pc.equal(pc.list_value_length(table.column("answer")), 0)
+    else:
+        impossible = pa.array(np.zeros(n, dtype=bool))
+
+    if "context" in names:
+        context = table.column("context")
+        prompt = pc.binary_join_element_wise("Context: ", context, "\n\nQuestion: ", question, "\n\nAnswer:", "")
+        context_words = pc.count_substring_regex(context, WORD_RE)
+    else:
+        context = question
+        prompt = pc.binary_join_element_wise("Question: ", question, "\n\nAnswer:", "")
+        context_words = pa.array(np.zeros(n, dtype=np.int32))
+    group_id = pc.dictionary_encode(context).combine_chunks().indices
+
+    return pa.table({
+        "position": position,
+        "id": ids,
+        "is_impossible": impossible,
+        "group_id": group_id,
+        "question_words": pc.count_substring_regex(question, WORD_RE),
+        "context_words": context_words,
+        "prompt_tokens": pc.divide(pc.add(pc.utf8_length(prompt), len(SYSTEM_PROMPT)), 4),
+    })
+
+
+def build_index(dataset_path, split="validation"):
+    """
+    Compute the index of a saved dataset split and write it as an Arrow IPC
+    file next to the dataset. Returns the path.
+    """
+    import pyarrow as pa
+    index = build_table(ArrowSplit.load(dataset_path, split).table)
+    path = index_path(dataset_path, split)
+    with pa.OSFile(path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, index.schema) as writer:
+        writer.write_table(index)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_index(dataset_path, split="validation", rebuild=False):
+    """
+    Memory-mapped index of a saved dataset split, built first if it is
+    missing, older than the dataset files or `rebuild` is set.
+    """
+    import pyarrow as pa
+    path = index_path(dataset_path, split)
+    if rebuild or not os.path.exists(path) or os.path.getmtime(path) < _source_mtime(dataset_path, split):
+        print(f"Building dataset index {path}")
+        build_index(dataset_path, split)
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def stratified_sample(index, n, columns=("is_impossible",), seed=0):
+    """
+    Positions of `n` rows drawn without replacement so that every stratum
+    (distinct combination of `columns`) keeps its share of the split, with
+    largest-remainder rounding. Returned in dataset order.
+    """
+    total = index.num_rows
+    n = min(n, total)
+    keys = np.zeros(total, dtype=np.int64)
+    for name in columns:
+        _, codes = np.unique(index.column(name).to_numpy(zero_copy_only=False), return_inverse=True)
+        keys = keys * (codes.max() + 1) + codes
+    strata, codes, sizes = np.unique(keys, return_inverse=True, return_counts=True)
+    quotas = sizes * n / total
+    counts = np.floor(quotas).astype(int)
+    counts[np.argsort(counts - quotas)[:n - counts.sum()]] += 1
+
+    rng = np.random.default_rng(seed)
+    order = np.argsort(codes, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(sizes)))
+    chosen = [rng.choice(order[starts[s]:starts[s + 1]], size=counts[s], replace=False) for s in range(len(strata))]
+    return np.sort(np.concatenate(chosen)) if chosen else np.zeros(0, dtype=np.int64)
+
+
+def dataset_stats(index):
+    """Class balance and average lengths, from the index columns alone."""
+    impossible = index.column("is_impossible").to_numpy(zero_copy_only=False)
+    return {
+        "total": index.num_rows,
+        "unanswerable": int(impossible.sum()),
+        "contexts": int(index.column("group_id").to_numpy().max() + 1) if index.num_rows else 0,
+        "avg_question_words": float(np.mean(index.column("question_words").to_numpy())) if index.num_rows else 0.0,
+        "avg_context_words": float(np.mean(index.column("context_words").to_numpy())) if index.num_rows else 0.0,
+        "avg_prompt_tokens": float(np.mean(index.column("prompt_tokens").to_numpy())) if index.num_rows else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the columnar index of saved datasets and print their stats")
+    parser.add_argument("dataset_paths", nargs="*", default=["datasets/squad_v2", "datasets/nq_open", "datasets/truthful_qa"])
+    parser.add_argument("--splits", type=lambda v: v.split(","), default=["validation"])
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild even if the index is up to date")
+    args = parser.parse_args()
+
+    for dataset_path in args.dataset_paths:
+        for split in args.splits:
+            if not os.path.isdir(os.path.join(dataset_path, split)):
+                print(f"Skipping {dataset_path} ({split}): not found")
+                continue
+            index = load_index(dataset_path, split, rebuild=args.rebuild)
+            print(f"{index_path(dataset_path, split)}: {dataset_stats(index)}")
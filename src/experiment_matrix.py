@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+import experiment_runner as runner
+from answer_matching import is_error
+from prompts import build_messages
+from rate_limiter import RateLimiter
+from results_io import ResultWriter
+from selective_metrics import IncrementalMetrics
+
+
+def model_slug(model):
+    """File-name-safe form of a model ID, e.g. meta-llama/llama-3-8b-instruct -> meta-llama-llama-3-8b-instruct."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", model).strip("-")
+
+
+def cell_path(output_path, model, temperature, k):
+    """Results file of one matrix cell, e.g. results/matrix_gpt-4o_t0.7_k5.jsonl."""
+    return f"{os.path.splitext(output_path)[0]}_{model_slug(model)}_t{temperature:g}_k{k}.jsonl"
+
+
+class CellWriter:
+    """
+    Routes the (cell, row) pairs produced by ExperimentMatrix.process to
+    each cell's results file, and keeps running metrics per cell.
+    """
+
+    def __init__(self, paths):
+        self.writers = {cell: ResultWriter(path) for cell, path in paths.items()}
+        self.metrics = {cell: IncrementalMetrics() for cell in paths}
+
+    def write(self, entry):
+        cell, row = entry
+        self.writers[cell].write(row)
+        self.metrics[cell].update(row["consistency_score"], is_error(row))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+class ExperimentMatrix:
+    """
+    Every model x temperature x k cell over one loaded, prompt-built set of
+    examples, run in one event loop.
+
+    Each model is its own stream: a bounded window of examples in flight
+    (run_examples), behind a RateLimiter of its own, so a slow or throttled
+    model never holds back the others and the matrix takes about as long
+    as its slowest model. Per example and model, the greedy answer is
+    requested once and max(k) samples are drawn per temperature; the k
+    cells of a temperature score the first k of those samples.
+    """
+
+    def __init__(self, examples, args, output_path):
+        self.examples = list(examples)
+        self.messages = {example["id"]: build_messages(example) for example in self.examples}
+        self.args = args
+        self.models = args.models
+        self.temperatures = args.temperatures
+        self.ks = sorted(set(args.k_values or [args.num_generations]))
+        self.paths = {
+            (model, temperature, k): cell_path(output_path, model, temperature, k)
+            for model in self.models for temperature in self.temperatures for k in self.ks
+        }
+        self.limits = {}
+        self.limiters = {}
+        for model in self.models:
+            concurrency, rps, tpm = args.model_limits.get(model, (None, None, None))
+            self.limits[model] = concurrency or args.concurrency
+            self.limiters[model] = RateLimiter(
+                requests_per_second=rps or args.requests_per_second,
+                tokens_per_minute=tpm or args.tokens_per_minute,
+                max_concurrency=self.limits[model],
+                max_retries=args.max_retries
+            )
+        self.seconds = {}
+        self.failures = {}
+
+    async def process(self, unit, args, limiter):
+        """(cell, row) pairs of one example for every temperature and k of `args.model_name`."""
+        example = unit[0]
+        model = args.model_name
+        messages = self.messages[example["id"]]
+        greedy, *samples = await asyncio.gather(
+            runner.get_response_async(model, messages, temperature=0.0, n=1, limiter=limiter),
+            *[runner.draw_samples(model, messages, self.ks[-1], temperature=t, limiter=limiter) for t in self.temperatures]
+        )
+        return [
+            ((model, temperature, k), runner.build_row(example, greedy[0], drawn[:k], args))
+            for temperature, drawn in zip(self.temperatures, samples) for k in self.ks
+        ]
+
+    async def run_model(self, model, writer, position):
+        args = argparse.Namespace(**vars(self.args))
+        args.model_name, args.concurrency, args.k_values = model, self.limits[model], None
+        # Each cell scores its own first k samples (process slices them)
+        args.num_generations = self.ks[-1]
+        started = time.perf_counter()
+        _, self.failures[model] = await runner.run_examples(
+            self.examples, args, self.limiters[model], writer, self.process, desc=model, position=position)
+        self.seconds[model] = time.perf_counter() - started
+
+    async def run_async(self, writer):
+        try:
+            await asyncio.gather(*[self.run_model(model, writer, i) for i, model in enumerate(self.models)])
+        finally:
+            await runner.async_client.close()
+
+    def run(self):
+        """Run every cell; returns the matrix summary (also written next to the cell files)."""
+        writer = CellWriter(self.paths)
+        started = time.perf_counter()
+        try:
+            asyncio.run(self.run_async(writer))
+        finally:
+            writer.close()
+        wall_seconds = time.perf_counter() - started
+
+        cells = []
+        for (model, temperature, k), path in self.paths.items():
+            metrics = writer.metrics[(model, temperature, k)].summary(self.args.target_risk)
+            metrics_path = f"{os.path.splitext(path)[0]}_metrics.json"
+            with open(metrics_path, "w") as f:
+                json.dump(metrics, f, indent=2)
+            cells.append({"model": model, "temperature": temperature, "k": k, "results_file": path,
+                          "metrics_file": metrics_path, **metrics})
+        models = {
+            model: {"seconds": self.seconds.get(model), "failed": len(self.failures.get(model, [])),
+                    "concurrency": self.limits[model], "rate_limiter": self.limiters[model].summary()}
+            for model in self.models
+        }
+        return {"examples": len(self.examples), "wall_seconds": wall_seconds, "models": models, "cells": cells}
+
+
+def format_cells(cells):
+    """Table of the matrix cells' metrics, one line per cell."""
+    width = max([len("model")] + [len(c["model"]) for c in cells])
+    lines = [f"{'model':<{width}}  temp    k   rows  error    auc   aurc  threshold"]
+    for c in cells:
+        threshold = c["recommended_threshold"]["threshold"]
+        lines.append(f"{c['model']:<{width}}  {c['temperature']:4g}  {c['k']:3d}  {c['rows']:5d}  "
+                     f"{c['base_error_rate']:5.1%}  {c['roc_auc']:.3f}  {c['aurc']:.3f}  "
+                     f"{'-' if threshold is None else format(threshold, '.3f'):>9}")
+    return "\n".join(lines)
+
+
+def run_matrix(eval_data, args, output_path):
+    """
+    Run the --models matrix on the selected examples (clients, cache and
+    telemetry already set up by run_experiment) and report per cell.
+    """
+    runner.live_metrics = None
+    matrix = ExperimentMatrix(eval_data, args, output_path)
+    print(f"Matrix: {len(args.models)} models x {len(matrix.temperatures)} temperatures x {len(matrix.ks)} k values "
+          f"= {len(matrix.paths)} cells over {len(matrix.examples)} examples")
+    summary = matrix.run()
+
+    for model, entry in summary["models"].items():
+        print(f"{model}: {entry['seconds']:.1f}s, concurrency {entry['concurrency']}, rate limiter: {entry['rate_limiter']}")
+    print(f"Matrix finished in {summary['wall_seconds']:.1f}s "
+          f"(sum over models {sum(e['seconds'] for e in summary['models'].values()):.1f}s)")
+    print(format_cells(summary["cells"]))
+
+    base = os.path.splitext(output_path)[0]
+    summary_path = f"{base}_matrix.json"
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    runner.telemetry.annotate("matrix", {"wall_seconds": summary["wall_seconds"], "models": summary["models"]})
+    telemetry_path = f"{base}_telemetry.json"
+    runner.telemetry.write(telemetry_path)
+    if runner.response_cache is not None:
+        print(f"Response cache: {runner.response_cache.summary()}")
+    print(f"Saved {len(summary['cells'])} cells to {base}_*.jsonl; summary in {summary_path}, telemetry in {telemetry_path}")
+
+    failures = [dict(f, model=model) for model, failed in matrix.failures.items() for f in failed]
+    if failures:
+        failures_path = f"{base}_failures.json"
+        with open(failures_path, "w") as f:
+            json.dump(failures, f, indent=2)
+        print(f"{len(failures)} example runs failed and were not scored; see {failures_path}")
+    return summary
@@ -1,127 +1,710 @@
 import os
+import sys
 import json
 import argparse
-import time
+import asyncio
+from collections import deque
 import numpy as np
-from tqdm import tqdm
-from datasets import load_from_disk, load_dataset
-from openai import OpenAI
-from scoring_utils import calculate_inconsistency_score
-from dotenv import load_dotenv
+from scoring_utils import calculate_inconsistency_score, calculate_inconsistency_scores_by_k, should_stop_sampling
+from rate_limiter import RateLimiter, RequestFailedError, estimate_tokens, parse_model_limits
+from response_cache import ResponseCache, request_key
+from sample_pool import SamplePool
+from selective_metrics import IncrementalMetrics
+from answer_matching import is_error
+from results_io import ResultWriter, completed_ids, convert_results
+from sharding import parse_shard, shard_positions, shard_path, write_manifest
+from dataset_index import ArrowSplit, load_index, stratified_sample
+from hedging import Hedger, first_completed
+from telemetry import Telemetry, OpenTelemetryHook
+from prompts import build_messages, build_grouped_messages, parse_numbered_answers, group_by_context
 
-load_dotenv()
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
 
-# Initialize Client (OpenRouter)
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.environ.get("OPENROUTER_API_KEY"),
-)
+def make_clients(base_url=DEFAULT_BASE_URL):
+    """
+    Sync and async clients for an OpenAI-compatible endpoint. The SDK's own
+    retries are disabled; retrying is left to the shared RateLimiter.
+    """
+    # Imported here: openai and dotenv are slow to import and only needed
+    # once requests are actually sent.
+    from openai import OpenAI, AsyncOpenAI
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Local stand-in servers (mock_llm_server.py) accept any key.
+    api_key = os.environ.get("OPENROUTER_API_KEY") or ("unused" if base_url != DEFAULT_BASE_URL else None)
+    return (
+        OpenAI(base_url=base_url, api_key=api_key, max_retries=0),
+        AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0),
+    )
+
+# Built on first use by ensure_clients(), or by run_experiment for --base_url.
+client = async_client = None
 
-def get_response(model, messages, temperature=0.0, max_tokens=100, n=1):
+def ensure_clients():
     """
-    Get response from API with retries.
+    Create the default clients if none are set yet: OpenRouter, unless
+    OPENROUTER_BASE_URL points elsewhere. Raises RuntimeError when no API
+    key is available (only runs against a --base_url stand-in are possible).
     """
-    retries = 3
-    for attempt in range(retries):
+    global client, async_client
+    if async_client is not None:
+        return
+    from openai import OpenAIError
+    try:
+        client, async_client = make_clients(os.environ.get("OPENROUTER_BASE_URL", DEFAULT_BASE_URL))
+    except OpenAIError:
+        raise RuntimeError("OPENROUTER_API_KEY is not set; set it or pass --base_url") from None
+
+# Shared by every request; reconfigured from the CLI in run_experiment.
+rate_limiter = RateLimiter()
+# Optional persistent ResponseCache consulted before any request is sent.
+response_cache = None
+# Per-call latency, token, retry and cache-hit instrumentation for the run.
+telemetry = Telemetry()
+# Optional Hedger duplicating calls that run past the recent latency percentile.
+hedger = None
+# Extra sampled calls started per draw; the first k to finish are kept.
+overprovision = 0
+# Running metrics over the rows written so far (--live_every), or None.
+live_metrics = None
+
+# Whether sampled calls may ask for several choices at once (n > 1).
+native_n = True
+# Largest n each model is known to honour (1 = it ignores n), per run.
+max_choices = {}
+_probe_locks = {}
+
+# Choices requested by the one-off probe of a model's n support.
+PROBE_N = 16
+PROBE_MESSAGES = [{"role": "user", "content": "Reply with one random English word."}]
+# Estimated prompt tokens for context-grouped requests vs. the equivalent
+# single-question requests.
+prompt_token_savings = {"single": 0, "grouped": 0}
+
+def usage_of(response):
+    """Token usage reported by the API as a plain dict (empty if absent)."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+def call_kind(temperature):
+    return "greedy" if temperature == 0 else "sampled"
+
+def cache_lookup(model, messages, temperature, max_tokens, n, sample_index):
+    """Returns (key, cached choices); key is None when caching is disabled."""
+    if response_cache is None:
+        return None, None
+    key = request_key(model, messages, temperature, max_tokens, n, sample_index)
+    cached = response_cache.get(key)
+    if cached is None:
+        return key, None
+    telemetry.record_cache_hits(call_kind(temperature))
+    return key, cached["choices"]
+
+def get_response(model, messages, temperature=0.0, max_tokens=100, n=1, limiter=None, sample_index=None):
+    """
+    Get response from API through the shared rate limiter and response cache.
+
+    `sample_index` distinguishes repeated stochastic draws of one prompt in
+    the cache. Raises RequestFailedError once retries are exhausted instead
+    of returning placeholder answers.
+    """
+    key, cached = cache_lookup(model, messages, temperature, max_tokens, n, sample_index)
+    if cached is not None:
+        return cached
+
+    limiter = limiter or rate_limiter
+    kind = call_kind(temperature)
+    attempts = 0
+    ensure_clients()
+
+    def send():
+        nonlocal attempts
+        attempts += 1
+        return client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            n=n
+        )
+
+    start = telemetry.clock()
+    with telemetry.span("chat.completion", kind=kind, model=model, n=n) as span:
+        try:
+            response = limiter.call(send, estimated_tokens=estimate_tokens(messages, max_tokens * n))
+        except RequestFailedError:
+            telemetry.record_call(kind, telemetry.clock() - start, attempts, failed=True)
+            raise
+        span.set_attribute("attempts", attempts)
+    telemetry.record_call(kind, span.duration, attempts, usage_of(response))
+    choices = [choice.message.content for choice in response.choices]
+    if key is not None:
+        response_cache.put(key, model, choices, usage_of(response))
+    return choices
+
+async def request_choices_async(model, messages, temperature, max_tokens, n, limiter=None):
+    """
+    Send one request through the rate limiter, hedged when a Hedger is set;
+    returns (choices, usage). The call's latency (retries included),
+    attempts, hedged duplicates and usage go to telemetry.
+    """
+    limiter = limiter or rate_limiter
+    kind = call_kind(temperature)
+    attempts = hedges = 0
+    ensure_clients()
+
+    def create():
+        return async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            n=n
+        )
+
+    def send():
+        nonlocal attempts
+        attempts += 1
+        return create()
+
+    def send_hedge():
+        # Counted apart from attempts, so duplicates never show up as retries
+        nonlocal hedges
+        hedges += 1
+        return create()
+
+    estimated = estimate_tokens(messages, max_tokens * n)
+
+    def attempt():
+        # Hedging happens inside the limiter slot, so only the server's
+        # latency (not the wait for a slot) decides when to duplicate. The
+        # duplicate takes rate budget of its own and shares the slot.
+        if hedger is None:
+            return send()
+        return hedger.run(send, lambda: limiter.call_extra(send_hedge, estimated))
+
+    start = telemetry.clock()
+    with telemetry.span("chat.completion", kind=kind, model=model, n=n) as span:
         try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                n=n
-            )
-            return [choice.message.content for choice in response.choices]
-        except Exception as e:
-            print(f"API Error (Attempt {attempt+1}/{retries}): {e}")
-            time.sleep(2 * (attempt + 1))
-    return [""] * n
+            response = await limiter.call_async(attempt, estimated_tokens=estimated)
+        except RequestFailedError:
+            telemetry.record_call(kind, telemetry.clock() - start, attempts, failed=True, hedges=hedges)
+            raise
+        span.set_attribute("attempts", attempts)
+        span.set_attribute("hedges", hedges)
+    usage = usage_of(response)
+    telemetry.record_call(kind, span.duration, attempts, usage, hedges=hedges)
+    return [choice.message.content for choice in response.choices], usage
+
+async def get_response_async(model, messages, temperature=0.0, max_tokens=100, n=1, limiter=None, sample_index=None):
+    """
+    Async counterpart of get_response. The limiter's adaptive concurrency
+    bounds the number of requests in flight across every caller sharing it.
+    """
+    key, cached = cache_lookup(model, messages, temperature, max_tokens, n, sample_index)
+    if cached is not None:
+        return cached
+
+    choices, usage = await request_choices_async(model, messages, temperature, max_tokens, n, limiter)
+    if key is not None:
+        response_cache.put(key, model, choices, usage)
+    return choices
+
+async def sampling_capacity(model, limiter=None):
+    """
+    Largest n the model honours. Models are probed once with an n=PROBE_N
+    request (the number of choices that come back is the answer), and the
+    result is kept in the response cache database for later runs.
+    """
+    if model in max_choices:
+        return max_choices[model]
+    lock = _probe_locks.setdefault(model, asyncio.Lock())
+    async with lock:
+        if model in max_choices:
+            return max_choices[model]
+        max_n = response_cache.get_max_n(model) if response_cache is not None else None
+        if max_n is None:
+            try:
+                choices, _ = await request_choices_async(model, PROBE_MESSAGES, 1.0, 5, PROBE_N, limiter)
+                max_n = max(len(choices), 1)
+            except RequestFailedError as e:
+                # Some providers reject n > 1 outright.
+                print(f"Probing n support of {model} failed ({e}); sampling one choice per request")
+                max_n = 1
+            print(f"{model} honours n up to {max_n}" if max_n > 1 else f"{model} ignores n")
+            if response_cache is not None:
+                response_cache.set_max_n(model, max_n)
+        max_choices[model] = max_n
+        return max_n
+
+def lower_capacity(model, max_n):
+    """Record that a model returned fewer choices than requested."""
+    if max_n < max_choices.get(model, PROBE_N):
+        max_choices[model] = max_n
+        if response_cache is not None:
+            response_cache.set_max_n(model, max_n)
+
+async def draw_native(model, messages, temperature, max_tokens, count, limiter=None):
+    """
+    `count` samples from as few n > 1 requests as the model allows,
+    topping up with further requests when fewer choices come back than
+    were asked for. Returns (texts, usages); a request's usage is attached
+    to its first choice.
+    """
+    texts, usages = [], []
+    while len(texts) < count:
+        wanted = count - len(texts)
+        max_n = max_choices.get(model, 1)
+        batches = [min(max_n, wanted - i) for i in range(0, wanted, max_n)]
+        drawn = await asyncio.gather(*[
+            request_choices_async(model, messages, temperature, max_tokens, n, limiter) for n in batches
+        ])
+        for n, (choices, usage) in zip(batches, drawn):
+            if not choices:
+                raise RequestFailedError(f"{model} returned no choices", last_error=None, attempts=1)
+            if len(choices) < n:
+                lower_capacity(model, len(choices))
+            texts.extend(choices)
+            usages.extend([usage] + [None] * (len(choices) - 1))
+    return texts[:count], usages[:count]
+
+async def draw_samples(model, messages, k, temperature=0.7, max_tokens=100, limiter=None, start=0):
+    """
+    Take samples [start, k) from the prompt's sample pool, requesting only
+    the slots that have not been drawn before. Models that honour n get the
+    missing slots in one request (see draw_native). Otherwise each sample
+    is its own request; with `overprovision` > 0, that many extra calls are
+    started and the first to finish fill the slots, stragglers cancelled.
+    """
+    pool = SamplePool(response_cache)
+    samples = pool.lookup(model, messages, temperature, max_tokens, k, start)
+    missing = [j for j, sample in enumerate(samples) if sample is None]
+    if response_cache is not None and len(missing) < len(samples):
+        telemetry.record_cache_hits(call_kind(temperature), len(samples) - len(missing))
+
+    if not missing:
+        return samples
+    if native_n and len(missing) > 1 and await sampling_capacity(model, limiter) > 1:
+        texts, usages = await draw_native(model, messages, temperature, max_tokens, len(missing), limiter)
+    else:
+        # Some OpenRouter models ignore n, so each sample is its own request.
+        extra = overprovision if temperature > 0 else 0
+        drawn = await first_completed([
+            lambda: request_choices_async(model, messages, temperature, max_tokens, 1, limiter)
+            for _ in range(len(missing) + extra)
+        ], len(missing))
+        texts = [choices[0] for choices, _ in drawn]
+        usages = [usage for _, usage in drawn]
+    for j, text, usage in zip(missing, texts, usages):
+        samples[j] = text
+        pool.store(model, messages, temperature, max_tokens, start + j, text, usage)
+    return samples
+
+async def draw_samples_adaptive(model, greedy_call, messages, args, limiter=None):
+    """
+    Draw samples in rounds of `args.round_size` until the abstain/answer
+    decision at `args.threshold` is settled with `args.confidence`, or
+    `args.num_generations` samples have been drawn.
+
+    The greedy call runs alongside the first round. Returns (greedy
+    responses, samples).
+    """
+    first_round = min(args.round_size, args.num_generations)
+    greedy_responses, samples = await asyncio.gather(
+        greedy_call,
+        draw_samples(model, messages, first_round, limiter=limiter)
+    )
+    while len(samples) < args.num_generations and not should_stop_sampling(
+            greedy_responses[0], samples, args.threshold, args.confidence):
+        k = min(len(samples) + args.round_size, args.num_generations)
+        samples += await draw_samples(model, messages, k, limiter=limiter, start=len(samples))
+    return greedy_responses, samples
+
+async def process_example(example, args, limiter):
+    """
+    Run the greedy call and all sampled calls for one example concurrently
+    and build its result row.
+    """
+    messages = build_messages(example)
+
+    # 1. Greedy Generation (Temp=0)
+    # 2. Stochastic Sampling (Temp=0.7), drawn from the prompt's sample pool
+    greedy_call = get_response_async(args.model_name, messages, temperature=0.0, n=1, limiter=limiter)
+    if args.adaptive:
+        greedy_responses, sampled_ans = await draw_samples_adaptive(args.model_name, greedy_call, messages, args, limiter)
+    else:
+        num_samples = max([args.num_generations] + (args.k_values or []))
+        greedy_responses, sampled_ans = await asyncio.gather(
+            greedy_call,
+            draw_samples(args.model_name, messages, num_samples, limiter=limiter)
+        )
+    return build_row(example, greedy_responses[0], sampled_ans, args)
+
+def build_row(example, greedy_ans, sampled_ans, args):
+    """Score one example's answers and build its result row."""
+    is_impossible = len(example['answers']['answer_start']) == 0
+
+    # 3. Calculate Consistency Score
+    # Extra samples drawn for larger --k_values only feed consistency_scores_by_k
+    score = calculate_inconsistency_score(greedy_ans, sampled_ans[:args.num_generations])
+
+    # 4. Abstain Decision (Post-hoc)
+    # We don't decide here, we save the score to analyze trade-offs later.
+    row = {
+        "id": example['id'],
+        "question": example['question'],
+        "is_impossible": is_impossible,
+        "greedy_answer": greedy_ans,
+        "sampled_answers": sampled_ans,
+        "consistency_score": score,
+        "gold_answers": example['answers']['text'] if not is_impossible else []
+    }
+    if args.adaptive:
+        row["num_samples_used"] = len(sampled_ans)
+    if args.k_values:
+        # JSON object keys are strings; adaptive runs may stop below some k
+        ks = [k for k in args.k_values if k <= len(sampled_ans)]
+        by_k = calculate_inconsistency_scores_by_k(greedy_ans, sampled_ans, ks)
+        row["consistency_scores_by_k"] = {str(k): s for k, s in by_k.items()}
+    return row
+
+async def process_group(examples, args, limiter):
+    """
+    Answer several questions about one context with grouped requests: one
+    greedy call and k sampled calls for the whole group, each asking for
+    numbered answers. Any response that does not parse back into one answer
+    per question is redone as single-question requests.
+    """
+    model = args.model_name
+    messages = build_grouped_messages(examples)
+    singles = [build_messages(example) for example in examples]
+    max_tokens = 100 * len(examples)
+    num_samples = max([args.num_generations] + (args.k_values or []))
+
+    greedy_responses, grouped_samples = await asyncio.gather(
+        get_response_async(model, messages, temperature=0.0, max_tokens=max_tokens, limiter=limiter),
+        draw_samples(model, messages, num_samples, max_tokens=max_tokens, limiter=limiter)
+    )
+    calls = 1 + num_samples
+    fallback_calls = 0
+
+    greedy = parse_numbered_answers(greedy_responses[0], len(examples))
+    if greedy is None:
+        fallback_calls += 1
+        greedy = [r[0] for r in await asyncio.gather(*[
+            get_response_async(model, m, temperature=0.0, limiter=limiter) for m in singles
+        ])]
+
+    # Per sample slot j: answers for every question, parsed or re-requested
+    # from the single-question pool at the same slot.
+    slots = [parse_numbered_answers(text, len(examples)) for text in grouped_samples]
+    failed = [j for j, answers in enumerate(slots) if answers is None]
+    fallback_calls += len(failed)
+    redrawn = await asyncio.gather(*[
+        draw_samples(model, m, j + 1, limiter=limiter, start=j) for j in failed for m in singles
+    ])
+    for f, j in enumerate(failed):
+        slots[j] = [sample[0] for sample in redrawn[f * len(singles):(f + 1) * len(singles)]]
+
+    single_tokens = sum(estimate_tokens(m) for m in singles)
+    prompt_token_savings["single"] += single_tokens * calls
+    prompt_token_savings["grouped"] += estimate_tokens(messages) * calls + single_tokens * fallback_calls
+
+    return [
+        build_row(example, greedy[i], [answers[i] for answers in slots], args)
+        for i, example in enumerate(examples)
+    ]
+
+async def process_unit(unit, args, limiter):
+    """Rows for a unit of work: one example, or a group sharing a context."""
+    if len(unit) == 1:
+        return [await process_example(unit[0], args, limiter)]
+    return await process_group(unit, args, limiter)
+
+def write_rows(writer, rows, args, report=print):
+    """Write result rows and feed them to the live metrics; returns the count."""
+    with telemetry.timed("write"):
+        for row in rows:
+            writer.write(row)
+    if live_metrics is not None:
+        for row in rows:
+            live_metrics.update(row["consistency_score"], is_error(row))
+            if live_metrics.n % args.live_every == 0:
+                report(live_metrics.format(args.target_risk))
+    return len(rows)
+
+async def run_examples(eval_data, args, limiter, writer, process=process_unit, desc=None, position=None):
+    """
+    Process examples with at most `args.concurrency` API calls in flight.
+
+    Examples (or context groups, with --group_by_context) are scheduled through a bounded window and each finished row is
+    streamed to `writer` in dataset order, so the results file is identical
+    to a sequential run. Context groups gather questions from across the
+    dataset, so their rows are held back until every earlier example has
+    been written; otherwise nothing accumulates in memory. Examples whose
+    requests fail after all retries are left out of the results and
+    returned separately as failures.
+
+    `process(unit, args, limiter)` returns the rows of a unit (process_unit
+    by default); `desc` and `position` label the progress bar when several
+    runs share the terminal (see experiment_matrix.py).
+    """
+    window = max(2 * args.concurrency, 1)
+    if args.group_by_context:
+        positions = {example['id']: i for i, example in enumerate(eval_data)}
+        units = (([positions[example['id']] for example in unit], unit)
+                 for unit in group_by_context(eval_data, args.group_size))
+    else:
+        units = (([i], [example]) for i, example in enumerate(eval_data))
+    pending = deque()
+    # Rows of finished examples by dataset position, until they can be written.
+    ready = {}
+    next_position = 0
+    written = 0
+    failures = []
+
+    from tqdm import tqdm
+    with tqdm(total=len(eval_data), desc=desc, position=position) as progress:
+        while True:
+            while len(pending) < window:
+                entry = next(units, None)
+                if entry is None:
+                    break
+                unit_positions, unit = entry
+                pending.append((unit_positions, unit, asyncio.create_task(process(unit, args, limiter))))
+            if not pending:
+                break
+
+            unit_positions, unit, task = pending.popleft()
+            try:
+                rows = await task
+            except RequestFailedError as e:
+                for example in unit:
+                    print(f"Example {example['id']} failed: {e}")
+                    failures.append({"id": example['id'], "error": str(e)})
+                ready.update((p, []) for p in unit_positions)
+            else:
+                if len(unit) == 1:
+                    ready[unit_positions[0]] = rows
+                else:
+                    ready.update((p, [row]) for p, row in zip(unit_positions, rows))
+            while next_position in ready:
+                written += write_rows(writer, ready.pop(next_position), args, progress.write)
+                next_position += 1
+            progress.set_postfix(telemetry.live(), refresh=False)
+            progress.update(len(unit))
+
+    return written, failures
 
 def run_experiment(args):
-    print(f"Starting experiment with model: {args.model_name}")
+    print(f"Starting experiment with model: {', '.join(args.models) if args.models else args.model_name}")
     
     # Load Dataset
     # Try loading from local disk first, else download
+    # (local copies are memory-mapped directly, without importing datasets)
+    local = os.path.exists(args.dataset_path)
     try:
-        if os.path.exists(args.dataset_path):
+        if local:
             print(f"Loading local dataset from {args.dataset_path}")
-            dataset = load_from_disk(args.dataset_path)
+            eval_data = ArrowSplit.load(args.dataset_path, "validation")
         else:
             print("Local dataset not found, loading from HuggingFace...")
-            dataset = load_dataset("squad_v2")
+            from datasets import load_dataset
+            eval_data = load_dataset("squad_v2")['validation']
     except Exception as e:
         print(f"Error loading dataset: {e}")
         return
 
-    # Select validation set
-    eval_data = dataset['validation']
+    # Select validation set. Examples are chosen by position from the ids
+    # (and strata) of the memory-mapped dataset index, then selected once.
+    dataset_index = load_index(args.dataset_path, "validation") if local else None
+    ids = dataset_index.column("id").to_pylist() if dataset_index is not None else eval_data['id']
+    positions = list(range(len(ids)))
     if args.num_samples > 0:
-        eval_data = eval_data.select(range(args.num_samples))
-    
-    results = []
-    
-    print(f"Evaluating {len(eval_data)} samples...")
-    
-    for i, example in enumerate(tqdm(eval_data)):
-        question = example['question']
-        context = example['context']
-        is_impossible = len(example['answers']['answer_start']) == 0
-        
-        # Construct Prompt
-        # We ask the model to answer the question based on the context.
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant. Read the context and answer the question. If the question cannot be answered from the context, answer very briefly with your best guess or what you think is true, but do not say 'I don't know' yet."},
-            {"role": "user", "content": f"Context: {context}\n\nQuestion: {question}\n\nAnswer:"}
-        ]
-        
-        # 1. Greedy Generation (Temp=0)
-        greedy_responses = get_response(args.model_name, messages, temperature=0.0, n=1)
-        greedy_ans = greedy_responses[0]
-        
-        # 2. Stochastic Sampling (Temp=0.7)
-        # We need N samples. Some APIs don't support n>1 efficiently or at all on some models.
-        # We will loop if necessary, but OpenRouter usually supports n.
-        # To be safe and generic with OpenRouter models (some ignore n), we loop.
-        sampled_ans = []
-        for _ in range(args.num_generations):
-             resp = get_response(args.model_name, messages, temperature=0.7, n=1)
-             sampled_ans.append(resp[0])
-             
-        # 3. Calculate Consistency Score
-        score = calculate_inconsistency_score(greedy_ans, sampled_ans)
-        
-        # 4. Abstain Decision (Post-hoc)
-        # We don't decide here, we save the score to analyze trade-offs later.
-        
-        results.append({
-            "id": example['id'],
-            "question": question,
-            "is_impossible": is_impossible,
-            "greedy_answer": greedy_ans,
-            "sampled_answers": sampled_ans,
-            "consistency_score": score,
-            "gold_answers": example['answers']['text'] if not is_impossible else []
-        })
-        
-        # Save intermediate
-        if (i + 1) % 10 == 0:
-            with open(f"results/{args.output_file}", "w") as f:
-                json.dump(results, f, indent=2)
-
-    # Final Save
-    os.makedirs("results", exist_ok=True)
+        if args.stratified:
+            if dataset_index is None:
+                print("--stratified needs a local dataset (--dataset_path)")
+                return
+            positions = stratified_sample(dataset_index, args.num_samples, seed=args.sample_seed).tolist()
+        else:
+            positions = positions[:args.num_samples]
+
     output_path = f"results/{args.output_file}"
-    with open(output_path, "w") as f:
-        json.dump(results, f, indent=2)
-    print(f"Saved results to {output_path}")
+    manifest = None
+    if args.shard:
+        index, num_shards = args.shard
+        total = len(positions)
+        positions = [positions[k] for k in shard_positions([ids[p] for p in positions], index, num_shards)]
+        output_path = shard_path(output_path, index, num_shards)
+        manifest = {
+            "shard": index, "num_shards": num_shards, "dataset_path": args.dataset_path,
+            "num_samples": args.num_samples, "stratified": args.stratified, "sample_seed": args.sample_seed,
+            "model_name": args.model_name, "ids": [ids[p] for p in positions], "positions": positions, "status": "running",
+        }
+        write_manifest(output_path, manifest)
+        print(f"Shard {index}/{num_shards}: {len(positions)} of {total} examples -> {output_path}")
 
-if __name__ == "__main__":
+    if args.resume:
+        done = completed_ids(output_path)
+        if done:
+            positions = [p for p in positions if ids[p] not in done]
+            print(f"Resuming: {len(done)} examples already in {output_path}")
+
+    if len(positions) < len(eval_data):
+        eval_data = eval_data.select(positions)
+
+    print(f"Evaluating {len(eval_data)} samples (concurrency={args.concurrency})...")
+
+    global client, async_client, rate_limiter, response_cache, telemetry, hedger, overprovision, native_n, live_metrics
+    if args.base_url:
+        print(f"Sending requests to {args.base_url}")
+        client, async_client = make_clients(args.base_url)
+    else:
+        try:
+            ensure_clients()
+        except RuntimeError as e:
+            print(e)
+            return
+    if not args.no_cache:
+        response_cache = ResponseCache(args.cache_path)
+        max_bytes = args.cache_max_mb * 1024 * 1024 if args.cache_max_mb else None
+        max_age = args.cache_max_age_days * 86400 if args.cache_max_age_days else None
+        if max_bytes or max_age:
+            print(f"Evicted {response_cache.evict(max_bytes, max_age)} cached responses")
+    rate_limiter = RateLimiter(
+        requests_per_second=args.requests_per_second,
+        tokens_per_minute=args.tokens_per_minute,
+        max_concurrency=args.concurrency,
+        max_retries=args.max_retries
+    )
+    hedger = Hedger(args.hedge_percentile, args.hedge_budget) if args.hedge_percentile else None
+    overprovision = args.overprovision
+    native_n = not args.no_native_n
+    live_metrics = IncrementalMetrics() if args.live_every else None
+    telemetry = Telemetry()
+    if args.otel:
+        telemetry.add_hook(OpenTelemetryHook())
+    if args.models:
+        from experiment_matrix import run_matrix
+        run_matrix(eval_data, args, output_path)
+        return
+    with ResultWriter(output_path, append=args.resume) as writer:
+        if args.batch:
+            from batch_jobs import run_batch
+            written, failures = run_batch(eval_data, args, writer, os.path.splitext(output_path)[0])
+        else:
+            written, failures = asyncio.run(run_examples(eval_data, args, rate_limiter, writer))
+    if not args.batch:
+        print(f"Rate limiter: {rate_limiter.summary()}")
+    if live_metrics is not None and live_metrics.n:
+        print(f"Live metrics: {live_metrics.format(args.target_risk)}")
+        telemetry.annotate("live_metrics", live_metrics.summary(args.target_risk))
+    if hedger is not None:
+        print(f"Hedging: {hedger.summary()}")
+        telemetry.annotate("hedging", hedger.summary())
+    telemetry_path = f"{os.path.splitext(output_path)[0]}_telemetry.json"
+    telemetry.write(telemetry_path)
+    latency = telemetry.summary()["latency"]
+    if latency["count"]:
+        print(f"API latency p50/p95/p99: {latency['p50']:.3f}/{latency['p95']:.3f}/{latency['p99']:.3f}s "
+              f"over {latency['count']} calls; telemetry saved to {telemetry_path}")
+    if response_cache is not None:
+        print(f"Response cache: {response_cache.summary()}")
+    print(f"Saved {written} results to {output_path}")
+    if prompt_token_savings["single"]:
+        saved = prompt_token_savings["single"] - prompt_token_savings["grouped"]
+        print(f"Context grouping saved ~{saved} input tokens ({saved / prompt_token_savings['single']:.1%} of prompt tokens, estimated)")
+
+    if args.columnar and written:
+        columnar_path = f"{os.path.splitext(output_path)[0]}.{args.columnar}"
+        convert_results(output_path, columnar_path)
+        print(f"Columnar copy for analysis: {columnar_path}")
+
+    if manifest is not None:
+        manifest.update(status="complete", written=written, failed=len(failures))
+        write_manifest(output_path, manifest)
+
+    if failures:
+        failures_path = f"{os.path.splitext(output_path)[0]}_failures.json"
+        with open(failures_path, "w") as f:
+            json.dump(failures, f, indent=2)
+        print(f"{len(failures)} examples failed and were not scored; see {failures_path}")
+
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("--model_name", type=str, default="meta-llama/llama-3-8b-instruct", help="OpenRouter model ID")
     parser.add_argument("--dataset_path", type=str, default="datasets/squad_v2", help="Path to local dataset")
     parser.add_argument("--num_samples", type=int, default=50, help="Number of samples to run")
+    parser.add_argument("--stratified", action="store_true",
+                        help="Draw the num_samples examples at random, keeping the answerable/unanswerable mix of the split")
+    parser.add_argument("--sample_seed", type=int, default=0, help="Seed for --stratified sampling")
     parser.add_argument("--num_generations", type=int, default=3, help="Number of samples for consistency")
-    parser.add_argument("--output_file", type=str, default="experiment_results.json")
-    
-    args = parser.parse_args()
+    parser.add_argument("--output_file", type=str, default="experiment_results.jsonl")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Stop sampling once the abstain decision is settled (num_generations is the max k)")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Abstention threshold used by adaptive sampling")
+    parser.add_argument("--confidence", type=float, default=0.9, help="Posterior confidence required to stop sampling early")
+    parser.add_argument("--round_size", type=int, default=2, help="Samples drawn per adaptive round")
+    parser.add_argument("--group_by_context", action="store_true",
+                        help="Pack questions sharing a context into one numbered multi-question request")
+    parser.add_argument("--group_size", type=int, default=5, help="Maximum questions per grouped request")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Run only shard i of N (0-based, e.g. 0/4), chosen by id hash; merge with sharding.py")
+    parser.add_argument("--columnar", choices=["arrow", "parquet"], default=None,
+                        help="Also write the results as a memory-mappable .arrow or a .parquet file")
+    parser.add_argument("--batch", action="store_true",
+                        help="Submit all requests as batch jobs (OpenAI-style /batches endpoint) instead of calling interactively")
+    parser.add_argument("--batch_poll_seconds", type=float, default=30.0, help="Seconds between batch job status checks")
+    parser.add_argument("--batch_max_requests", type=int, default=50000, help="Requests per batch input file (OpenAI allows 50,000)")
+    parser.add_argument("--batch_rounds", type=int, default=3,
+                        help="Batch rounds; failed or short requests from one round are resubmitted in the next")
+    parser.add_argument("--resume", action="store_true", help="Append to an existing results file, skipping ids already done")
+    parser.add_argument("--k_values", type=lambda v: [int(k) for k in v.split(",")], default=None,
+                        help="Comma-separated sample counts (e.g. 3,5,10,20) to score from one shared sample pool; "
+                             "consistency_score still uses the first --num_generations samples")
+    parser.add_argument("--concurrency", type=int, default=1, help="Maximum number of API requests in flight")
+    parser.add_argument("--requests_per_second", type=float, default=None, help="Client-side request rate limit")
+    parser.add_argument("--tokens_per_minute", type=float, default=None, help="Client-side token rate limit")
+    parser.add_argument("--cache_path", type=str, default="results/response_cache.sqlite", help="SQLite file caching API responses")
+    parser.add_argument("--no_cache", action="store_true", help="Always query the API, bypassing the response cache")
+    parser.add_argument("--cache_max_mb", type=float, default=None, help="Evict oldest cached responses beyond this size")
+    parser.add_argument("--cache_max_age_days", type=float, default=None, help="Evict cached responses older than this")
+    parser.add_argument("--base_url", type=str, default=None,
+                        help="OpenAI-compatible endpoint to use instead of OpenRouter (e.g. a local mock_llm_server.py)")
+    parser.add_argument("--hedge_percentile", type=float, default=None,
+                        help="Duplicate calls still running past this percentile of recent latencies (e.g. 95)")
+    parser.add_argument("--hedge_budget", type=float, default=0.05, help="Maximum fraction of calls that may be hedged")
+    parser.add_argument("--overprovision", type=int, default=0,
+                        help="Extra sampled calls per draw; the first k to return are kept and the rest cancelled")
+    parser.add_argument("--no_native_n", action="store_true",
+                        help="Never ask for several choices per request (skip probing models for n support)")
+    parser.add_argument("--live_every", type=int, default=0,
+                        help="Print running error rate, AUC, AURC and a recommended threshold every N results")
+    parser.add_argument("--target_risk", type=float, default=0.1, help="Risk the recommended threshold must stay within")
+    parser.add_argument("--otel", action="store_true", help="Export API call spans through OpenTelemetry (needs opentelemetry-api)")
+    parser.add_argument("--max_retries", type=int, default=5, help="Attempts per request before it is reported as failed")
+    parser.add_argument("--models", type=lambda v: v.split(","), default=None,
+                        help="Comma-separated model IDs to run as a model x temperature x k matrix over one dataset load "
+                             "(replaces --model_name; --k_values become matrix cells)")
+    parser.add_argument("--temperatures", type=lambda v: [float(t) for t in v.split(",")], default=[0.7],
+                        help="Comma-separated sampling temperatures of the --models matrix")
+    parser.add_argument("--model_limits", type=parse_model_limits, default={},
+                        help="Per-model limits for --models as MODEL=CONCURRENCY[:REQUESTS_PER_SECOND[:TOKENS_PER_MINUTE]],...; "
+                             "other models get --concurrency, --requests_per_second and --tokens_per_minute")
+
+    args = parser.parse_args(argv)
+    if args.group_by_context and args.adaptive:
+        parser.error("--adaptive cannot be combined with --group_by_context")
+    if args.batch and (args.adaptive or args.group_by_context):
+        parser.error("--batch cannot be combined with --adaptive or --group_by_context")
+    if args.models and (args.batch or args.adaptive or args.group_by_context or args.shard or args.resume or args.live_every):
+        parser.error("--models cannot be combined with --batch, --adaptive, --group_by_context, --shard, --resume or --live_every")
     run_experiment(args)
+
+if __name__ == "__main__":
+    # batch_jobs and experiment_matrix import this module by name; let them
+    # share the script's clients, cache and telemetry.
+    sys.modules.setdefault("experiment_runner", sys.modules[__name__])
+    main()
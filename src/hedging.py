@@ -0,0 +1,121 @@
+import asyncio
+from collections import deque
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    # Let cancelled calls run their cleanup (e.g. releasing limiter slots).
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def first_completed(factories, count):
+    """
+    Start every coroutine factory at once and return the results of the
+    first `count` to succeed, in completion order; the rest are cancelled.
+    Failures are tolerated while enough calls are left to reach `count`,
+    otherwise the first error is raised.
+    """
+    tasks = [asyncio.ensure_future(factory()) for factory in factories]
+    count = min(count, len(tasks))
+    results = []
+    errors = []
+    pending = set(tasks)
+    try:
+        while len(results) < count:
+            if len(results) + len(pending) < count:
+                raise errors[0]
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task in done:
+                    if task.exception() is None:
+                        results.append(task.result())
+                    else:
+                        errors.append(task.exception())
+        return results[:count]
+    finally:
+        await _cancel([task for task in tasks if not task.done()])
+
+
+class Hedger:
+    """
+    Hedged requests for tail latency.
+
+    A call that has not returned after the `percentile`-th latency of the
+    last `window` completed calls gets a duplicate; whichever succeeds
+    first is used and the other is cancelled. Hedging starts once
+    `min_samples` latencies are known, and at most `budget` (a fraction)
+    of calls may be hedged, which bounds the extra cost.
+
+    Latencies are those of the original calls only. An original cancelled
+    because its duplicate won is recorded with the time it had run, a
+    lower bound; leaving the slow calls out would pull the percentile
+    down and make hedging ever more frequent.
+    """
+
+    def __init__(self, percentile=95, budget=0.05, window=200, min_samples=20, clock=None):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.clock = clock
+        self.stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "over_budget": 0}
+
+    def _now(self):
+        return (self.clock or asyncio.get_running_loop().time)()
+
+    def trigger_delay(self):
+        """Seconds after which a call is hedged (None until enough samples)."""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return ordered[index]
+
+    async def _timed(self, factory):
+        start = self._now()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            self.latencies.append(self._now() - start)
+            raise
+        self.latencies.append(self._now() - start)
+        return result
+
+    async def run(self, factory, hedge_factory=None):
+        """
+        Await `factory()`, hedging it with a second call if it runs late.
+        The duplicate is `hedge_factory()` when given (e.g. the same request
+        under its own rate limiter budget), otherwise `factory()`.
+        """
+        self.stats["calls"] += 1
+        primary = asyncio.ensure_future(self._timed(factory))
+        delay = self.trigger_delay()
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        if self.stats["hedges"] + 1 > self.budget * self.stats["calls"]:
+            self.stats["over_budget"] += 1
+            return await primary
+
+        self.stats["hedges"] += 1
+        hedge = asyncio.ensure_future((hedge_factory or factory)())
+        tasks = [primary, hedge]
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.stats["hedge_wins"] += int(task is hedge)
+                        return task.result()
+            raise primary.exception()
+        finally:
+            await _cancel([task for task in tasks if not task.done()])
+
+    def summary(self):
+        delay = self.trigger_delay()
+        return dict(self.stats, trigger_seconds=round(delay, 4) if delay is not None else None)
@@ -0,0 +1,63 @@
+import os
+import json
+import time
+import argparse
+from selective_metrics import IncrementalMetrics
+from answer_matching import is_error
+
+
+def follow(path, follow=True, interval=5.0, poll=0.5, target_risk=0.1, num_bins=1000):
+    """
+    Feed a JSONL results file into IncrementalMetrics, printing a status
+    line every `interval` seconds. With `follow`, keep waiting for new rows
+    (like `tail -f`) until interrupted; a file that shrinks (a fresh run
+    started over it) resets the metrics. Returns the final metrics.
+    """
+    metrics = IncrementalMetrics(num_bins)
+    while follow and not os.path.exists(path):
+        time.sleep(poll)
+    last_print = time.monotonic()
+    partial = ""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            while True:
+                line = f.readline()
+                if line:
+                    if not line.endswith("\n"):
+                        # The writer is mid-line; wait for the rest of it.
+                        partial += line
+                        continue
+                    line, partial = partial + line, ""
+                    if line.strip():
+                        row = json.loads(line)
+                        metrics.update(row["consistency_score"], is_error(row))
+                elif not follow:
+                    break
+                else:
+                    if os.path.getsize(path) < f.tell():
+                        print("Results file was truncated; restarting metrics")
+                        f.seek(0)
+                        metrics, partial = IncrementalMetrics(num_bins), ""
+                    time.sleep(poll)
+                if follow and time.monotonic() - last_print >= interval:
+                    print(metrics.format(target_risk), flush=True)
+                    last_print = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    print(metrics.format(target_risk))
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Running metrics over a (possibly still growing) JSONL results file")
+    parser.add_argument("results_file", type=str)
+    parser.add_argument("--follow", action="store_true", help="Keep reading rows as the runner appends them (Ctrl-C to stop)")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between status lines in follow mode")
+    parser.add_argument("--target_risk", type=float, default=0.1, help="Risk the recommended threshold must stay within")
+    parser.add_argument("--num_bins", type=int, default=1000, help="Score histogram bins")
+    parser.add_argument("--json", action="store_true", help="Print the final metrics as JSON")
+    args = parser.parse_args()
+
+    final = follow(args.results_file, args.follow, args.interval, target_risk=args.target_risk, num_bins=args.num_bins)
+    if args.json:
+        print(json.dumps(final.summary(args.target_risk), indent=2))
@@ -0,0 +1,389 @@
+import os
+import json
+import math
+import time
+import zlib
+import argparse
+import numpy as np
+
+# Permutations are h(x) = ((a * x + b) mod PRIME) & MAX_HASH over 32-bit CRC
+# shingle hashes; with a, b < 2^32 the product never overflows uint64.
+PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+# Signature of an empty answer (no shingles).
+EMPTY = np.uint32(0xFFFFFFFF)
+# Shingle entries permuted per step; bounds the (entries x num_perm) matrix.
+CHUNK_ENTRIES = 16384
+# Texts whose distinct shingles are permuted together.
+TEXT_BATCH = 20000
+# Signature values compared per step when scoring.
+CHUNK_VALUES = 1 << 22
+
+
+def shingles(text, size=1):
+    """
+    Word `size`-grams of the lowercased text. Size 1 gives the token set the
+    exact scorer uses; answers shorter than `size` words are one shingle.
+    """
+    tokens = text.lower().split() if text else []
+    if size <= 1:
+        return set(tokens)
+    if len(tokens) <= size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+class MinHasher:
+    """
+    MinHash signatures of word-shingle sets: the minimum of each of
+    `num_perm` universal hash permutations over the set's shingle hashes.
+    The fraction of positions where two signatures agree is an unbiased
+    estimate of the Jaccard similarity of the two sets.
+    """
+
+    def __init__(self, num_perm=128, shingle_size=1, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+
+    def params(self):
+        return [self.num_perm, self.shingle_size, self.seed]
+
+    def permute(self, hashes):
+        """(num_perm, len(hashes)) uint32 permuted values of 32-bit shingle hashes."""
+        permuted = np.empty((self.num_perm, len(hashes)), dtype=np.uint32)
+        for first in range(0, len(hashes), CHUNK_ENTRIES):
+            chunk = hashes[first:first + CHUNK_ENTRIES]
+            permuted[:, first:first + CHUNK_ENTRIES] = ((self.a[:, None] * chunk + self.b[:, None]) % PRIME) & MAX_HASH
+        return permuted
+
+    def signatures(self, texts):
+        """
+        (len(texts), num_perm) uint32 signatures; empty texts get all-EMPTY
+        rows. Texts are hashed TEXT_BATCH at a time: each distinct shingle of
+        a batch is permuted once, then every text takes the minimum over the
+        columns of its shingles.
+        """
+        signatures = np.full((len(texts), self.num_perm), EMPTY, dtype=np.uint32)
+        for batch_start in range(0, len(texts), TEXT_BATCH):
+            batch = texts[batch_start:batch_start + TEXT_BATCH]
+            sets = [shingles(t, self.shingle_size) for t in batch]
+            lengths = np.fromiter(map(len, sets), dtype=np.int64, count=len(sets))
+            vocab = {}
+            ids = np.fromiter((vocab.setdefault(s, len(vocab)) for shingle_set in sets for s in shingle_set),
+                              dtype=np.int64, count=int(lengths.sum()))
+            permuted = self.permute(np.fromiter((zlib.crc32(s.encode("utf-8")) for s in vocab),
+                                                dtype=np.uint64, count=len(vocab)))
+            rows = np.flatnonzero(lengths)
+            ends = np.cumsum(lengths[rows])
+            starts = ends - lengths[rows]
+            first = 0
+            while first < rows.size:
+                # Whole texts of about CHUNK_ENTRIES shingles at a time.
+                last = max(int(np.searchsorted(ends, starts[first] + CHUNK_ENTRIES, side="right")), first + 1)
+                low, high = starts[first], ends[last - 1]
+                minima = np.minimum.reduceat(permuted.take(ids[low:high], axis=1), starts[first:last] - low, axis=1)
+                signatures[batch_start + rows[first:last]] = minima.T
+                first = last
+        return signatures
+
+
+class SignatureStore:
+    """
+    Signatures of answer texts, each distinct text hashed once and kept, so
+    rescoring (another k, another scorer) reuses them. Saved to and loaded
+    from an .npz file next to the results.
+    """
+
+    def __init__(self, hasher=None):
+        self.hasher = hasher or MinHasher()
+        self.index = {}
+        self.matrix = np.zeros((0, self.hasher.num_perm), dtype=np.uint32)
+
+    def rows(self, texts):
+        """Row of each text in `matrix`, hashing only texts not stored yet."""
+        missing = [t for t in dict.fromkeys(texts) if t not in self.index]
+        if missing:
+            base = len(self.index)
+            self.index.update((t, base + i) for i, t in enumerate(missing))
+            self.matrix = np.concatenate([self.matrix, self.hasher.signatures(missing)])
+        return np.fromiter(map(self.index.__getitem__, texts), dtype=np.int64, count=len(texts))
+
+    def save(self, path):
+        np.savez(path, signatures=self.matrix, texts=np.array(json.dumps(list(self.index))),
+                 params=np.array(self.hasher.params()))
+
+    @classmethod
+    def load(cls, path, num_perm=128, shingle_size=1, seed=1):
+        """Store saved at `path`; empty if the file is missing or was made with other parameters."""
+        store = cls(MinHasher(num_perm, shingle_size, seed))
+        if os.path.exists(path):
+            with np.load(path) as data:
+                if data["params"].tolist() == store.hasher.params():
+                    store.index = {t: i for i, t in enumerate(json.loads(str(data["texts"])))}
+                    store.matrix = data["signatures"]
+        return store
+
+
+def _answers(greedy_answers, sampled_answers, store):
+    """
+    Signatures of every question's answers (greedy first, then its samples)
+    as int64 rows, question-major, with the question of each row. Empty
+    answers get unique negative values, so they agree with nothing.
+    """
+    n = len(greedy_answers)
+    num_samples = np.fromiter(map(len, sampled_answers), dtype=np.int64, count=n)
+    texts = []
+    for greedy, samples in zip(greedy_answers, sampled_answers):
+        texts.append(greedy)
+        texts.extend(samples)
+    rows = store.rows(texts)
+    raw = store.matrix[rows]
+    signatures = raw.astype(np.int64)
+    empty = np.flatnonzero((raw == EMPTY).all(axis=1))
+    signatures[empty] = -1 - empty[:, None]
+    return signatures, np.repeat(np.arange(n), num_samples + 1), num_samples
+
+
+def minhash_scores(greedy_answers, sampled_answers, store=None):
+    """
+    MinHash estimate of calculate_inconsistency_scores: one minus the mean
+    estimated Jaccard similarity of the greedy answer to each sample (same
+    conventions for empty answers and missing samples). O(N k num_perm).
+
+    Only faster than the exact scorer once signatures are in `store`:
+    scoring long answers from stored signatures is about 20x faster, but
+    hashing them first costs about twice one exact pass. It pays off when
+    rescoring (other k, other scorers, reruns with --signature_cache).
+    """
+    store = store or SignatureStore()
+    n = len(greedy_answers)
+    num_samples = np.fromiter(map(len, sampled_answers), dtype=np.int64, count=n)
+    greedy_rows = store.rows(greedy_answers)
+    sample_rows = store.rows([s for row in sampled_answers for s in row])
+    greedy, samples = store.matrix[greedy_rows], store.matrix[sample_rows]
+    pair_row = np.repeat(np.arange(n), num_samples)
+
+    overlap = np.zeros(pair_row.size)
+    step = max(CHUNK_VALUES // store.hasher.num_perm, 1)
+    for start in range(0, pair_row.size, step):
+        chunk = slice(start, start + step)
+        overlap[chunk] = (greedy[pair_row[chunk]] == samples[chunk]).mean(axis=1)
+    overlap[(samples == EMPTY).all(axis=1)] = 0.0
+    total = np.bincount(pair_row, weights=overlap, minlength=n)
+
+    scores = np.zeros(n)
+    has_samples = num_samples > 0
+    scores[has_samples] = 1.0 - total[has_samples] / num_samples[has_samples]
+    scores[(greedy == EMPTY).all(axis=1)] = 1.0 # Empty answer is suspicious/uncertain
+    return scores
+
+
+def _blocks(signatures, num_samples, width):
+    """
+    (questions, block) for questions with at least one sample, grouped by
+    answer count m: block holds their signatures as (questions, m, width).
+    """
+    counts = num_samples + 1
+    starts = np.cumsum(counts) - counts
+    for m in np.unique(counts[counts > 1]):
+        questions = np.flatnonzero(counts == m)
+        step = max(CHUNK_VALUES // (m * width), 1)
+        for first in range(0, questions.size, step):
+            chunk = questions[first:first + step]
+            yield chunk, signatures[starts[chunk][:, None] + np.arange(m)]
+
+
+def _run_starts(ordered):
+    """Mask of the first element of each run of equal values along the last axis."""
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[..., 1:] = ordered[..., 1:] != ordered[..., :-1]
+    return starts
+
+
+def _empty_greedy(signatures, num_samples):
+    return signatures[np.cumsum(num_samples + 1) - num_samples - 1, 0] < 0
+
+
+def pairwise_scores(greedy_answers, sampled_answers, store=None):
+    """
+    One minus the mean estimated Jaccard similarity over all pairs of a
+    question's k+1 answers (samples compared with each other as well as
+    with the greedy answer). An empty greedy answer scores 1.0 and a
+    question without samples 0.0, as in the exact scorer.
+
+    The sum over pairs comes from collision counts: in each permutation,
+    answers sharing a minimum value agree there, so sorting the k+1 values
+    and counting equal runs gives every pair's agreement in
+    O(k log k num_perm) per question instead of comparing all pairs.
+    Unlike minhash_scores this wins even with signatures hashed from
+    scratch: exact pairwise Jaccard is O(k^2) set comparisons.
+    """
+    store = store or SignatureStore()
+    num_perm = store.hasher.num_perm
+    signatures, _, num_samples = _answers(greedy_answers, sampled_answers, store)
+    scores = np.zeros(len(greedy_answers))
+    for chunk, block in _blocks(signatures, num_samples, num_perm):
+        m = block.shape[1]
+        ordered = np.sort(block.transpose(0, 2, 1), axis=2)
+        position = np.arange(m)
+        # Each answer agrees with the earlier answers of its run.
+        earlier = position - np.maximum.accumulate(np.where(_run_starts(ordered), position, 0), axis=2)
+        scores[chunk] = 1.0 - earlier.sum(axis=(1, 2)) / num_perm / (m * (m - 1) / 2)
+    scores[_empty_greedy(signatures, num_samples)] = 1.0 # Empty answer is suspicious/uncertain
+    return scores
+
+
+def cluster_scores(greedy_answers, sampled_answers, store=None, bands=32):
+    """
+    Normalized entropy of the clusters a question's k+1 answers fall into:
+    0.0 when all agree, 1.0 when every answer stands alone (an empty greedy
+    answer scores 1.0 and a question without samples 0.0).
+
+    Clusters come from LSH banding: signatures are cut into `bands` bands,
+    answers whose values are identical in some band are linked, and
+    clusters are the connected components, found by propagating the
+    smallest answer index through each band's buckets. Answers with
+    Jaccard similarity s share a bucket with probability
+    1 - (1 - s^r)^bands for r = num_perm / bands rows per band (0.5 and
+    above link almost surely for 128 permutations in 32 bands). Buckets
+    come from sorting each band's k+1 keys, so the cost is close to linear
+    in k.
+    """
+    store = store or SignatureStore()
+    rows_per_band = max(store.hasher.num_perm // bands, 1)
+    bands = store.hasher.num_perm // rows_per_band
+    weights = np.random.default_rng(0).integers(1, 1 << 62, rows_per_band, dtype=np.uint64)
+    signatures, _, num_samples = _answers(greedy_answers, sampled_answers, store)
+    scores = np.zeros(len(greedy_answers))
+    for chunk, block in _blocks(signatures, num_samples, store.hasher.num_perm):
+        c, m, _ = block.shape
+        band_values = block[:, :, :bands * rows_per_band].reshape(c, m, bands, rows_per_band)
+        keys = (band_values.view(np.uint64) * weights).sum(axis=3).transpose(0, 2, 1)
+        order = np.argsort(keys, axis=2)
+        heads = np.flatnonzero(_run_starts(np.take_along_axis(keys, order, axis=2)))
+        lengths = np.diff(np.append(heads, keys.size))
+
+        labels = np.broadcast_to(np.arange(m), (c, m)).copy()
+        while True:
+            ordered = np.take_along_axis(np.broadcast_to(labels[:, None, :], keys.shape), order, axis=2)
+            smallest = np.repeat(np.minimum.reduceat(ordered.ravel(), heads), lengths).reshape(keys.shape)
+            linked = np.empty_like(smallest)
+            np.put_along_axis(linked, order, smallest, axis=2)
+            updated = np.minimum(labels, linked.min(axis=1))
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+
+        sizes = np.bincount((np.arange(c)[:, None] * m + labels).ravel(), minlength=c * m).reshape(c, m)
+        share = sizes / m
+        entropy = -np.sum(np.where(sizes > 0, share * np.log(np.where(sizes > 0, share, 1.0)), 0.0), axis=1)
+        scores[chunk] = entropy / np.log(m) + 0.0
+    scores[_empty_greedy(signatures, num_samples)] = 1.0 # Empty answer is suspicious/uncertain
+    return scores
+
+
+SCORERS = {
+    "minhash": minhash_scores,
+    "minhash_pairwise": pairwise_scores,
+    "minhash_cluster": cluster_scores,
+}
+
+
+def agreement_matrix(answers, store=None):
+    """Estimated Jaccard similarity of every pair of `answers` (m x m; empty answers agree with nothing)."""
+    store = store or SignatureStore()
+    signatures, _, _ = _answers(answers[:1], [answers[1:]], store)
+    return (signatures[:, None, :] == signatures[None, :, :]).mean(axis=2)
+
+
+def exact_pairwise_scores(greedy_answers, sampled_answers):
+    """pairwise_scores computed from exact token-set Jaccard over all pairs (reference only, O(k^2))."""
+    scores = []
+    for greedy, samples in zip(greedy_answers, sampled_answers):
+        sets = [set(a.lower().split()) if a else set() for a in [greedy, *samples]]
+        if not sets[0]:
+            scores.append(1.0)
+            continue
+        if len(sets) < 2:
+            scores.append(0.0)
+            continue
+        pairs = [len(x & y) / len(x | y) if x and y else 0.0
+                 for i, x in enumerate(sets) for y in sets[i + 1:]]
+        scores.append(1.0 - sum(pairs) / len(pairs))
+    return np.array(scores)
+
+
+def error_bound(num_perm, num_pairs=1, delta=0.05):
+    """
+    Hoeffding bound: with probability at least 1 - delta, each of
+    `num_pairs` MinHash similarity estimates is within this of the exact
+    Jaccard similarity, and so is any average of them (a question's score).
+    """
+    return math.sqrt(math.log(2 * max(num_pairs, 1) / delta) / (2 * num_perm))
+
+
+def compare_to_exact(greedy_answers, sampled_answers, store=None, delta=0.05):
+    """
+    Error and timing of the MinHash scorers against their exact
+    counterparts (shingle size 1, the exact scorer's token sets).
+    Returns {"minhash": {...}, "minhash_pairwise": {...}}.
+    """
+    from scoring_utils import calculate_inconsistency_scores
+    store = store or SignatureStore()
+    started = time.perf_counter()
+    store.rows([a for greedy, samples in zip(greedy_answers, sampled_answers) for a in [greedy, *samples]])
+    signature_seconds = time.perf_counter() - started
+    max_k = max(map(len, sampled_answers), default=0)
+    report = {}
+    for name, exact_scorer, num_pairs in (
+            ("minhash", calculate_inconsistency_scores, max_k),
+            ("minhash_pairwise", exact_pairwise_scores, (max_k + 1) * max_k // 2)):
+        started = time.perf_counter()
+        exact = np.asarray(exact_scorer(greedy_answers, sampled_answers))
+        exact_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        approx = SCORERS[name](greedy_answers, sampled_answers, store)
+        approx_seconds = time.perf_counter() - started
+        errors = np.abs(approx - exact)
+        bound = error_bound(store.hasher.num_perm, num_pairs, delta)
+        report[name] = {
+            "questions": len(errors),
+            "mean_abs_error": float(errors.mean()) if errors.size else 0.0,
+            "p95_abs_error": float(np.quantile(errors, 0.95)) if errors.size else 0.0,
+            "max_abs_error": float(errors.max()) if errors.size else 0.0,
+            "bound": bound,
+            "delta": delta,
+            "within_bound": float(np.mean(errors <= bound)) if errors.size else 1.0,
+            "exact_seconds": exact_seconds,
+            "minhash_seconds": approx_seconds,
+            "signature_seconds": signature_seconds,
+        }
+    return report
+
+
+if __name__ == "__main__":
+    from results_io import read_columns
+    parser = argparse.ArgumentParser(description="Measure MinHash consistency scores against the exact scorer on a results file")
+    parser.add_argument("input_file", type=str, help="JSONL, .arrow or .parquet results")
+    parser.add_argument("--num_perm", type=int, default=128, help="MinHash permutations per signature")
+    parser.add_argument("--k", type=int, default=None, help="Use only the first k sampled answers")
+    parser.add_argument("--delta", type=float, default=0.05, help="Failure probability of the reported error bound")
+    parser.add_argument("--signature_cache", type=str, default=None, help="Load/save answer signatures in this .npz file")
+    args = parser.parse_args()
+
+    data = read_columns(args.input_file, ["greedy_answer", "sampled_answers"])
+    samples = [s[:args.k] for s in data["sampled_answers"]] if args.k is not None else list(data["sampled_answers"])
+    store = (SignatureStore.load(args.signature_cache, args.num_perm) if args.signature_cache
+             else SignatureStore(MinHasher(args.num_perm)))
+    for name, entry in compare_to_exact(list(data["greedy_answer"]), samples, store, args.delta).items():
+        print(f"{name}: mean |error| {entry['mean_abs_error']:.4f}, p95 {entry['p95_abs_error']:.4f}, "
+              f"max {entry['max_abs_error']:.4f}; {entry['within_bound']:.2%} within the {1 - args.delta:.0%} "
+              f"bound {entry['bound']:.4f}; exact {entry['exact_seconds']:.3f}s vs minhash {entry['minhash_seconds']:.3f}s "
+              f"(+{entry['signature_seconds']:.3f}s signatures) over {entry['questions']} questions")
+    if args.signature_cache:
+        store.save(args.signature_cache)
+        print(f"Signatures saved to {args.signature_cache}")
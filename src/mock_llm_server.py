@@ -0,0 +1,404 @@
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict, defaultdict
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORD_RE = re.compile(r"\w+")
+# Prompts whose draw count is remembered; the least recently used are forgotten.
+MAX_TRACKED_PROMPTS = 100_000
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+STOPWORDS = {"the", "a", "an", "of", "in", "on", "to", "is", "was", "what", "who", "when", "where",
+             "which", "how", "why", "did", "does", "do", "and", "or", "for", "by", "with", "as", "at"}
+
+
+def parse_latency(spec):
+    """
+    Latency distribution from a spec string, returned as a sampler taking a
+    random.Random. Supported: constant:S, uniform:LO,HI, exponential:MEAN,
+    lognormal:MU,SIGMA (all in seconds).
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",")] if params else []
+    if kind == "constant":
+        return lambda rng: values[0] if values else 0.0
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _content_words(text):
+    return {w for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS}
+
+
+def _spans(sentence, question_words):
+    """Runs of up to four tokens not mentioned in the question, with their start index."""
+    spans, span, first = [], [], 0
+    tokens = sentence.split()
+    for i, token in enumerate(tokens + [""]):
+        word = token.lower().strip(".,;:!?\"'()")
+        if token and word and word not in question_words and word not in STOPWORDS:
+            if not span:
+                first = i
+            span.append(token.strip(".,;:!?\"'()"))
+        elif span:
+            spans.append((first, " ".join(span[:4])))
+            span = []
+    return spans, tokens
+
+
+def _expects(span, question):
+    """Whether a span has the shape the question word asks for."""
+    q = question.lower()
+    if q.startswith(("when", "how many", "how much", "what year")):
+        return any(c.isdigit() for c in span)
+    if q.startswith(("who", "where")):
+        return span[:1].isupper()
+    return True
+
+
+def candidate_answers(context, question):
+    """
+    Plausible answer spans for a question, best first. Spans come from the
+    context sentence sharing the most words with the question, ranked by
+    whether they fit the question word and how close they sit to the shared
+    words. Also returns the support (fraction of question words found in
+    that sentence), which is low for questions the context cannot answer.
+    """
+    question_words = _content_words(question)
+    sentences = [s for s in SENTENCE_RE.split(context) if s.strip()] or [context]
+    ranked = sorted(sentences, key=lambda s: -len(question_words & _content_words(s)))
+    best = ranked[0]
+    support = len(question_words & _content_words(best)) / max(len(question_words), 1)
+
+    candidates = []
+    for sentence in ranked[:3]:
+        spans, tokens = _spans(sentence, question_words)
+        anchors = [i for i, t in enumerate(tokens) if t.lower().strip(".,;:!?\"'()") in question_words] or [0]
+        spans.sort(key=lambda s: (not _expects(s[1], question), min(abs(s[0] - a) for a in anchors)))
+        candidates.extend(text for _, text in spans if text not in candidates)
+    return candidates or [best.strip()], support
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """
+    Local stand-in for an OpenAI-compatible chat-completions endpoint, with
+    the file upload and batch endpoints needed to run batch jobs.
+
+    Answers are derived deterministically from the SQuAD context in the
+    prompt: the greedy answer is the best-supported span, and sampled
+    answers stray from it more often for poorly supported (likely
+    unanswerable) questions and higher temperatures. The j-th sample served
+    for a prompt is always the same for the same seed. Requests carry no
+    sample index, though, so which of several concurrent requests gets draw
+    j follows arrival order, as do the latency and injected-error rolls of
+    the shared `rng`: responses are reproducible for sequential clients only.
+    Draw counts are kept for the MAX_TRACKED_PROMPTS most recent prompts; a
+    prompt forgotten after that starts again at draw 0.
+
+    Batch jobs are processed on a background thread once created; each line
+    fails with the configured error rate, and a job takes at least
+    `batch_delay` seconds so that clients have something to poll.
+    """
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, latency="constant:0", error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1.0, max_concurrent=None, n_mode="honor", seed=0, batch_delay=0.0, model_latency=None):
+        super().__init__(address, MockLLMHandler)
+        self.latency = parse_latency(latency)
+        # Latency spec per model name, overriding `latency` for that model.
+        self.model_latency = {model: parse_latency(spec) for model, spec in (model_latency or {}).items()}
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.max_concurrent = max_concurrent
+        self.n_mode = n_mode
+        self.seed = seed
+        self.batch_delay = batch_delay
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.draws = OrderedDict()
+        self.stats = defaultdict(int)
+        self.files = {}
+        self.batches = {}
+
+    def handle_error(self, request, client_address):
+        # Clients cancel requests they no longer need (hedging, deadlines);
+        # a connection they closed is not a server error.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def _rng_for(self, *parts):
+        digest = hashlib.sha256(json.dumps([self.seed, *parts]).encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def answer(self, context, question, temperature, draw):
+        candidates, support = candidate_answers(context, question)
+        if temperature <= 0:
+            return candidates[0]
+        rng = self._rng_for(context, question, temperature, draw)
+        stray = min(1.0, temperature * (1.0 - support) + 0.05)
+        if rng.random() >= stray:
+            return candidates[0]
+        pool = candidates[1:] or ["I am not sure", "unknown"]
+        return rng.choice(pool)
+
+    def complete(self, messages, temperature, n):
+        """Choice texts for a request, covering single and numbered prompts."""
+        prompt = messages[-1]["content"] if messages else ""
+        context = prompt.split("Context:", 1)[-1].split("\n\nQuestion", 1)[0].strip()
+        if "\n\nQuestions:\n" in prompt:
+            block = prompt.split("\n\nQuestions:\n", 1)[1].split("\n\nAnswers:", 1)[0]
+            questions = [line.split(". ", 1)[-1] for line in block.splitlines() if line.strip()]
+        else:
+            questions = [prompt.split("Question:", 1)[-1].split("\n\nAnswer:", 1)[0].strip()]
+
+        key = json.dumps([messages, temperature])
+        with self.lock:
+            first = self.draws.pop(key, 0)
+            self.draws[key] = first + n
+            if len(self.draws) > MAX_TRACKED_PROMPTS:
+                self.draws.popitem(last=False)
+
+        texts = []
+        for draw in range(first, first + n):
+            answers = [self.answer(context, q, temperature, draw) for q in questions]
+            if len(answers) == 1 and "\n\nQuestions:\n" not in prompt:
+                texts.append(answers[0])
+            else:
+                texts.append("\n".join(f"{i}. {a}" for i, a in enumerate(answers, 1)))
+        return texts
+
+    def chat_completion(self, body):
+        """Chat-completion response body for a request, honouring n per `n_mode`."""
+        n = int(body.get("n") or 1)
+        if self.n_mode == "ignore":
+            n = 1
+        elif self.n_mode.startswith("cap:"):
+            n = min(n, int(self.n_mode.split(":", 1)[1]))
+        messages = body.get("messages", [])
+        texts = self.complete(messages, float(body.get("temperature") or 0.0), n)
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        completion_tokens = sum(len(t) for t in texts) // 4 + len(texts)
+        with self.lock:
+            self.stats["completions"] += 1
+            number = self.stats["completions"]
+        return {
+            "id": f"mock-{number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": t}, "finish_reason": "stop"}
+                for i, t in enumerate(texts)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def create_file(self, data, filename, purpose):
+        with self.lock:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = {
+                "id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed", "data": data,
+            }
+        return self.files[file_id]
+
+    def create_batch(self, input_file_id, endpoint, completion_window):
+        with self.lock:
+            batch_id = f"batch-{len(self.batches) + 1}"
+            batch = self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": endpoint, "completion_window": completion_window,
+                "input_file_id": input_file_id, "status": "validating", "created_at": int(time.time()),
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+        threading.Thread(target=self._run_batch, args=(batch_id,), daemon=True).start()
+        return batch
+
+    def _update_batch(self, batch_id, **fields):
+        """
+        Replace a batch record with an updated copy. Records are never
+        changed in place, so handlers serializing one on another thread
+        always see a consistent version.
+        """
+        with self.lock:
+            self.batches[batch_id] = dict(self.batches[batch_id], **fields)
+
+    def _run_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        started = time.monotonic()
+        lines = [json.loads(line) for line in self.files[batch["input_file_id"]]["data"].splitlines() if line.strip()]
+        counts = {"total": len(lines), "completed": 0, "failed": 0}
+        self._update_batch(batch_id, status="in_progress", in_progress_at=int(time.time()), request_counts=dict(counts))
+        outputs, errors = [], []
+        for i, request in enumerate(lines):
+            with self.lock:
+                roll = self.rng.random()
+            if roll < self.error_rate:
+                errors.append({"id": f"{batch_id}-req-{i}", "custom_id": request["custom_id"], "response": {
+                    "status_code": 500, "body": {"error": {"message": "injected server error", "type": "server_error"}}
+                }, "error": None})
+                counts["failed"] += 1
+            else:
+                outputs.append({"id": f"{batch_id}-req-{i}", "custom_id": request["custom_id"], "response": {
+                    "status_code": 200, "request_id": f"{batch_id}-req-{i}", "body": self.chat_completion(request["body"])
+                }, "error": None})
+                counts["completed"] += 1
+            self._update_batch(batch_id, request_counts=dict(counts))
+        time.sleep(max(self.batch_delay - (time.monotonic() - started), 0.0))
+        self._update_batch(batch_id, status="finalizing")
+        files = {}
+        for field, rows in (("output_file_id", outputs), ("error_file_id", errors)):
+            if rows:
+                data = "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+                files[field] = self.create_file(data, f"{batch_id}_{field}.jsonl", "batch_output")["id"]
+        self._update_batch(batch_id, completed_at=int(time.time()), status="completed", **files)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _public(self, record):
+        return {k: v for k, v in record.items() if k != "data"}
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split("?", 1)[0].rstrip("/")
+        parts = path.split("/")
+        if path.endswith("/models"):
+            self._send(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        elif len(parts) >= 3 and parts[-2] == "batches" and parts[-1] in server.batches:
+            self._send(200, server.batches[parts[-1]])
+        elif len(parts) >= 3 and parts[-1] == "content" and parts[-2] in server.files:
+            self._send(200, server.files[parts[-2]]["data"], content_type="application/octet-stream")
+        elif len(parts) >= 3 and parts[-2] == "files" and parts[-1] in server.files:
+            self._send(200, self._public(server.files[parts[-1]]))
+        else:
+            self._send(404, {"error": {"message": "not found"}})
+
+    def _upload(self, raw):
+        """Multipart file upload (purpose + file fields) as sent by the OpenAI SDK."""
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+        fields, data, filename = {}, b"", "upload.jsonl"
+        for part in BytesParser(policy=HTTP).parsebytes(header + raw).iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                data, filename = part.get_payload(decode=True), part.get_filename()
+            else:
+                fields[name] = part.get_payload(decode=True).decode("utf-8")
+        return self.server.create_file(data, filename, fields.get("purpose", "batch"))
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path.endswith("/files"):
+            self._send(200, self._public(self._upload(raw)))
+            return
+        body = json.loads(raw or b"{}")
+        if path.endswith("/batches"):
+            if body.get("input_file_id") not in server.files:
+                self._send(404, {"error": {"message": "input file not found"}})
+                return
+            self._send(200, server.create_batch(body["input_file_id"], body.get("endpoint"), body.get("completion_window")))
+            return
+        if not path.endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+
+        with server.lock:
+            server.stats["requests"] += 1
+            overloaded = server.max_concurrent is not None and server.in_flight >= server.max_concurrent
+            roll = server.rng.random()
+            delay = server.model_latency.get(body.get("model"), server.latency)(server.rng)
+            server.in_flight += 1
+        try:
+            if overloaded or roll < server.rate_limit_rate:
+                with server.lock:
+                    server.stats["rate_limited"] += 1
+                self._send(429, {"error": {"message": "rate limited", "type": "rate_limit_error"}},
+                           {"Retry-After": str(server.retry_after)})
+                return
+            time.sleep(max(delay, 0.0))
+            if roll < server.rate_limit_rate + server.error_rate:
+                with server.lock:
+                    server.stats["errors"] += 1
+                self._send(500, {"error": {"message": "injected server error", "type": "server_error"}})
+                return
+
+            self._send(200, server.chat_completion(body))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+def start_server(host="127.0.0.1", port=0, **config):
+    """Start a MockLLMServer on a background thread. Returns (server, base_url)."""
+    server = MockLLMServer((host, port), **config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat-completions stand-in")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=str, default="lognormal:-2.5,0.5",
+                        help="constant:S, uniform:LO,HI, exponential:MEAN or lognormal:MU,SIGMA (seconds)")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests failing with HTTP 500")
+    parser.add_argument("--rate_limit_rate", type=float, default=0.0, help="Fraction of requests rejected with HTTP 429")
+    parser.add_argument("--retry_after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--max_concurrent", type=int, default=None, help="Reject requests beyond this many in flight with 429")
+    parser.add_argument("--n_mode", type=str, default="honor", help="honor, ignore, or cap:N for the n parameter")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch_delay", type=float, default=0.0, help="Minimum seconds a batch job takes to complete")
+    parser.add_argument("--model_latency", action="append", default=[], metavar="MODEL=SPEC",
+                        help="Latency distribution for one model name (repeatable), e.g. slow=constant:0.5")
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        (args.host, args.port), latency=args.latency, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        max_concurrent=args.max_concurrent, n_mode=args.n_mode, seed=args.seed, batch_delay=args.batch_delay,
+        model_latency=dict(entry.rsplit("=", 1) for entry in args.model_latency)
+    )
+    print(f"Mock LLM server listening on http://{args.host}:{server.server_address[1]}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
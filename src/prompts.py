@@ -0,0 +1,58 @@
+import re
+
+SYSTEM_PROMPT = "You are a helpful assistant. Read the context and answer the question. If the question cannot be answered from the context, answer very briefly with your best guess or what you think is true, but do not say 'I don't know' yet."
+
+GROUPED_SYSTEM_PROMPT = SYSTEM_PROMPT + " Several questions about the same context follow. Answer every question on its own line, in order, formatted as '<number>. <answer>'."
+
+NUMBERED_LINE_RE = re.compile(r"^\s*(\d+)\s*[.):]\s*(.*?)\s*$")
+
+def build_messages(example):
+    """Construct the chat prompt for a single SQuAD example."""
+    # We ask the model to answer the question based on the context.
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Context: {example['context']}\n\nQuestion: {example['question']}\n\nAnswer:"}
+    ]
+
+def build_grouped_messages(examples):
+    """
+    One prompt carrying several questions about the same context, so the
+    paragraph is sent once instead of once per question.
+    """
+    questions = "\n".join(f"{i}. {example['question']}" for i, example in enumerate(examples, 1))
+    return [
+        {"role": "system", "content": GROUPED_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Context: {examples[0]['context']}\n\nQuestions:\n{questions}\n\nAnswers:"}
+    ]
+
+def parse_numbered_answers(text, count):
+    """
+    Split a grouped response back into `count` answers.
+
+    Returns None unless every number 1..count appears exactly once, in which
+    case the caller falls back to single-question requests.
+    """
+    answers = {}
+    for line in (text or "").splitlines():
+        m = NUMBERED_LINE_RE.match(line)
+        if not m:
+            continue
+        number = int(m.group(1))
+        if number in answers or not 1 <= number <= count:
+            return None
+        answers[number] = m.group(2)
+    if len(answers) != count:
+        return None
+    return [answers[i] for i in range(1, count + 1)]
+
+def group_by_context(examples, group_size):
+    """
+    Group examples sharing a context, in order of first appearance, into
+    chunks of at most `group_size` questions.
+    """
+    groups = {}
+    for example in examples:
+        groups.setdefault(example['context'], []).append(example)
+    for members in groups.values():
+        for start in range(0, len(members), group_size):
+            yield members[start:start + group_size]
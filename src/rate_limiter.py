@@ -0,0 +1,304 @@
+import time
+import random
+import argparse
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+
+class RequestFailedError(Exception):
+    """Raised when a request still fails after every retry has been used."""
+
+    def __init__(self, message, last_error=None, attempts=0):
+        super().__init__(message)
+        self.last_error = last_error
+        self.attempts = attempts
+
+
+def estimate_tokens(messages, completion_tokens=0):
+    """
+    Rough token estimate for a chat request (about 4 characters per token).
+    Used to reserve tokens/min budget before the real usage is known.
+    """
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 4 + completion_tokens
+
+
+def parse_model_limits(text):
+    """
+    'MODEL=CONCURRENCY[:REQUESTS_PER_SECOND[:TOKENS_PER_MINUTE]],...' ->
+    {model: (concurrency, requests_per_second, tokens_per_minute)}, with
+    None for limits left out. Model IDs may themselves contain ':'.
+    """
+    limits = {}
+    for entry in filter(None, text.split(",")):
+        model, _, spec = entry.rpartition("=")
+        try:
+            values = [float(v) for v in spec.split(":")]
+        except ValueError:
+            values = []
+        if not model or not 1 <= len(values) <= 3:
+            raise argparse.ArgumentTypeError(f"Model limits must look like MODEL=CONCURRENCY[:RPS[:TPM]], got {entry!r}")
+        values += [None] * (3 - len(values))
+        limits[model] = (int(values[0]), values[1], values[2])
+    return limits
+
+
+def parse_retry_after(error):
+    """
+    Extract the server-requested delay (in seconds) from an API error.
+
+    Understands `retry-after-ms`, `retry-after` given in seconds and
+    `retry-after` given as an HTTP date. Returns None if no hint is present.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(float(value) / 1000.0, 0.0)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttle(error):
+    """True if the error is server pushback (HTTP 429)."""
+    return getattr(error, "status_code", None) == 429
+
+
+def is_retryable(error):
+    """
+    Rate limits, server errors and transport failures are retried; other
+    client errors (bad request, auth, unknown model) are not.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        return True
+    return status == 408 or status == 409 or status == 429 or status >= 500
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` units per second.
+
+    `reserve` deducts immediately and returns how long the caller must wait
+    before its reservation is covered, so concurrent callers queue up behind
+    each other instead of all waking at once.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else self.rate
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount=1.0):
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def adjust(self, delta):
+        """Correct an earlier reservation once the real cost is known."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on requests in flight.
+
+    Every success raises the limit by roughly one request per window of
+    `limit` completions; a throttle halves it. Only the first throttle from
+    requests started before the last decrease is counted, so a burst of 429s
+    from one overloaded window shrinks the limit once rather than collapsing it.
+    """
+
+    def __init__(self, max_limit, min_limit=1, increase=1.0, decrease=0.5):
+        self.max_limit = max(int(max_limit), 1)
+        self.min_limit = max(min(int(min_limit), self.max_limit), 1)
+        self.increase = increase
+        self.decrease = decrease
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.epoch = 0
+        self._condition = None
+
+    def _get_condition(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        """Wait for a free slot and return the epoch the request started in."""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return self.epoch
+
+    async def release(self):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(float(self.max_limit), self.limit + self.increase / max(self.limit, 1.0))
+
+    def on_throttle(self, started_epoch):
+        if started_epoch < self.epoch:
+            return
+        self.limit = max(float(self.min_limit), self.limit * self.decrease)
+        self.epoch += 1
+
+
+class RateLimiter:
+    """
+    Shared rate-limiting layer for every API request.
+
+    Combines a requests/sec bucket, a tokens/min bucket, AIMD concurrency,
+    exponential backoff with full jitter and server `Retry-After` hints.
+    A throttle pauses all callers until the requested time has passed.
+    Requests that exhaust their retries raise RequestFailedError.
+    """
+
+    def __init__(self, requests_per_second=None, tokens_per_minute=None, max_concurrency=8,
+                 max_retries=5, base_delay=1.0, max_delay=60.0, clock=time.monotonic):
+        self.request_bucket = TokenBucket(requests_per_second, clock=clock) if requests_per_second else None
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, capacity=tokens_per_minute, clock=clock) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.max_retries = max(int(max_retries), 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.blocked_until = 0.0
+        self.stats = {"requests": 0, "retries": 0, "throttles": 0, "failures": 0}
+
+    def reserve(self, estimated_tokens=0):
+        """Reserve budget for one request; returns the seconds to wait first."""
+        wait = max(self.blocked_until - self.clock(), 0.0)
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket is not None and estimated_tokens:
+            wait = max(wait, self.token_bucket.reserve(estimated_tokens))
+        return wait
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than `retry_after`."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after + random.uniform(0, self.base_delay))
+        return delay
+
+    def record_usage(self, estimated_tokens, response):
+        """Reconcile the tokens/min bucket with the usage the server reported."""
+        usage = getattr(response, "usage", None)
+        actual = getattr(usage, "total_tokens", None)
+        if self.token_bucket is not None and actual is not None:
+            self.token_bucket.adjust(actual - estimated_tokens)
+
+    def _on_error(self, error, attempt, started_epoch=None):
+        """Classify a failed attempt. Returns the delay before retrying."""
+        if not is_retryable(error) or attempt + 1 >= self.max_retries:
+            self.stats["failures"] += 1
+            raise RequestFailedError(
+                f"Request failed after {attempt + 1} attempt(s): {error}",
+                last_error=error, attempts=attempt + 1
+            ) from error
+
+        retry_after = parse_retry_after(error)
+        if is_throttle(error):
+            self.stats["throttles"] += 1
+            if started_epoch is not None:
+                self.concurrency.on_throttle(started_epoch)
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, self.clock() + retry_after)
+        self.stats["retries"] += 1
+        return self.backoff_delay(attempt, retry_after)
+
+    def call(self, fn, estimated_tokens=0):
+        """Run the blocking request `fn()` under the limiter with retries."""
+        for attempt in range(self.max_retries):
+            time.sleep(self.reserve(estimated_tokens))
+            self.stats["requests"] += 1
+            try:
+                response = fn()
+            except Exception as e:
+                print(f"API Error (Attempt {attempt+1}/{self.max_retries}): {e}")
+                time.sleep(self._on_error(e, attempt))
+                continue
+            self.record_usage(estimated_tokens, response)
+            return response
+
+    async def call_async(self, fn, estimated_tokens=0):
+        """Await the request coroutine `fn()` under the limiter with retries."""
+        for attempt in range(self.max_retries):
+            await asyncio.sleep(self.reserve(estimated_tokens))
+            started_epoch = await self.concurrency.acquire()
+            self.stats["requests"] += 1
+            try:
+                response = await fn()
+            except Exception as e:
+                print(f"API Error (Attempt {attempt+1}/{self.max_retries}): {e}")
+                delay = self._on_error(e, attempt, started_epoch)
+            else:
+                self.concurrency.on_success()
+                self.record_usage(estimated_tokens, response)
+                return response
+            finally:
+                await self.concurrency.release()
+            await asyncio.sleep(delay)
+
+    async def call_extra(self, fn, estimated_tokens=0):
+        """
+        Await an extra copy of a request already under the limiter (a hedged
+        duplicate): it reserves its own request and token budget and gets a
+        single attempt, since the caller still has the original request.
+
+        It does not wait for a concurrency slot: the original holds one
+        until the first of the two answers, so with a limit of 1 a duplicate
+        waiting for a slot could never start. Each request has at most one
+        duplicate, so at most twice the limit are ever in flight.
+        """
+        await asyncio.sleep(self.reserve(estimated_tokens))
+        started_epoch = self.concurrency.epoch
+        self.stats["requests"] += 1
+        try:
+            response = await fn()
+        except Exception as e:
+            if is_throttle(e):
+                self.stats["throttles"] += 1
+                self.concurrency.on_throttle(started_epoch)
+            raise
+        self.concurrency.on_success()
+        self.record_usage(estimated_tokens, response)
+        return response
+
+    def summary(self):
+        return dict(self.stats, concurrency_limit=int(self.concurrency.limit))
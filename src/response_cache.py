@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    choices TEXT NOT NULL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at);
+CREATE TABLE IF NOT EXISTS model_capabilities (
+    model TEXT PRIMARY KEY,
+    max_n INTEGER NOT NULL,
+    probed_at REAL NOT NULL
+);
+"""
+
+
+def request_key(model, messages, temperature, max_tokens, n=1, sample_index=None):
+    """
+    Content address of a chat request: SHA-256 over its canonical JSON.
+
+    `sample_index` tells apart repeated draws of the same stochastic request,
+    so k samples at temperature > 0 are k separate cache entries instead of
+    one answer repeated k times.
+    """
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "n": n,
+        "sample_index": sample_index,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent on-disk cache of chat completions backed by SQLite.
+
+    The database runs in WAL mode, so any number of readers (threads or
+    separate runner processes) can look up entries while one writer appends.
+    Each entry stores the completion texts and the token usage reported for
+    them. Lookups never write, eviction is oldest-first by age and/or size.
+    A second table remembers, per model, the largest `n` it honours.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Return {"choices": [...], "usage": {...}} for `key`, or None."""
+        row = self._connection().execute(
+            "SELECT choices, prompt_tokens, completion_tokens FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {
+            "choices": json.loads(row[0]),
+            "usage": {"prompt_tokens": row[1], "completion_tokens": row[2]},
+        }
+
+    def get_many(self, keys):
+        """Batch lookup. Returns {key: entry} for the keys that are cached."""
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, choices, prompt_tokens, completion_tokens FROM responses WHERE key IN ({placeholders})",
+            list(keys)
+        ).fetchall()
+        self.hits += len(rows)
+        self.misses += len(keys) - len(rows)
+        return {
+            row[0]: {
+                "choices": json.loads(row[1]),
+                "usage": {"prompt_tokens": row[2], "completion_tokens": row[3]},
+            }
+            for row in rows
+        }
+
+    def put(self, key, model, choices, usage=None):
+        usage = usage or {}
+        payload = json.dumps(choices, ensure_ascii=False)
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, model, payload, usage.get("prompt_tokens"), usage.get("completion_tokens"),
+             len(payload.encode("utf-8")), time.time())
+        )
+        conn.commit()
+
+    def get_max_n(self, model):
+        """Largest `n` the model was found to honour, or None if never probed."""
+        row = self._connection().execute(
+            "SELECT max_n FROM model_capabilities WHERE model = ?", (model,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def set_max_n(self, model, max_n):
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO model_capabilities VALUES (?, ?, ?)", (model, int(max_n), time.time()))
+        conn.commit()
+
+    def evict(self, max_bytes=None, max_age_seconds=None):
+        """
+        Drop entries older than `max_age_seconds`, then the oldest entries
+        until the stored payloads fit in `max_bytes`. Returns rows removed.
+        """
+        conn = self._connection()
+        removed = 0
+        if max_age_seconds is not None:
+            cursor = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - max_age_seconds,))
+            removed += cursor.rowcount
+        if max_bytes is not None:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > max_bytes:
+                # Walk from the oldest entry, accumulating sizes until enough is freed.
+                excess = total - max_bytes
+                freed = 0
+                doomed = []
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY created_at"):
+                    if freed >= excess:
+                        break
+                    doomed.append((key,))
+                    freed += size
+                conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+                removed += len(doomed)
+        conn.commit()
+        return removed
+
+    def summary(self):
+        count, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        return {"entries": count, "bytes": size, "hits": self.hits, "misses": self.misses}
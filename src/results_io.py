@@ -0,0 +1,250 @@
+import os
+import json
+import argparse
+import numpy as np
+from answer_matching import is_error
+
+# Columnar result files (Arrow IPC or Parquet), read through pyarrow.
+COLUMNAR_EXTENSIONS = (".arrow", ".parquet")
+# Columns returned as NumPy arrays; every other column stays lazy text/lists.
+# num_samples_used is float so rows without it (non-adaptive runs) read as NaN.
+NUMERIC_COLUMNS = {"consistency_score": float, "is_impossible": bool, "is_error": bool, "num_samples_used": float}
+# Rows per record batch when converting; large batches keep most files in
+# one chunk, so numeric columns map straight to NumPy without a copy.
+CONVERT_BATCH_ROWS = 262144
+
+
+class ResultWriter:
+    """
+    Append-only JSONL writer: one result per line, flushed and fsynced as
+    soon as it is written, so a crash loses at most the line in progress.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if append:
+            repair_tail(path)
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def repair_tail(path):
+    """
+    Truncate a partially written last line left behind by a crash so that
+    appending resumes on a clean record boundary.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        # Scan backwards for the last newline.
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            position -= step
+            f.seek(position)
+            index = f.read(step).rfind(b"\n")
+            if index != -1:
+                f.truncate(position + index + 1)
+                return
+        f.truncate(0)
+
+
+def iter_results(path):
+    """
+    Stream result rows from a JSONL results file.
+
+    Legacy `.json` files holding one JSON array and columnar files are
+    still accepted. A truncated final line (from a run that crashed
+    mid-write) is skipped.
+    """
+    if path.endswith(COLUMNAR_EXTENSIONS):
+        for batch in _open_table(path).to_batches():
+            yield from batch.to_pylist()
+        return
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                if line.endswith("\n"):
+                    raise
+                print(f"Skipping truncated last line in {path}")
+
+
+def load_results(path):
+    return list(iter_results(path))
+
+
+def completed_ids(path):
+    """Ids already present in a results file (empty if it does not exist)."""
+    if not os.path.exists(path):
+        return set()
+    return {row["id"] for row in iter_results(path)}
+
+
+def _arrow_schema(names):
+    """Arrow schema for the field `names`, plus the fields kept as JSON text."""
+    import pyarrow as pa
+    known = {
+        "id": pa.string(), "question": pa.string(), "is_impossible": pa.bool_(),
+        "greedy_answer": pa.string(), "sampled_answers": pa.list_(pa.string()),
+        "consistency_score": pa.float64(), "gold_answers": pa.list_(pa.string()),
+        "num_samples_used": pa.float64(), "consistency_scores_by_k": pa.map_(pa.string(), pa.float64()),
+        "is_error": pa.bool_(),
+    }
+    # Fields this version does not know are kept as JSON text.
+    json_fields = [name for name in names if name not in known]
+    return pa.schema([(name, known.get(name, pa.string())) for name in names]), json_fields
+
+
+def convert_results(source, dest, batch_rows=CONVERT_BATCH_ROWS):
+    """
+    Convert a JSONL results file to Arrow IPC (`.arrow`, memory-mappable) or
+    Parquet (`.parquet`), in record batches of `batch_rows` rows.
+
+    The schema covers every field of every row (a first pass collects
+    them), so fields only later rows have, e.g. after resuming with other
+    options, are kept; rows without a field get nulls. An `is_error`
+    column (answer_matching.is_error) is added, so metrics can be computed
+    from numeric columns alone. Returns the number of rows.
+    """
+    import pyarrow as pa
+
+    names = {}
+    for row in iter_results(source):
+        names.update(dict.fromkeys(row))
+    if not names:
+        raise ValueError(f"{source} holds no results")
+    names["is_error"] = None
+    schema, json_fields = _arrow_schema(list(names))
+
+    def prepare(row):
+        row["is_error"] = is_error(row)
+        for name in json_fields:
+            if name in row:
+                row[name] = json.dumps(row[name])
+        return row
+
+    if dest.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(dest, schema)
+    else:
+        writer = pa.ipc.new_file(pa.OSFile(dest, "wb"), schema)
+    count = 0
+    with writer:
+        batch = []
+        for row in iter_results(source):
+            batch.append(prepare(row))
+            if len(batch) >= batch_rows:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def _open_table(path, columns=None):
+    import pyarrow as pa
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns, memory_map=True)
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+class LazyColumn:
+    """A text or list column left in Arrow memory; values become Python objects on access."""
+
+    def __init__(self, chunked):
+        self.chunked = chunked
+
+    def __len__(self):
+        return len(self.chunked)
+
+    def __getitem__(self, i):
+        return self.chunked[i].as_py()
+
+    def __iter__(self):
+        for chunk in self.chunked.chunks:
+            yield from chunk.to_pylist()
+
+
+def result_columns(path):
+    """Column names available in a results file (JSONL: the keys of the first row)."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    if path.endswith(".arrow"):
+        return _open_table(path).schema.names
+    return list(next(iter_results(path), {}).keys())
+
+
+def read_columns(path, columns):
+    """
+    Read only `columns` of a results file.
+
+    Numeric columns (NUMERIC_COLUMNS) come back as NumPy arrays. From an
+    Arrow file they are views of the memory map; other columns are
+    LazyColumns that convert values only when accessed. JSONL files are
+    streamed once, keeping just the requested fields.
+    """
+    if path.endswith(COLUMNAR_EXTENSIONS):
+        table = _open_table(path, list(columns))
+        data = {}
+        for name in columns:
+            column = table.column(name)
+            if name in NUMERIC_COLUMNS:
+                data[name] = column.to_numpy()
+            else:
+                data[name] = LazyColumn(column)
+        return data
+
+    values = {name: [] for name in columns}
+    for row in iter_results(path):
+        for name in columns:
+            values[name].append(row.get(name))
+    return {
+        name: np.asarray(v, dtype=NUMERIC_COLUMNS[name]) if name in NUMERIC_COLUMNS else v
+        for name, v in values.items()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a JSONL results file to a columnar format")
+    parser.add_argument("source", type=str, help="JSONL results file")
+    parser.add_argument("dest", type=str, help="Output path ending in .arrow (memory-mappable) or .parquet")
+    parser.add_argument("--batch_rows", type=int, default=CONVERT_BATCH_ROWS)
+    args = parser.parse_args()
+    print(f"Wrote {convert_results(args.source, args.dest, args.batch_rows)} rows to {args.dest}")
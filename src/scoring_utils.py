@@ -1,3 +1,16 @@
+def _overlaps(greedy_tokens, sampled_answers):
+    """Token IoU between the greedy token set and each sample, in order."""
+    overlaps = []
+    for sample in sampled_answers:
+        sample_tokens = set(sample.lower().split())
+        if not sample_tokens:
+            overlaps.append(0.0)
+            continue
+        intersection = greedy_tokens.intersection(sample_tokens)
+        union = greedy_tokens.union(sample_tokens)
+        overlaps.append(len(intersection) / len(union) if union else 0.0)
+    return overlaps
+
 def calculate_inconsistency_score(greedy_answer, sampled_answers):
     """
     Calculates an inconsistency score based on token overlap (1 - IoU).
@@ -17,20 +30,173 @@ def calculate_inconsistency_score(greedy_answer, sampled_answers):
     if not greedy_tokens:
         return 1.0
         
-    overlaps = []
-    for sample in sampled_answers:
-        sample_tokens = set(sample.lower().split())
-        if not sample_tokens:
-            overlaps.append(0.0)
-            continue
-        intersection = greedy_tokens.intersection(sample_tokens)
-        union = greedy_tokens.union(sample_tokens)
-        iou = len(intersection) / len(union) if union else 0.0
-        overlaps.append(iou)
-    
+    overlaps = _overlaps(greedy_tokens, sampled_answers)
     if not overlaps:
         return 0.0 # No samples provided
         
     avg_overlap = sum(overlaps) / len(overlaps)
     score = 1.0 - avg_overlap 
     return score
+
+def calculate_inconsistency_scores_by_k(greedy_answer, sampled_answers, ks):
+    """
+    Inconsistency scores for several prefix sizes k in one pass.
+
+    Equivalent to calling calculate_inconsistency_score(greedy_answer,
+    sampled_answers[:k]) for every k in `ks`, but each greedy/sample overlap
+    is computed once and prefix sums give every k.
+
+    Args:
+        greedy_answer (str): The main answer generated by the model.
+        sampled_answers (list[str]): Samples in draw order.
+        ks (list[int]): Prefix sizes, each at most len(sampled_answers).
+
+    Returns:
+        dict[int, float]: Score for each k.
+    """
+    if not greedy_answer:
+        return {k: 1.0 for k in ks}
+
+    greedy_tokens = set(greedy_answer.lower().split())
+    if not greedy_tokens:
+        return {k: 1.0 for k in ks}
+
+    prefix_sums = [0]
+    for iou in _overlaps(greedy_tokens, sampled_answers[:max(ks, default=0)]):
+        prefix_sums.append(prefix_sums[-1] + iou)
+
+    scores = {}
+    for k in ks:
+        if k == 0:
+            scores[k] = 0.0 # No samples provided
+        else:
+            scores[k] = 1.0 - prefix_sums[k] / k
+    return scores
+
+def probability_inconsistent(greedy_answer, sampled_answers, threshold):
+    """
+    Posterior probability that the inconsistency score would exceed
+    `threshold` given unlimited samples.
+
+    Each greedy/sample overlap is treated as a fractional Bernoulli outcome
+    under a Jeffreys Beta(1/2, 1/2) prior on the mean overlap, so two
+    verbatim matches already put most of the mass near full agreement.
+
+    Args:
+        greedy_answer (str): The main answer generated by the model.
+        sampled_answers (list[str]): Samples drawn so far.
+        threshold (float): Abstention threshold on the inconsistency score.
+
+    Returns:
+        float: P(score > threshold), between 0.0 and 1.0.
+    """
+    greedy_tokens = set(greedy_answer.lower().split()) if greedy_answer else set()
+    if not greedy_tokens:
+        return 1.0 if threshold < 1.0 else 0.0 # Score is always 1.0
+
+    from scipy.special import betainc
+
+    overlaps = _overlaps(greedy_tokens, sampled_answers)
+    agreement = sum(overlaps)
+    # score > threshold  <=>  mean overlap < 1 - threshold
+    return float(betainc(0.5 + agreement, 0.5 + len(overlaps) - agreement, 1.0 - threshold))
+
+def should_stop_sampling(greedy_answer, sampled_answers, threshold, confidence=0.9):
+    """
+    True once the samples so far put the inconsistency score confidently on
+    one side of `threshold`, i.e. the answer/abstain decision is settled.
+    """
+    p = probability_inconsistent(greedy_answer, sampled_answers, threshold)
+    return p >= confidence or p <= 1.0 - confidence
+
+def calculate_inconsistency_scores(greedy_answers, sampled_answers):
+    """
+    Batch version of calculate_inconsistency_score for N questions at once.
+
+    Distinct answer strings are tokenized once and their tokens interned
+    into integer ids; every greedy/sample pair then becomes a block of
+    (pair, token) keys and all N*k intersections come from one sorted-array
+    intersection in NumPy. Overlaps are accumulated sample by sample in the
+    same order as the scalar function, so scores are bit-identical to it.
+
+    Args:
+        greedy_answers (list[str]): Greedy answer per question.
+        sampled_answers (list[list[str]]): Samples per question (any length).
+
+    Returns:
+        numpy.ndarray: N scores between 0.0 (consistent) and 1.0 (inconsistent).
+    """
+    import numpy as np
+    from itertools import chain
+
+    n = len(greedy_answers)
+    num_samples = np.fromiter(map(len, sampled_answers), dtype=np.int64, count=n)
+    texts = list(chain(greedy_answers, chain.from_iterable(sampled_answers)))
+
+    # Tokenize each distinct string once.
+    distinct = {t: i for i, t in enumerate(dict.fromkeys(texts))}
+    text_ids = np.fromiter(map(distinct.__getitem__, texts), dtype=np.int64, count=len(texts))
+    token_lists = [t.lower().split() if t else [] for t in distinct]
+    token_counts = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(token_lists))
+    flat_tokens = list(chain.from_iterable(token_lists))
+    vocab = {t: i for i, t in enumerate(dict.fromkeys(flat_tokens))}
+    token_ids = np.fromiter(map(vocab.__getitem__, flat_tokens), dtype=np.int64, count=len(flat_tokens))
+    vocab_size = max(len(vocab), 1)
+
+    # Token sets per distinct string: sorted unique (string, token) keys.
+    set_keys = np.sort(np.repeat(np.arange(len(token_lists)), token_counts) * vocab_size + token_ids)
+    set_keys = set_keys[np.diff(set_keys, prepend=-1) != 0]
+    set_owner = set_keys // vocab_size
+    set_tokens = set_keys % vocab_size
+    set_len = np.bincount(set_owner, minlength=len(token_lists))
+    set_start = np.concatenate(([0], np.cumsum(set_len)[:-1]))
+
+    def expand(string_ids, pair_ids):
+        """(pair, token) keys for the token sets of `string_ids`, one per pair."""
+        lengths = set_len[string_ids]
+        starts = np.repeat(set_start[string_ids] - np.cumsum(lengths) + lengths, lengths)
+        tokens = set_tokens[starts + np.arange(starts.size)]
+        return np.repeat(pair_ids, lengths) * vocab_size + tokens, lengths
+
+    greedy_ids = text_ids[:n]
+    sample_ids = text_ids[n:]
+    num_pairs = sample_ids.size
+    pair_row = np.repeat(np.arange(n), num_samples)
+    pairs = np.arange(num_pairs)
+    greedy_keys, greedy_len = expand(greedy_ids[pair_row], pairs)
+    sample_keys, sample_len = expand(sample_ids, pairs)
+    common = np.intersect1d(greedy_keys, sample_keys, assume_unique=True)
+    intersection = np.bincount(common // vocab_size, minlength=num_pairs)
+
+    union = greedy_len + sample_len - intersection
+    overlap = np.zeros(num_pairs)
+    valid = (sample_len > 0) & (union > 0)
+    overlap[valid] = intersection[valid] / union[valid]
+
+    # Left-to-right accumulation per row, matching sum() in the scalar code.
+    max_k = int(num_samples.max()) if n else 0
+    padded = np.zeros((n, max_k))
+    padded[pair_row, pairs - np.repeat(np.cumsum(num_samples) - num_samples, num_samples)] = overlap
+    total = np.zeros(n)
+    for j in range(max_k):
+        total = total + padded[:, j]
+
+    scores = np.zeros(n)
+    has_samples = num_samples > 0
+    scores[has_samples] = 1.0 - total[has_samples] / num_samples[has_samples]
+    scores[set_len[greedy_ids] == 0] = 1.0 # Empty answer is suspicious/uncertain
+    return scores
+
+# Batch scorers selectable by name (analyze_results.py --scorer): the exact
+# token-overlap score and its MinHash estimates (see minhash_scoring.py).
+SCORERS = ("exact", "minhash", "minhash_pairwise", "minhash_cluster")
+
+def calculate_scores(greedy_answers, sampled_answers, scorer="exact", store=None):
+    """
+    Scores of N questions with the named scorer. MinHash scorers take an
+    optional minhash_scoring.SignatureStore holding precomputed signatures.
+    """
+    if scorer == "exact":
+        return calculate_inconsistency_scores(greedy_answers, sampled_answers)
+    from minhash_scoring import SCORERS as MINHASH_SCORERS
+    return MINHASH_SCORERS[scorer](greedy_answers, sampled_answers, store)
@@ -0,0 +1,203 @@
+import os
+import json
+import numpy as np
+
+
+def _rank_auc(errors, correct):
+    """
+    Mann-Whitney AUC of errors scoring above correct answers from per-group
+    counts in ascending score order (ties count half; nan with one class).
+    """
+    pairs = errors.sum() * correct.sum()
+    if pairs == 0:
+        return float("nan")
+    correct_below = np.cumsum(correct) - correct
+    return float(np.sum(errors * (correct_below + 0.5 * correct)) / pairs)
+
+
+class RiskCoverage:
+    """
+    Risk-coverage view of a scored result set, built from one sort.
+
+    A question is answered when its uncertainty score is <= the threshold and
+    abstained otherwise. Tied scores are answered or abstained together, so
+    the curve only has a point at the end of each tie group: at threshold t
+    the coverage is the fraction of scores <= t and the risk is the error
+    rate among those answered questions.
+
+    Args:
+        scores (array-like): Uncertainty scores (higher = abstain first).
+        errors (array-like): 1/True where answering the question is an error.
+    """
+
+    def __init__(self, scores, errors):
+        scores = np.asarray(scores, dtype=float)
+        errors = np.asarray(errors, dtype=float)
+        order = np.argsort(scores, kind="stable")
+        self.n = scores.size
+        self.sorted_scores = scores[order]
+        self.cum_errors = np.cumsum(errors[order])
+
+        # Last index of every tie group.
+        ends = np.flatnonzero(np.diff(self.sorted_scores, append=np.inf) != 0)
+        answered = ends + 1
+        self._group_errors = np.diff(self.cum_errors[ends], prepend=0.0)
+        self._group_sizes = np.diff(answered, prepend=0)
+        self.thresholds = self.sorted_scores[ends]
+        self.coverage = answered / self.n if self.n else np.zeros(0)
+        self.risk = self.cum_errors[ends] / answered if self.n else np.zeros(0)
+
+    @property
+    def aurc(self):
+        """Area under the risk-coverage curve (trapezoidal rule)."""
+        if self.coverage.size < 2:
+            return 0.0
+        return float(np.sum(np.diff(self.coverage) * (self.risk[1:] + self.risk[:-1]) / 2))
+
+    @property
+    def base_error_rate(self):
+        return float(self.cum_errors[-1] / self.n) if self.n else 0.0
+
+    @property
+    def roc_auc(self):
+        """ROC-AUC of the scores as an error detector (same value as sklearn's roc_auc_score)."""
+        return _rank_auc(self._group_errors, self._group_sizes - self._group_errors)
+
+    def at_thresholds(self, thresholds):
+        """
+        Exact coverage and risk when abstaining on scores > t, for any grid of
+        thresholds. Risk is 0 where nothing is answered.
+        """
+        thresholds = np.asarray(thresholds, dtype=float)
+        if self.n == 0:
+            return np.zeros(thresholds.shape), np.zeros(thresholds.shape)
+        answered = np.searchsorted(self.sorted_scores, thresholds, side="right")
+        errors = np.concatenate(([0.0], self.cum_errors))[answered]
+        risk = np.divide(errors, answered, out=np.zeros(thresholds.shape), where=answered > 0)
+        return answered / self.n, risk
+
+    def at_coverages(self, targets):
+        """
+        For each target coverage, the smallest threshold whose coverage reaches
+        it. Returns (thresholds, achieved coverage, risk, selective accuracy);
+        ties can make the achieved coverage exceed the target.
+        """
+        targets = np.asarray(targets, dtype=float)
+        index = np.minimum(np.searchsorted(self.coverage, targets - 1e-12, side="left"), self.coverage.size - 1)
+        risk = self.risk[index]
+        return self.thresholds[index], self.coverage[index], risk, 1.0 - risk
+
+    def recommended_threshold(self, target_risk=0.1):
+        """
+        The threshold with the highest coverage whose risk stays within
+        `target_risk`; if no threshold reaches the target, the one with the
+        lowest risk. Returns a dict (None values when there are no rows).
+        """
+        return _recommend(self.thresholds, self.coverage, self.risk, target_risk)
+
+
+def _recommend(thresholds, coverage, risk, target_risk):
+    if coverage.size == 0:
+        return {"threshold": None, "coverage": None, "risk": None, "target_risk": target_risk, "meets_target": False}
+    within = np.flatnonzero(risk <= target_risk)
+    index = within[np.argmax(coverage[within])] if within.size else int(np.argmin(risk))
+    return {
+        "threshold": float(thresholds[index]),
+        "coverage": float(coverage[index]),
+        "risk": float(risk[index]),
+        "target_risk": target_risk,
+        "meets_target": bool(within.size),
+    }
+
+
+def load_threshold(metrics_file, default=0.5):
+    """
+    Calibrated abstention threshold: the recommended threshold saved by
+    analyze_results.py in `metrics_file`, or `default` when the file is
+    missing or recommends none.
+    """
+    if not metrics_file or not os.path.exists(metrics_file):
+        return default
+    with open(metrics_file) as f:
+        recommended = json.load(f).get("recommended_threshold")
+    threshold = recommended.get("threshold") if isinstance(recommended, dict) else recommended
+    return default if threshold is None else float(threshold)
+
+
+class IncrementalMetrics:
+    """
+    Running error rate, ROC-AUC, risk-coverage and recommended threshold,
+    updated one result at a time.
+
+    Scores (clipped to [0, 1]) are counted in `num_bins` fixed bins, each
+    tracking its errors, correct answers and largest score. An update is
+    O(1), and reading the metrics is O(num_bins) however many rows have
+    been seen. Rows sharing a bin are treated as tied, so the figures match
+    RiskCoverage exactly when no bin holds two distinct scores (e.g. the
+    few score values of a k-sample run) and are close otherwise.
+    """
+
+    def __init__(self, num_bins=1000):
+        self.num_bins = num_bins
+        self.errors = [0] * num_bins
+        self.correct = [0] * num_bins
+        self.bin_max = [-np.inf] * num_bins
+        self.n = 0
+        self.n_errors = 0
+
+    def update(self, score, error):
+        b = min(max(int(score * self.num_bins), 0), self.num_bins - 1)
+        if error:
+            self.errors[b] += 1
+            self.n_errors += 1
+        else:
+            self.correct[b] += 1
+        self.n += 1
+        if score > self.bin_max[b]:
+            self.bin_max[b] = score
+
+    def _curve(self):
+        errors = np.asarray(self.errors, dtype=float)
+        total = errors + np.asarray(self.correct, dtype=float)
+        used = total > 0
+        answered = np.cumsum(total)[used]
+        coverage = answered / self.n if self.n else np.zeros(0)
+        risk = np.cumsum(errors)[used] / answered if self.n else np.zeros(0)
+        return np.asarray(self.bin_max)[used], coverage, risk
+
+    @property
+    def base_error_rate(self):
+        return self.n_errors / self.n if self.n else 0.0
+
+    @property
+    def roc_auc(self):
+        """Mann-Whitney AUC of errors scoring above correct answers (nan with one class)."""
+        return _rank_auc(np.asarray(self.errors, dtype=float), np.asarray(self.correct, dtype=float))
+
+    @property
+    def aurc(self):
+        _, coverage, risk = self._curve()
+        if coverage.size < 2:
+            return 0.0
+        return float(np.sum(np.diff(coverage) * (risk[1:] + risk[:-1]) / 2))
+
+    def recommended_threshold(self, target_risk=0.1):
+        return _recommend(*self._curve(), target_risk)
+
+    def summary(self, target_risk=0.1):
+        return {
+            "rows": self.n,
+            "base_error_rate": self.base_error_rate,
+            "roc_auc": self.roc_auc,
+            "aurc": self.aurc,
+            "recommended_threshold": self.recommended_threshold(target_risk),
+        }
+
+    def format(self, target_risk=0.1):
+        """One status line for logs and progress output."""
+        rec = self.recommended_threshold(target_risk)
+        line = (f"rows={self.n} error={self.base_error_rate:.1%} auc={self.roc_auc:.3f} aurc={self.aurc:.3f}")
+        if rec["threshold"] is not None:
+            line += (f" threshold={rec['threshold']:.3f} (coverage {rec['coverage']:.1%}, risk {rec['risk']:.1%}"
+                     f"{'' if rec['meets_target'] else f', above target {target_risk:.1%}'})")
+        return line
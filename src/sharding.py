@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import subprocess
+from results_io import ResultWriter, iter_results
+
+
+def parse_shard(text):
+    """'i/N' -> (i, N) with 0 <= i < N."""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shard must look like i/N, got {text!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be in [0, {count}), got {text!r}")
+    return index, count
+
+
+def shard_of(example_id, num_shards):
+    """Shard owning an example: a stable hash of its id (same on every machine)."""
+    digest = hashlib.sha256(str(example_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def shard_positions(ids, index, num_shards):
+    """Dataset positions of the examples belonging to shard `index`."""
+    return [i for i, example_id in enumerate(ids) if shard_of(example_id, num_shards) == index]
+
+
+def shard_path(output_path, index, num_shards):
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}.shard-{index}-of-{num_shards}{ext}"
+
+
+def manifest_path(path):
+    return f"{os.path.splitext(path)[0]}.manifest.json"
+
+
+def write_manifest(path, manifest):
+    """Atomically write a shard manifest next to its results file."""
+    target = manifest_path(path)
+    with open(target + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(target + ".tmp", target)
+
+
+def read_manifest(path):
+    with open(manifest_path(path)) as f:
+        return json.load(f)
+
+
+class MergeError(Exception):
+    """Raised when shard results do not add up to exactly the expected examples."""
+
+
+def merge_shards(output_path, num_shards):
+    """
+    Check that shards 0..N-1 of `output_path` cover every expected example
+    exactly once, then write the combined results in dataset order.
+
+    Each shard's manifest lists the ids (and dataset positions) it was
+    assigned; every one must be present in exactly one shard file, and no
+    shard may hold ids it was not assigned. Raises MergeError otherwise.
+    Returns the number of rows written.
+    """
+    problems = []
+    rows = {}
+    positions = {}
+    settings = None
+    for index in range(num_shards):
+        path = shard_path(output_path, index, num_shards)
+        if not os.path.exists(manifest_path(path)) or not os.path.exists(path):
+            problems.append(f"shard {index}: missing {path} or its manifest")
+            continue
+        manifest = read_manifest(path)
+        shard_settings = {k: manifest.get(k) for k in ("num_shards", "dataset_path", "num_samples", "stratified", "sample_seed", "model_name")}
+        if settings is None:
+            settings = shard_settings
+        elif shard_settings != settings:
+            problems.append(f"shard {index}: settings {shard_settings} differ from shard 0 {settings}")
+
+        expected = dict(zip(manifest["ids"], manifest["positions"]))
+        seen = set()
+        for row in iter_results(path):
+            example_id = row["id"]
+            if example_id not in expected:
+                problems.append(f"shard {index}: unexpected id {example_id}")
+            elif example_id in seen or example_id in rows:
+                problems.append(f"shard {index}: duplicate id {example_id}")
+            else:
+                seen.add(example_id)
+                rows[example_id] = row
+                positions[example_id] = expected[example_id]
+        missing = [i for i in manifest["ids"] if i not in seen]
+        if missing:
+            problems.append(f"shard {index}: {len(missing)} of {len(expected)} ids missing (e.g. {missing[:3]})")
+
+    if problems:
+        raise MergeError("Cannot merge shards:\n  " + "\n  ".join(problems))
+
+    with ResultWriter(output_path) as writer:
+        for example_id in sorted(rows, key=positions.get):
+            writer.write(rows[example_id])
+    return len(rows)
+
+
+def launch(num_shards, runner_args, output_file):
+    """
+    Run `num_shards` runner processes on this machine, one per shard, then
+    merge their results. Returns the exit code.
+    """
+    runner = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiment_runner.py")
+    processes = [
+        subprocess.Popen([sys.executable, runner, *runner_args, "--output_file", output_file,
+                          "--shard", f"{index}/{num_shards}"])
+        for index in range(num_shards)
+    ]
+    codes = [process.wait() for process in processes]
+    failed = [index for index, code in enumerate(codes) if code != 0]
+    if failed:
+        print(f"Shards {failed} exited with errors; not merging")
+        return 1
+    output_path = f"results/{output_file}"
+    try:
+        written = merge_shards(output_path, num_shards)
+    except MergeError as e:
+        print(e)
+        return 1
+    print(f"Merged {num_shards} shards into {output_path} ({written} results)")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge or locally launch sharded experiment runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge = commands.add_parser("merge", help="Validate shard coverage and write one combined results file")
+    merge.add_argument("output_path", type=str, help="Combined results path, e.g. results/experiment_results.jsonl")
+    merge.add_argument("--num_shards", type=int, required=True)
+
+    run = commands.add_parser("launch", help="Run N shard processes here, then merge; other options go to the runner")
+    run.add_argument("--num_shards", type=int, required=True)
+    run.add_argument("--output_file", type=str, default="experiment_results.jsonl")
+
+    args, runner_args = parser.parse_known_args()
+    if args.command == "merge":
+        if runner_args:
+            parser.error(f"unrecognized arguments: {' '.join(runner_args)}")
+        try:
+            print(f"Merged {merge_shards(args.output_path, args.num_shards)} results into {args.output_path}")
+        except MergeError as e:
+            print(e)
+            sys.exit(1)
+    else:
+        sys.exit(launch(args.num_shards, runner_args, args.output_file))
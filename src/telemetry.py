@@ -0,0 +1,210 @@
+import json
+import math
+import time
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+    """
+    Fixed log-spaced histogram of latencies in seconds.
+
+    Recording is O(1) and memory is constant however many calls a run
+    makes; quantiles are read from the bin edges, so they are accurate to
+    the bin growth factor (5% by default) between `low` and `high`.
+    """
+
+    def __init__(self, low=1e-3, high=600.0, growth=1.05):
+        self.low = low
+        self.log_growth = math.log(growth)
+        self.num_bins = int(math.ceil(math.log(high / low) / self.log_growth)) + 2
+        self.counts = [0] * self.num_bins
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bin(self, seconds):
+        if seconds < self.low:
+            return 0
+        return min(int(math.log(seconds / self.low) / self.log_growth) + 1, self.num_bins - 1)
+
+    def record(self, seconds):
+        self.counts[self._bin(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper edge of the bin holding the q-quantile (None when empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(self.low * math.exp(self.log_growth * i), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max if self.count else None,
+        }
+
+
+class Span:
+    """A timed operation handed to span hooks when it ends."""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.start_time = time.time()
+        self.duration = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class OpenTelemetryHook:
+    """
+    Span hook replaying finished spans into an OpenTelemetry tracer.
+    Needs the optional `opentelemetry-api` package (plus an SDK/exporter
+    configured by the caller for the spans to go anywhere).
+    """
+
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetry hooks need `pip install opentelemetry-api opentelemetry-sdk`") from e
+        self.trace = trace
+        self.tracer = tracer or trace.get_tracer("abstention.runner")
+
+    def __call__(self, span):
+        start_ns = int(span.start_time * 1e9)
+        otel_span = self.tracer.start_span(span.name, start_time=start_ns, attributes=span.attributes)
+        if span.error is not None:
+            otel_span.set_status(self.trace.Status(self.trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=start_ns + int(span.duration * 1e9))
+
+
+class Telemetry:
+    """
+    Per-run instrumentation of API calls.
+
+    Calls are grouped by kind (greedy or sampled). For each kind it keeps a
+    latency histogram of whole calls (including retries and limiter waits),
+    attempts, hedged duplicates (counted apart from retries), failures,
+    cache hits and the token usage the API reported.
+    Named phases (e.g. result writes) accumulate wall time. Span hooks are
+    callables that receive every finished Span.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.kinds = {}
+        self.phases = {}
+        self.hooks = []
+        self.annotations = {}
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def _kind(self, kind):
+        if kind not in self.kinds:
+            self.kinds[kind] = {
+                "latency": LatencyHistogram(), "calls": 0, "attempts": 0, "hedges": 0, "failures": 0,
+                "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            }
+        return self.kinds[kind]
+
+    def record_call(self, kind, seconds, attempts=1, usage=None, failed=False, hedges=0):
+        stats = self._kind(kind)
+        stats["latency"].record(seconds)
+        stats["calls"] += 1
+        stats["attempts"] += attempts
+        stats["hedges"] += hedges
+        stats["failures"] += int(failed)
+        for field in ("prompt_tokens", "completion_tokens"):
+            stats[field] += (usage or {}).get(field) or 0
+
+    def annotate(self, key, value):
+        """Attach extra run-level information (e.g. hedging counts) to the summary."""
+        self.annotations[key] = value
+
+    def record_cache_hits(self, kind, count=1):
+        self._kind(kind)["cache_hits"] += count
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a block as a Span; hooks see it (with any error) when it ends."""
+        span = Span(name, attributes)
+        start = self.clock()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = self.clock() - start
+            for hook in self.hooks:
+                hook(span)
+
+    @contextmanager
+    def timed(self, phase):
+        """Accumulate the wall time of a block under `phase`."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.phases[phase] = self.phases.get(phase, 0.0) + self.clock() - start
+
+    def _totals(self):
+        latency = LatencyHistogram()
+        for stats in self.kinds.values():
+            latency.counts = [a + b for a, b in zip(latency.counts, stats["latency"].counts)]
+            latency.count += stats["latency"].count
+            latency.total += stats["latency"].total
+            latency.max = max(latency.max, stats["latency"].max)
+        tokens = sum(s["prompt_tokens"] + s["completion_tokens"] for s in self.kinds.values())
+        return latency, tokens
+
+    def live(self):
+        """Short figures for a progress bar: latency percentiles (ms) and tokens/sec."""
+        latency, tokens = self._totals()
+        elapsed = max(self.clock() - self.started, 1e-9)
+        fmt = lambda q: f"{latency.quantile(q) * 1000:.0f}" if latency.count else "-"
+        return {"p50": fmt(0.5), "p95": fmt(0.95), "p99": fmt(0.99), "tok/s": f"{tokens / elapsed:.0f}"}
+
+    def summary(self):
+        latency, tokens = self._totals()
+        elapsed = self.clock() - self.started
+        kinds = {}
+        for kind, stats in self.kinds.items():
+            entry = {k: v for k, v in stats.items() if k != "latency"}
+            entry["retries"] = stats["attempts"] - stats["calls"]
+            entry["latency"] = stats["latency"].summary()
+            requests = stats["calls"] + stats["cache_hits"]
+            entry["cache_hit_rate"] = stats["cache_hits"] / requests if requests else None
+            kinds[kind] = entry
+        return {
+            "elapsed_seconds": elapsed,
+            "calls": latency.count,
+            "latency": latency.summary(),
+            "tokens": tokens,
+            "tokens_per_second": tokens / elapsed if elapsed > 0 else None,
+            "calls_per_second": latency.count / elapsed if elapsed > 0 else None,
+            "by_kind": kinds,
+            "phases": dict(self.phases),
+            **self.annotations,
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
@@ -1,6 +1,6 @@
 #!/bin/bash
 echo "Running Unit Tests..."
-python -m unittest tests/test_experiment_runner.py
+PYTHONPATH=src python -m unittest discover -s tests
 if [ $? -eq 0 ]; then
     echo "Tests passed successfully."
 else
@@ -0,0 +1,29 @@
+import io
+import sys
+import unittest
+import subprocess
+from contextlib import redirect_stdout
+import abstain
+
+HEAVY_MODULES = ("openai", "datasets", "matplotlib", "sklearn", "tqdm", "dotenv", "pyarrow")
+
+class TestAbstainCLI(unittest.TestCase):
+
+    def test_light_modules_do_not_import_heavy_dependencies(self):
+        code = ("import sys, abstain, scoring_utils, answer_matching, analyze_results, results_io, experiment_runner; "
+                f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+        loaded = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip()
+        self.assertEqual(loaded, "")
+
+    def test_dispatches_to_root_script(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            abstain.main(["demo"])
+        self.assertIn("Mock Experiment Demo", out.getvalue())
+        self.assertIn("mock_demo", sys.modules)
+
+    def test_every_command_has_a_startup_budget(self):
+        self.assertEqual(set(abstain.STARTUP_BUDGETS), set(abstain.COMMANDS))
+
+if __name__ == '__main__':
+    unittest.main()
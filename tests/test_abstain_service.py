@@ -0,0 +1,122 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from mock_llm_server import start_server
+from rate_limiter import RateLimiter
+from selective_metrics import load_threshold
+from telemetry import Telemetry
+import experiment_runner
+from abstain_service import ABSTAIN_OUTPUT, AbstainService, DecisionCache, ServiceClient, start
+
+CONTEXT = "The city of Springfield was founded in 1801 by Jane Doe. It has 5000 residents."
+QUESTION = "When was Springfield founded?"
+
+class DelayedService(AbstainService):
+    """Service whose calls answer after fixed delays: greedy first, then each sample in order."""
+
+    def __init__(self, delays, **kwargs):
+        super().__init__("fake", k=len(delays), **kwargs)
+        self.delays = list(delays)
+        self.calls = 0
+
+    async def _sample(self, messages, temperature, n=1):
+        if temperature == 0:
+            return ["1801"]
+        delay = self.delays[self.calls]
+        self.calls += 1
+        await asyncio.sleep(delay)
+        return ["1801"]
+
+class TestAbstainService(unittest.TestCase):
+
+    def setUp(self):
+        self.server, base_url = start_server()
+        experiment_runner.client, experiment_runner.async_client = experiment_runner.make_clients(base_url)
+        experiment_runner.telemetry = Telemetry()
+        experiment_runner.hedger = None
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_identical_requests_are_coalesced_then_cached(self):
+        limiter = RateLimiter(max_concurrency=16)
+        service = AbstainService("mock", k=4, deadline=10.0, limiter=limiter)
+
+        async def run():
+            first = await asyncio.gather(*[service.decide(CONTEXT, QUESTION) for _ in range(10)])
+            again = await service.decide(CONTEXT, QUESTION)
+            await experiment_runner.async_client.close()
+            return first, again
+
+        first, again = asyncio.run(run())
+        self.assertEqual(sorted(d["source"] for d in first), ["coalesced"] * 9 + ["model"])
+        self.assertEqual(again["source"], "cache")
+        self.assertEqual(limiter.stats["requests"], 5)
+        self.assertEqual(again["samples_used"], 4)
+        self.assertFalse(again["deadline_hit"])
+        self.assertEqual(again["decision"], "answer")
+        self.assertEqual(again["output"], again["greedy_answer"])
+
+    def test_deadline_decides_from_samples_that_arrived(self):
+        service = DelayedService([0.0, 0.0, 5.0, 5.0], deadline=0.2)
+        decision = asyncio.run(service.decide(CONTEXT, QUESTION))
+        self.assertTrue(decision["deadline_hit"])
+        self.assertEqual(decision["samples_used"], 2)
+        self.assertEqual(decision["score"], 0.0)
+        self.assertEqual(decision["decision"], "answer")
+        self.assertEqual(len(service.cache), 0)
+
+        service = DelayedService([5.0, 5.0], deadline=0.1)
+        decision = asyncio.run(service.decide(CONTEXT, QUESTION))
+        self.assertEqual((decision["decision"], decision["output"], decision["score"]), ("abstain", ABSTAIN_OUTPUT, None))
+
+    def test_decision_cache_expires_and_evicts(self):
+        now = [0.0]
+        cache = DecisionCache(max_entries=2, ttl=10.0, clock=lambda: now[0])
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        now[0] = 11.0
+        self.assertIsNone(cache.get("a"))
+
+    def test_http_endpoint_with_calibrated_threshold(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics_file = os.path.join(tmp, "metrics.json")
+            with open(metrics_file, "w") as f:
+                json.dump({"recommended_threshold": {"threshold": 0.25, "coverage": 0.8}}, f)
+            threshold = load_threshold(metrics_file)
+            self.assertEqual(load_threshold(os.path.join(tmp, "missing.json")), 0.5)
+        self.assertEqual(threshold, 0.25)
+        service = AbstainService("mock", k=3, threshold=threshold, limiter=RateLimiter(max_concurrency=8))
+
+        async def run():
+            server, url = await start(service)
+            client = ServiceClient("127.0.0.1", int(url.rsplit(":", 1)[1]))
+            try:
+                return [
+                    await client.request("GET", "/health"),
+                    await client.decide(CONTEXT, QUESTION, deadline_ms=5000),
+                    await client.request("POST", "/v1/decide", {"context": CONTEXT}),
+                    await client.request("GET", "/stats"),
+                ]
+            finally:
+                await client.close()
+                server.close()
+                await server.wait_closed()
+                await experiment_runner.async_client.close()
+
+        health, decided, bad, stats = asyncio.run(run())
+        self.assertEqual(health, (200, {"status": "ok", "model": "mock", "k": 3, "threshold": 0.25}))
+        self.assertEqual(decided[0], 200)
+        self.assertEqual(decided[1]["threshold"], 0.25)
+        self.assertIn(decided[1]["decision"], ("answer", "abstain"))
+        self.assertEqual(bad[0], 400)
+        self.assertEqual(stats[1]["decisions"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import re
+import string
+import unittest
+from analyze_results import is_error, match, match_many, normalize_text
+
+def reference_normalize(s):
+    """The original SQuAD-style normalization, step by step."""
+    s = s.lower()
+    s = ''.join(ch for ch in s if ch not in set(string.punctuation))
+    s = re.sub(r'\b(a|an|the)\b', ' ', s)
+    return ' '.join(s.split())
+
+class TestAnalyzeResults(unittest.TestCase):
+
+    def test_normalize_matches_reference(self):
+        for text in ["The Eiffel Tower!", "  an apple, a pear\tand THE end.", "Théâtre d'été", "", "a-the"]:
+            self.assertEqual(normalize_text(text), reference_normalize(text))
+
+    def test_match_relaxed_inclusion(self):
+        golds = ["Denver Broncos", "The Broncos"]
+        self.assertTrue(match("the Denver Broncos won", golds))  # gold inside prediction
+        self.assertTrue(match("Broncos", golds))                 # prediction inside gold
+        self.assertFalse(match("Carolina Panthers", golds))
+        self.assertFalse(match("Broncos", []))
+        # Prediction must fit inside a single gold, not span two of them.
+        self.assertFalse(match("Broncos Carolina", ["Denver Broncos", "Carolina Panthers"]))
+
+    def test_match_many_with_cached_golds(self):
+        labels = match_many(["1876", "Paris", "1876"], [["in 1876"], ["Lyon"], ["in 1876"]])
+        self.assertEqual(labels.tolist(), [True, False, True])
+
+    def test_cached_golds_follow_the_gold_answers(self):
+        # Two datasets reusing an id, or changed golds in a long-lived process.
+        self.assertTrue(is_error({"id": "q0", "is_impossible": False, "greedy_answer": "Paris", "gold_answers": ["Lyon"]}))
+        self.assertFalse(is_error({"id": "q0", "is_impossible": False, "greedy_answer": "Paris", "gold_answers": ["Paris"]}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import json
+import tempfile
+import unittest
+from types import SimpleNamespace
+from datasets import Dataset
+from mock_llm_server import start_server
+from results_io import ResultWriter
+from telemetry import Telemetry
+import experiment_runner
+from batch_jobs import run_batch, submit, wait_for, parse_custom_id, samples_id, greedy_id
+
+CONTEXT = "The city of Springfield was founded in 1801 by Jane Doe. It has 5000 residents."
+QUESTIONS = ["When was Springfield founded?", "Who founded Springfield?", "How many residents does it have?"]
+
+def examples():
+    return Dataset.from_list([
+        {"id": f"q{i}", "title": "Springfield", "context": CONTEXT, "question": q,
+         "answers": {"text": ["x"], "answer_start": [0]}}
+        for i, q in enumerate(QUESTIONS)
+    ])
+
+class TestBatchJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server, base_url = start_server(n_mode="cap:2")
+        experiment_runner.client, experiment_runner.async_client = experiment_runner.make_clients(base_url)
+        experiment_runner.response_cache = None
+        experiment_runner.telemetry = Telemetry()
+        experiment_runner.max_choices.clear()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_custom_ids_round_trip(self):
+        self.assertEqual(parse_custom_id(greedy_id("a/b")), ("a/b", None))
+        self.assertEqual(parse_custom_id(samples_id("q1", [2, 4])), ("q1", [2, 4]))
+
+    def test_rounds_top_up_capped_n_and_write_rows(self):
+        args = SimpleNamespace(model_name="m", num_generations=5, k_values=None, adaptive=False, no_native_n=False,
+                               batch_rounds=3, batch_max_requests=50000, batch_poll_seconds=0.01,
+                               live_every=0, target_risk=0.1)
+        path = os.path.join(self.tmp.name, "results.jsonl")
+        with ResultWriter(path) as writer:
+            written, failures = run_batch(examples(), args, writer, os.path.join(self.tmp.name, "results"))
+        self.assertEqual((written, failures), (3, []))
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row["id"] for row in rows], ["q0", "q1", "q2"])
+        self.assertEqual(rows[0]["greedy_answer"], "1801")
+        self.assertTrue(all(len(row["sampled_answers"]) == 5 for row in rows))
+        # Round 1: greedy + one n=5 request (capped to 2) per example; then the
+        # remaining 3 slots as n=2 + n=1 requests.
+        self.assertEqual(self.server.stats["completions"], 3 * (2 + 2))
+        self.assertEqual(experiment_runner.max_choices["m"], 2)
+
+    def test_resubmitting_the_same_requests_reuses_the_job(self):
+        lines = [{"custom_id": "q0/greedy", "method": "POST", "url": "/v1/chat/completions",
+                  "body": {"model": "m", "messages": [{"role": "user", "content": "hi"}]}}]
+        state = os.path.join(self.tmp.name, "state.json")
+        first = submit(experiment_runner.client, lines, os.path.join(self.tmp.name, "in.jsonl"), state)
+        again = submit(experiment_runner.client, lines, os.path.join(self.tmp.name, "in.jsonl"), state)
+        self.assertEqual(first, again)
+        self.assertEqual(len(self.server.batches), 1)
+
+    def test_failed_job_is_submitted_again(self):
+        lines = [{"custom_id": "q0/greedy", "method": "POST", "url": "/v1/chat/completions",
+                  "body": {"model": "m", "messages": [{"role": "user", "content": "hi"}]}}]
+        state = os.path.join(self.tmp.name, "state.json")
+        first = submit(experiment_runner.client, lines, os.path.join(self.tmp.name, "in.jsonl"), state)
+        wait_for(experiment_runner.client, [first], poll_seconds=0.01)
+        self.server.batches[first]["status"] = "expired"
+        again = submit(experiment_runner.client, lines, os.path.join(self.tmp.name, "in.jsonl"), state)
+        self.assertNotEqual(first, again)
+        with open(state) as f:
+            self.assertEqual(list(json.load(f).values()), [again])
+
+    def test_cached_answers_are_counted_once(self):
+        from response_cache import ResponseCache
+        args = SimpleNamespace(model_name="m", num_generations=2, k_values=None, adaptive=False, no_native_n=False,
+                               batch_rounds=3, batch_max_requests=50000, batch_poll_seconds=0.01,
+                               live_every=0, target_risk=0.1)
+        experiment_runner.response_cache = ResponseCache(os.path.join(self.tmp.name, "cache.sqlite"))
+        try:
+            for name in ("first", "second"):
+                experiment_runner.telemetry = Telemetry()
+                with ResultWriter(os.path.join(self.tmp.name, f"{name}.jsonl")) as writer:
+                    run_batch(examples(), args, writer, os.path.join(self.tmp.name, name))
+                if name == "first":
+                    # One lookup per greedy answer and sample slot; storing answers looks nothing up.
+                    self.assertEqual(experiment_runner.response_cache.misses, 3 * (1 + 2))
+            by_kind = experiment_runner.telemetry.summary()["by_kind"]
+            self.assertEqual(sum(kind["cache_hits"] for kind in by_kind.values()), 3 * (1 + 2))
+        finally:
+            experiment_runner.response_cache = None
+
+if __name__ == '__main__':
+    unittest.main()
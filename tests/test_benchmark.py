@@ -0,0 +1,30 @@
+import unittest
+from benchmark import parse_sizes, compare_to_baseline, missing_from_baseline, run_benchmarks, synthetic_results
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_parse_sizes(self):
+        self.assertEqual(parse_sizes("1k,100k,1M,250"), [1000, 100000, 1000000, 250])
+
+    def test_synthetic_results_are_reproducible(self):
+        self.assertEqual(synthetic_results(20, seed=4), synthetic_results(20, seed=4))
+        self.assertTrue(all(len(r["sampled_answers"]) == 5 for r in synthetic_results(20)))
+
+    def test_compare_to_baseline_flags_slowdowns_only(self):
+        baseline = {"results": [{"name": "a", "rows": 10, "seconds": 1.0}, {"name": "b", "rows": 10, "seconds": 1.0}]}
+        results = [
+            {"name": "a", "rows": 10, "seconds": 1.2},
+            {"name": "b", "rows": 10, "seconds": 2.0},
+            {"name": "c", "rows": 10, "seconds": 9.0},   # not in the baseline
+        ]
+        regressions = compare_to_baseline(results, baseline, tolerance=0.25)
+        self.assertEqual([(r[0], round(r[-1], 2)) for r in regressions], [("b", 2.0)])
+        self.assertEqual(missing_from_baseline(results, baseline), [("c", 10)])
+
+    def test_run_benchmarks_reports_each_case(self):
+        results = run_benchmarks([50], cases=["scoring", "io.load"], repeat=1)
+        self.assertEqual([r["name"] for r in results], ["scoring.scalar", "scoring.batch", "io.load", "io.load_columnar"])
+        self.assertTrue(all(r["rows"] == 50 and r["seconds"] >= 0 for r in results))
+
+if __name__ == '__main__':
+    unittest.main()
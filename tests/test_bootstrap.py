@@ -0,0 +1,45 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+from sklearn.metrics import roc_auc_score
+from bootstrap import _sorted_groups, bootstrap_ci, paired_comparison, weighted_metrics
+from selective_metrics import RiskCoverage
+
+class TestBootstrap(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.scores = np.round(rng.random(400), 1)  # many ties
+        self.errors = (rng.random(400) < self.scores).astype(float)
+
+    def test_weighted_metrics_match_direct_computation(self):
+        order, sorted_errors, starts = _sorted_groups(self.scores, self.errors)
+        index = np.random.default_rng(1).integers(0, 400, 400)
+        weights = np.stack([np.ones(400), np.bincount(index, minlength=400)])
+        auc, aurc = weighted_metrics(weights[:, order], sorted_errors, starts)
+        self.assertAlmostEqual(auc[0], roc_auc_score(self.errors, self.scores))
+        self.assertAlmostEqual(aurc[0], RiskCoverage(self.scores, self.errors).aurc)
+        self.assertAlmostEqual(auc[1], roc_auc_score(self.errors[index], self.scores[index]))
+        self.assertAlmostEqual(aurc[1], RiskCoverage(self.scores[index], self.errors[index]).aurc)
+
+    def test_ci_brackets_estimate(self):
+        ci = bootstrap_ci(self.scores, self.errors, num_resamples=500)
+        low, high = ci["roc_auc"]
+        self.assertLess(low, roc_auc_score(self.errors, self.scores))
+        self.assertGreater(high, roc_auc_score(self.errors, self.scores))
+
+    def test_ci_does_not_depend_on_workers(self):
+        # Chunks of 100 resamples; each chunk has its own seed, so the
+        # interval is the same whether chunks run in-process or on a pool.
+        with patch("bootstrap.MAX_CHUNK_ELEMENTS", 100 * 400):
+            serial = bootstrap_ci(self.scores, self.errors, num_resamples=500)
+            pooled = bootstrap_ci(self.scores, self.errors, num_resamples=500, workers=2)
+        self.assertEqual(serial, pooled)
+
+    def test_paired_comparison_of_identical_runs(self):
+        result = paired_comparison(self.scores, self.errors, self.scores, self.errors, num_resamples=200)
+        self.assertEqual(result["roc_auc"]["difference"], 0.0)
+        self.assertEqual(result["aurc"]["ci"], (0.0, 0.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import time
+import tempfile
+import unittest
+from datasets import Dataset, DatasetDict
+from prompts import build_messages
+from dataset_index import ArrowSplit, dataset_stats, index_path, load_index, stratified_sample
+
+CONTEXTS = ["Paris is the capital of France.", "Water boils at 100 degrees.\tAt sea level."]
+
+def example(i):
+    answerable = i % 4 != 0
+    return {
+        "id": f"q{i}",
+        "title": "t",
+        "context": CONTEXTS[i % 2],
+        "question": f"Question number {i} ?",
+        "answers": {"text": ["Paris"] if answerable else [], "answer_start": [0] if answerable else []},
+    }
+
+class TestDatasetIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "squad")
+        self.rows = [example(i) for i in range(40)]
+        DatasetDict({"validation": Dataset.from_list(self.rows)}).save_to_disk(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_columns_match_python(self):
+        index = load_index(self.path)
+        self.assertEqual(index.column("id").to_pylist(), [r["id"] for r in self.rows])
+        self.assertEqual(index.column("is_impossible").to_pylist(),
+                         [not r["answers"]["answer_start"] for r in self.rows])
+        self.assertEqual(index.column("group_id").to_pylist(), [i % 2 for i in range(40)])
+        self.assertEqual(index.column("question_words").to_pylist(), [len(r["question"].split()) for r in self.rows])
+        self.assertEqual(index.column("context_words").to_pylist(), [len(r["context"].split()) for r in self.rows])
+        self.assertEqual(index.column("prompt_tokens").to_pylist(),
+                         [sum(len(m["content"]) for m in build_messages(r)) // 4 for r in self.rows])
+        self.assertNotIn("prompt", index.column_names)
+
+        stats = dataset_stats(index)
+        self.assertEqual((stats["total"], stats["unanswerable"], stats["contexts"]), (40, 10, 2))
+
+    def test_arrow_split_matches_dataset(self):
+        split = ArrowSplit.load(self.path)
+        self.assertEqual(len(split), 40)
+        self.assertEqual(list(split), self.rows)
+        self.assertEqual(split[3], self.rows[3])
+        self.assertEqual(split["id"][:2], ["q0", "q1"])
+        self.assertEqual(list(split.select([5, 2])), [self.rows[5], self.rows[2]])
+
+    def test_stratified_sample_keeps_proportions(self):
+        index = load_index(self.path)
+        positions = stratified_sample(index, 20, seed=1)
+        self.assertEqual(len(positions), 20)
+        self.assertEqual(list(positions), sorted(set(positions)))
+        self.assertEqual(sum(self.rows[p]["answers"]["answer_start"] == [] for p in positions), 5)
+        self.assertEqual(list(positions), list(stratified_sample(index, 20, seed=1)))
+        self.assertEqual(len(stratified_sample(index, 100)), 40)
+
+    def test_rebuilds_when_stale(self):
+        load_index(self.path)
+        path = index_path(self.path)
+        past = time.time() - 60
+        os.utime(path, (past, past))
+        DatasetDict({"validation": Dataset.from_list(self.rows[:10])}).save_to_disk(self.path)
+        self.assertEqual(load_index(self.path).num_rows, 10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import json
+import tempfile
+import argparse
+import unittest
+from datasets import Dataset, DatasetDict
+from mock_llm_server import start_server
+from rate_limiter import parse_model_limits
+import experiment_runner
+from experiment_matrix import cell_path
+
+CONTEXT = "The town of Springfield was founded in 1801 by Jane Doe. It has 5000 residents."
+
+def example(i):
+    answerable = i % 3 != 0
+    return {
+        "id": f"q{i}",
+        "title": "t",
+        "context": CONTEXT,
+        "question": f"When was Springfield founded? ({i})" if answerable else f"Who discovered gold in Springfield? ({i})",
+        "answers": {"text": ["1801"] if answerable else [], "answer_start": [CONTEXT.find("1801")] if answerable else []},
+    }
+
+class TestExperimentMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        DatasetDict({"validation": Dataset.from_list([example(i) for i in range(12)])}).save_to_disk("squad")
+        self.server, self.base_url = start_server(model_latency={"slow": "constant:0.05"})
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        experiment_runner.client = experiment_runner.async_client = None
+        experiment_runner.response_cache = None
+        experiment_runner.native_n = True
+
+    def test_parse_model_limits(self):
+        self.assertEqual(parse_model_limits("a/b:free=4:2.5,c=8"), {"a/b:free": (4, 2.5, None), "c": (8, None, None)})
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_model_limits("a=fast")
+
+    def test_matrix_writes_every_cell(self):
+        experiment_runner.main([
+            "--dataset_path", "squad", "--num_samples", "12", "--output_file", "matrix.jsonl",
+            "--base_url", self.base_url, "--cache_path", "cache.sqlite", "--no_native_n",
+            "--models", "slow,fast", "--temperatures", "0.7,1.2", "--k_values", "2,4",
+            "--concurrency", "4", "--model_limits", "slow=16",
+        ])
+        with open("results/matrix_matrix.json") as f:
+            summary = json.load(f)
+        self.assertEqual(len(summary["cells"]), 8)
+        self.assertEqual(summary["models"]["slow"]["concurrency"], 16)
+        # Per example and model: one greedy call and 4 samples at each temperature.
+        self.assertEqual(summary["models"]["fast"]["rate_limiter"]["requests"], 12 * (1 + 2 * 4))
+        self.assertEqual(summary["models"]["slow"]["failed"], 0)
+
+        path = cell_path("results/matrix.jsonl", "fast", 1.2, 2)
+        self.assertEqual(path, "results/matrix_fast_t1.2_k2.jsonl")
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([r["id"] for r in rows], [f"q{i}" for i in range(12)])
+        self.assertTrue(all(len(r["sampled_answers"]) == 2 for r in rows))
+        with open(cell_path("results/matrix.jsonl", "fast", 1.2, 4)) as f:
+            longer = [json.loads(line) for line in f]
+        self.assertEqual([r["sampled_answers"][:2] for r in longer], [r["sampled_answers"] for r in rows])
+        with open("results/matrix_fast_t1.2_k2_metrics.json") as f:
+            self.assertEqual(json.load(f)["rows"], 12)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,80 @@
+import asyncio
 import unittest
-from scoring_utils import calculate_inconsistency_score
+from types import SimpleNamespace
+from unittest.mock import patch
+import experiment_runner
+from scoring_utils import (
+    calculate_inconsistency_score, calculate_inconsistency_scores, calculate_inconsistency_scores_by_k,
+    should_stop_sampling
+)
+
+def answer_for(question):
+    return "answer " + question.split()[-1].rstrip("?")
+
+def make_examples(contexts):
+    """One example per context label, e.g. "AAB" -> q0 and q1 about context A, q2 about B."""
+    return [
+        {"id": f"q{i}", "context": f"Context {label}.", "question": f"Question {i}?",
+         "answers": {"text": [answer_for(f"Question {i}?")], "answer_start": [0]}}
+        for i, label in enumerate(contexts)
+    ]
+
+class ListWriter:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+class StubModel:
+    """
+    Stands in for get_response_async and draw_samples: each question is
+    answered "answer <number>" after its delay in `delays`. Grouped requests
+    get numbered lines; greedy ones get `grouped_greedy` instead when set.
+    With `sampled(question, slot)` set, single-question samples come from it.
+    """
+
+    def __init__(self, delays=None, grouped_greedy=None, sampled=None):
+        self.delays = delays or {}
+        self.grouped_greedy = grouped_greedy
+        self.sampled = sampled
+        self.calls = []
+        self.slots = []
+
+    @staticmethod
+    def questions(messages):
+        content = messages[-1]["content"]
+        if "\n\nQuestions:\n" in content:
+            block = content.split("\n\nQuestions:\n", 1)[1].rsplit("\n\nAnswers:", 1)[0]
+            return [line.split(". ", 1)[1] for line in block.splitlines()]
+        return [content.split("\n\nQuestion: ", 1)[1].rsplit("\n\nAnswer:", 1)[0]]
+
+    async def get_response_async(self, model, messages, temperature=0.0, max_tokens=100, n=1, limiter=None, sample_index=None):
+        questions = self.questions(messages)
+        self.calls.append((temperature, questions))
+        await asyncio.sleep(max(self.delays.get(q, 0.0) for q in questions))
+        if len(questions) == 1:
+            return [answer_for(questions[0])]
+        if temperature == 0 and self.grouped_greedy is not None:
+            return [self.grouped_greedy]
+        return ["\n".join(f"{i}. {answer_for(q)}" for i, q in enumerate(questions, 1))]
+
+    async def draw_samples(self, model, messages, k, temperature=0.7, max_tokens=100, limiter=None, start=0):
+        self.slots.append((start, k))
+        if self.sampled is not None:
+            question = self.questions(messages)[0]
+            return [self.sampled(question, j) for j in range(start, k)]
+        drawn = await asyncio.gather(*[self.get_response_async(model, messages, temperature) for _ in range(start, k)])
+        return [choices[0] for choices in drawn]
+
+    def patch(self):
+        return patch.multiple(experiment_runner, get_response_async=self.get_response_async, draw_samples=self.draw_samples)
+
+def runner_args(**overrides):
+    args = dict(model_name="m", num_generations=3, k_values=None, adaptive=False, group_by_context=False,
+                group_size=5, concurrency=4, live_every=0)
+    args.update(overrides)
+    return SimpleNamespace(**args)
 
 class TestExperimentRunner(unittest.TestCase):
     
@@ -29,5 +104,135 @@ class TestExperimentRunner(unittest.TestCase):
         score = calculate_inconsistency_score(greedy, samples)
         self.assertEqual(score, 1.0) # 1 - 0.0 overlap
 
+    def test_calculate_inconsistency_scores_by_k_matches_prefixes(self):
+        greedy = "Paris is the capital of France"
+        samples = ["Paris", "", "the capital is Paris", "Lyon", "France's capital is Paris"]
+        by_k = calculate_inconsistency_scores_by_k(greedy, samples, [0, 1, 3, 5])
+        for k, score in by_k.items():
+            self.assertEqual(score, calculate_inconsistency_score(greedy, samples[:k]))
+
+    def test_should_stop_sampling(self):
+        greedy = "Paris"
+        # Two verbatim matches settle "answer"; two misses settle "abstain".
+        self.assertTrue(should_stop_sampling(greedy, ["Paris", "Paris"], threshold=0.5))
+        self.assertTrue(should_stop_sampling(greedy, ["Lyon", "Nice"], threshold=0.5))
+        # A split vote is not yet conclusive.
+        self.assertFalse(should_stop_sampling(greedy, ["Paris", "Lyon"], threshold=0.5))
+        self.assertTrue(should_stop_sampling("", [], threshold=0.5))
+
+    def test_calculate_inconsistency_scores_bit_identical(self):
+        greedy = ["Paris is the capital of France", "Paris is the capital of France", "", "Answer", "Paris", "the THE"]
+        samples = [
+            ["London is the capital of UK", "Berlin is in Germany"],
+            ["Paris is the capital of France"] * 3,
+            ["Something"],
+            ["", ""],
+            [],
+            ["The", "a the", "x"],
+        ]
+        batch = calculate_inconsistency_scores(greedy, samples)
+        self.assertEqual(len(batch), len(greedy))
+        for g, s, score in zip(greedy, samples, batch):
+            self.assertEqual(score, calculate_inconsistency_score(g, s))
+        self.assertEqual(len(calculate_inconsistency_scores([], [])), 0)
+
+class TestRunExamples(unittest.TestCase):
+
+    def run_examples(self, delays, concurrency):
+        model = StubModel(delays=delays)
+        writer = ListWriter()
+        with model.patch():
+            result = asyncio.run(experiment_runner.run_examples(
+                make_examples("ABCDEFGHIJ"), runner_args(concurrency=concurrency), None, writer))
+        return result, writer.rows
+
+    def test_concurrent_run_matches_sequential_run(self):
+        # Later examples answer first, so completion order is reversed.
+        delays = {f"Question {i}?": 0.01 * (10 - i) for i in range(10)}
+        (written, failures), rows = self.run_examples(delays, concurrency=8)
+        _, sequential = self.run_examples({}, concurrency=1)
+        self.assertEqual((written, failures), (10, []))
+        self.assertEqual([r["id"] for r in rows], [f"q{i}" for i in range(10)])
+        self.assertEqual(rows, sequential)
+
+class TestAdaptiveSampling(unittest.TestCase):
+
+    def process(self, model, **overrides):
+        args = runner_args(adaptive=True, num_generations=7, round_size=2, threshold=0.5, confidence=0.9, **overrides)
+        with model.patch():
+            return asyncio.run(experiment_runner.process_example(make_examples("A")[0], args, None))
+
+    def test_agreeing_samples_stop_after_first_round(self):
+        model = StubModel()
+        row = self.process(model)
+        self.assertEqual(row["num_samples_used"], 2)
+        self.assertEqual(row["sampled_answers"], ["answer 0", "answer 0"])
+        self.assertEqual(model.slots, [(0, 2)])
+
+    def test_split_vote_is_capped_at_num_generations(self):
+        model = StubModel(sampled=lambda question, slot: answer_for(question) if slot % 2 == 0 else "something else")
+        row = self.process(model)
+        self.assertEqual(row["num_samples_used"], 7)
+        self.assertEqual(len(row["sampled_answers"]), 7)
+        # Rounds of 2 continue from the samples already drawn.
+        self.assertEqual(model.slots, [(0, 2), (2, 4), (4, 6), (6, 7)])
+
+    def test_disagreeing_samples_stop_early_with_high_score(self):
+        row = self.process(StubModel(sampled=lambda question, slot: f"unrelated guess{slot}"))
+        self.assertEqual(row["num_samples_used"], 2)
+        self.assertEqual(row["consistency_score"], 1.0)
+
+class TestKValues(unittest.TestCase):
+
+    def setUp(self):
+        # Only the first 3 samples agree with the greedy answer.
+        self.model = StubModel(sampled=lambda question, slot: answer_for(question) if slot < 3 else "something else")
+        self.args = runner_args(num_generations=3, k_values=[3, 5, 10])
+
+    def check(self, row):
+        self.assertEqual(len(row["sampled_answers"]), 10)
+        self.assertEqual(row["consistency_score"], row["consistency_scores_by_k"]["3"])
+        self.assertEqual(row["consistency_score"], 0.0)
+        self.assertGreater(row["consistency_scores_by_k"]["10"], 0.0)
+
+    def test_single_example_scores_num_generations(self):
+        with self.model.patch():
+            self.check(asyncio.run(experiment_runner.process_example(make_examples("A")[0], self.args, None)))
+
+    def test_grouped_examples_score_num_generations(self):
+        with self.model.patch():
+            rows = asyncio.run(experiment_runner.process_group(make_examples("AA"), self.args, None))
+        for row in rows:
+            self.check(row)
+
+class TestContextGrouping(unittest.TestCase):
+
+    def test_grouped_answers_are_parsed_per_question(self):
+        model = StubModel()
+        with model.patch():
+            rows = asyncio.run(experiment_runner.process_group(make_examples("AAA"), runner_args(), None))
+        self.assertEqual([r["id"] for r in rows], ["q0", "q1", "q2"])
+        self.assertEqual([r["greedy_answer"] for r in rows], ["answer 0", "answer 1", "answer 2"])
+        self.assertTrue(all(r["sampled_answers"] == [r["greedy_answer"]] * 3 for r in rows))
+        self.assertTrue(all(len(questions) == 3 for _, questions in model.calls))
+
+    def test_unparsable_greedy_falls_back_to_single_questions(self):
+        model = StubModel(grouped_greedy="I am not sure.")
+        with model.patch():
+            rows = asyncio.run(experiment_runner.process_group(make_examples("AA"), runner_args(), None))
+        self.assertEqual([r["greedy_answer"] for r in rows], ["answer 0", "answer 1"])
+        greedy_calls = [questions for temperature, questions in model.calls if temperature == 0]
+        self.assertEqual(greedy_calls, [["Question 0?", "Question 1?"], ["Question 0?"], ["Question 1?"]])
+
+    def test_grouped_rows_are_written_in_dataset_order(self):
+        model = StubModel(delays={"Question 3?": 0.05})
+        writer = ListWriter()
+        with model.patch():
+            written, failures = asyncio.run(experiment_runner.run_examples(
+                make_examples("AAABBBAC"), runner_args(group_by_context=True), None, writer))
+        self.assertEqual((written, failures), (8, []))
+        self.assertEqual([r["id"] for r in writer.rows], [f"q{i}" for i in range(8)])
+        self.assertEqual([r["greedy_answer"] for r in writer.rows], [f"answer {i}" for i in range(8)])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+from hedging import Hedger, first_completed
+from rate_limiter import RateLimiter
+
+def delayed(value, delay, log=None, error=None):
+    async def call():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append(("cancelled", value))
+            raise
+        if error is not None:
+            raise error
+        return value
+    return call
+
+class TestFirstCompleted(unittest.TestCase):
+
+    def test_keeps_fastest_and_cancels_rest(self):
+        log = []
+        calls = [delayed(v, d, log) for v, d in [("slow", 0.5), ("a", 0.01), ("b", 0.02), ("c", 0.03)]]
+        results = asyncio.run(first_completed(calls, 2))
+        self.assertEqual(results, ["a", "b"])
+        self.assertEqual(sorted(log), [("cancelled", "c"), ("cancelled", "slow")])
+
+    def test_tolerates_failures_while_enough_remain(self):
+        calls = [delayed("x", 0.0, error=ValueError("bad")), delayed("a", 0.01), delayed("b", 0.02)]
+        self.assertEqual(asyncio.run(first_completed(calls, 2)), ["a", "b"])
+        with self.assertRaises(ValueError):
+            asyncio.run(first_completed(calls, 3))
+
+class TestHedger(unittest.TestCase):
+
+    def test_slow_call_is_hedged_and_loser_cancelled(self):
+        async def scenario():
+            hedger = Hedger(percentile=50, budget=1.0, min_samples=3)
+            for _ in range(3):
+                await hedger.run(delayed("fast", 0.01))
+            log = []
+            delays = iter([1.0, 0.01])   # slow primary, quick hedge
+            async def factory():
+                return await delayed("done", next(delays), log)()
+            result = await hedger.run(factory)
+            return hedger, result, log
+        hedger, result, log = asyncio.run(scenario())
+        self.assertEqual(result, "done")
+        self.assertEqual(hedger.stats["hedges"], 1)
+        self.assertEqual(hedger.stats["hedge_wins"], 1)
+        self.assertEqual(log, [("cancelled", "done")])
+
+    def test_budget_caps_hedges(self):
+        async def scenario():
+            hedger = Hedger(percentile=50, budget=0.0, min_samples=1)
+            hedger.latencies.append(0.001)
+            await hedger.run(delayed("slow", 0.05))
+            return hedger
+        hedger = asyncio.run(scenario())
+        self.assertEqual(hedger.stats["hedges"], 0)
+        self.assertEqual(hedger.stats["over_budget"], 1)
+
+    def test_cancelled_primary_is_recorded_as_lower_bound(self):
+        async def scenario():
+            hedger = Hedger(percentile=50, budget=1.0, min_samples=3)
+            for _ in range(3):
+                await hedger.run(delayed("fast", 0.01))
+            delays = iter([1.0, 0.02])
+            async def factory():
+                return await delayed("done", next(delays))()
+            await hedger.run(factory)
+            return hedger
+        hedger = asyncio.run(scenario())
+        # Only the primary is recorded: about trigger (0.01) + hedge (0.02).
+        self.assertEqual(len(hedger.latencies), 4)
+        self.assertGreaterEqual(hedger.latencies[-1], 0.025)
+
+    def test_duplicates_share_their_primarys_limiter_slot(self):
+        async def scenario():
+            limiter = RateLimiter(max_concurrency=1)
+            hedger = Hedger(percentile=50, budget=1.0, min_samples=1)
+            hedger.latencies.append(0.01)
+            delays = iter([0.2, 0.01])
+            async def factory():
+                return await delayed("done", next(delays))()
+            await limiter.call_async(lambda: hedger.run(factory, lambda: limiter.call_extra(factory)))
+            return hedger, limiter
+        # The primary holds the only slot, yet the duplicate starts and wins.
+        hedger, limiter = asyncio.run(scenario())
+        self.assertEqual((hedger.stats["hedges"], hedger.stats["hedge_wins"]), (1, 1))
+        self.assertEqual(limiter.stats["requests"], 2)
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+
+    def test_no_hedging_before_min_samples(self):
+        self.assertIsNone(Hedger(min_samples=5).trigger_delay())
+
+if __name__ == '__main__':
+    unittest.main()
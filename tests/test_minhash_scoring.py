@@ -0,0 +1,83 @@
+import os
+import math
+import random
+import zlib
+import tempfile
+import unittest
+import numpy as np
+from scoring_utils import calculate_inconsistency_scores, calculate_scores
+from minhash_scoring import (EMPTY, MinHasher, SignatureStore, agreement_matrix, cluster_scores,
+                             compare_to_exact, error_bound, minhash_scores, pairwise_scores)
+
+def random_answers(n, k, seed=0):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(40)]
+    greedy = [" ".join(rng.sample(words, rng.randint(1, 12))) for _ in range(n)]
+    sampled = [[" ".join(rng.sample(words, rng.randint(0, 12))) for _ in range(k)] for _ in range(n)]
+    return greedy, sampled
+
+class TestMinHashScoring(unittest.TestCase):
+
+    def test_signatures_match_naive_minimum(self):
+        hasher = MinHasher(num_perm=16)
+        texts = ["The cat sat", "", "a b c d e", "dog"]
+        signatures = hasher.signatures(texts)
+        for text, signature in zip(texts, signatures):
+            tokens = set(text.lower().split())
+            if not tokens:
+                self.assertTrue(np.all(signature == EMPTY))
+                continue
+            hashes = [zlib.crc32(t.encode("utf-8")) for t in tokens]
+            expected = [min((int(a) * h + int(b)) % ((1 << 61) - 1) & 0xFFFFFFFF for h in hashes)
+                        for a, b in zip(hasher.a, hasher.b)]
+            self.assertEqual(signature.tolist(), expected)
+
+    def test_identical_disjoint_and_empty_answers(self):
+        greedy = ["paris france", "paris", "", "42"]
+        sampled = [["France Paris"] * 3, ["london", "berlin"], ["x"], []]
+        for scorer in ("minhash", "minhash_pairwise", "minhash_cluster"):
+            scores = calculate_scores(greedy, sampled, scorer)
+            self.assertEqual(scores[0], 0.0, scorer)
+            self.assertEqual(scores[2], 1.0, scorer)
+            self.assertEqual(scores[3], 0.0, scorer)
+        self.assertEqual(minhash_scores(greedy, sampled)[1], 1.0)
+        self.assertEqual(pairwise_scores(greedy, sampled)[1], 1.0)
+
+    def test_errors_within_bound(self):
+        greedy, sampled = random_answers(300, 8)
+        report = compare_to_exact(greedy, sampled, SignatureStore(MinHasher(num_perm=256)), delta=0.01)
+        for name in ("minhash", "minhash_pairwise"):
+            self.assertEqual(report[name]["within_bound"], 1.0, name)
+            self.assertLess(report[name]["mean_abs_error"], 0.05, name)
+        exact = calculate_inconsistency_scores(greedy, sampled)
+        np.testing.assert_allclose(calculate_scores(greedy, sampled, "exact"), exact)
+        self.assertAlmostEqual(error_bound(128, 1, 0.05), math.sqrt(math.log(40) / 256))
+
+    def test_pairwise_is_mean_off_diagonal_agreement(self):
+        greedy, sampled = random_answers(5, 6, seed=1)
+        store = SignatureStore()
+        scores = pairwise_scores(greedy, sampled, store)
+        for g, s, score in zip(greedy, sampled, scores):
+            matrix = agreement_matrix([g, *s], store)
+            m = len(matrix)
+            self.assertAlmostEqual(score, 1.0 - (matrix.sum() - np.trace(matrix)) / (m * (m - 1)))
+
+    def test_cluster_entropy(self):
+        scores = cluster_scores(["a b c", "a b c"], [["a b c", "a b c", "x y z", "x y z", "x y z"], ["a b c"] * 5])
+        self.assertAlmostEqual(scores[0], math.log(2) / math.log(6))
+        self.assertEqual(scores[1], 0.0)
+
+    def test_store_round_trip(self):
+        store = SignatureStore(MinHasher(num_perm=32))
+        rows = store.rows(["a b", "c", "a b"])
+        self.assertEqual(rows.tolist(), [0, 1, 0])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "signatures.npz")
+            store.save(path)
+            loaded = SignatureStore.load(path, num_perm=32)
+            self.assertEqual(loaded.index, store.index)
+            np.testing.assert_array_equal(loaded.matrix, store.matrix)
+            self.assertEqual(len(SignatureStore.load(path, num_perm=64).index), 0)
+
+if __name__ == "__main__":
+    unittest.main()
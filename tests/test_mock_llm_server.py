@@ -0,0 +1,132 @@
+import json
+import asyncio
+import unittest
+import urllib.request
+import urllib.error
+import mock_llm_server
+from mock_llm_server import MockLLMServer, start_server, candidate_answers
+from prompts import build_messages, build_grouped_messages
+from rate_limiter import RateLimiter
+import experiment_runner
+
+CONTEXT = "The city of Springfield was founded in 1801 by Jane Doe. It has 5000 residents."
+
+def post(base_url, body):
+    request = urllib.request.Request(
+        f"{base_url}/chat/completions", data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+class TestMockLLMServer(unittest.TestCase):
+
+    def test_candidate_answers_fit_question(self):
+        candidates, support = candidate_answers(CONTEXT, "When was Springfield founded?")
+        self.assertEqual(candidates[0], "1801")
+        self.assertEqual(support, 1.0)
+
+    def test_chat_completion_honours_n_and_is_deterministic(self):
+        messages = build_messages({"context": CONTEXT, "question": "When was Springfield founded?"})
+        texts = []
+        for _ in range(2):
+            server, base_url = start_server(seed=3)
+            try:
+                greedy = post(base_url, {"model": "m", "messages": messages, "temperature": 0.0})
+                sampled = post(base_url, {"model": "m", "messages": messages, "temperature": 1.0, "n": 4})
+            finally:
+                server.shutdown()
+                server.server_close()
+            self.assertEqual(greedy["choices"][0]["message"]["content"], "1801")
+            self.assertEqual(len(sampled["choices"]), 4)
+            self.assertGreater(sampled["usage"]["prompt_tokens"], 0)
+            texts.append([c["message"]["content"] for c in sampled["choices"]])
+        self.assertEqual(texts[0], texts[1])
+
+    def test_grouped_prompt_and_n_cap(self):
+        examples = [{"context": CONTEXT, "question": q} for q in ["When was Springfield founded?", "Who founded Springfield?"]]
+        server, base_url = start_server(n_mode="cap:1")
+        try:
+            response = post(base_url, {"model": "m", "messages": build_grouped_messages(examples), "n": 3})
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(len(response["choices"]), 1)
+        self.assertEqual(response["choices"][0]["message"]["content"], "1. 1801\n2. Jane Doe")
+
+    def test_draw_counts_are_bounded(self):
+        server = MockLLMServer(("127.0.0.1", 0), seed=3)
+        limit = mock_llm_server.MAX_TRACKED_PROMPTS
+        mock_llm_server.MAX_TRACKED_PROMPTS = 2
+        try:
+            prompts = [build_messages({"context": CONTEXT, "question": f"Who lives in Springfield {i}?"}) for i in range(3)]
+            first = server.complete(prompts[0], 1.0, 4)
+            self.assertNotEqual(server.complete(prompts[0], 1.0, 4), first)
+            server.complete(prompts[1], 1.0, 1)
+            server.complete(prompts[2], 1.0, 1)
+            self.assertEqual(len(server.draws), 2)
+            # Forgotten, so it starts again at draw 0.
+            self.assertEqual(server.complete(prompts[0], 1.0, 4), first)
+        finally:
+            mock_llm_server.MAX_TRACKED_PROMPTS = limit
+            server.server_close()
+
+    def test_injected_rate_limit_sends_retry_after(self):
+        server, base_url = start_server(rate_limit_rate=1.0, retry_after=2.5)
+        try:
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                post(base_url, {"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(raised.exception.code, 429)
+        self.assertEqual(raised.exception.headers["Retry-After"], "2.5")
+
+class TestRunnerAgainstMock(unittest.TestCase):
+
+    def draw(self, n_mode, k=10, latency="constant:0", max_concurrency=4):
+        server, base_url = start_server(n_mode=n_mode, latency=latency)
+        experiment_runner.client, experiment_runner.async_client = experiment_runner.make_clients(base_url)
+        experiment_runner.max_choices.clear()
+        experiment_runner._probe_locks.clear()
+        limiter = self.limiter = RateLimiter(max_concurrency=max_concurrency)
+        messages = build_messages({"context": CONTEXT, "question": "Who lives in Springfield?"})
+
+        async def run():
+            try:
+                return await experiment_runner.draw_samples("m", messages, k, limiter=limiter)
+            finally:
+                await experiment_runner.async_client.close()
+        try:
+            samples = asyncio.run(run())
+        finally:
+            server.shutdown()
+            server.server_close()
+        return samples, limiter.stats["requests"]
+
+    def test_native_n_with_top_up(self):
+        # One probe, then 10 samples as n=4, 4, 2.
+        samples, requests = self.draw("cap:4")
+        self.assertEqual(len(samples), 10)
+        self.assertEqual(requests, 1 + 3)
+        self.assertEqual(experiment_runner.max_choices["m"], 4)
+
+    def test_models_ignoring_n_fall_back_to_single_requests(self):
+        samples, requests = self.draw("ignore")
+        self.assertEqual(len(samples), 10)
+        self.assertEqual(requests, 1 + 10)
+
+    def test_overprovisioned_draws_keep_the_first_k(self):
+        experiment_runner.overprovision = 3
+        try:
+            samples, requests = self.draw("ignore", k=4, latency="uniform:0.01,0.2", max_concurrency=16)
+        finally:
+            experiment_runner.overprovision = 0
+        self.assertEqual(len(samples), 4)
+        self.assertTrue(all(isinstance(sample, str) for sample in samples))
+        # One probe, then 4 + 3 single requests; the 3 slowest are cancelled.
+        self.assertEqual(requests, 1 + 4 + 3)
+        self.assertEqual(self.limiter.concurrency.in_flight, 0)
+
+if __name__ == '__main__':
+    unittest.main()
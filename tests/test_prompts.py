@@ -0,0 +1,27 @@
+import unittest
+from prompts import build_grouped_messages, group_by_context, parse_numbered_answers
+
+def example(i, context):
+    return {"id": str(i), "context": context, "question": f"Question {i}?"}
+
+class TestPrompts(unittest.TestCase):
+
+    def test_parse_numbered_answers(self):
+        self.assertEqual(parse_numbered_answers("1. Paris\n2) 1889\n3: Gustave Eiffel", 3), ["Paris", "1889", "Gustave Eiffel"])
+        self.assertEqual(parse_numbered_answers("Answers:\n 2. b\n1. a", 2), ["a", "b"])
+        self.assertIsNone(parse_numbered_answers("1. a\n3. c", 2))   # missing 2, out of range 3
+        self.assertIsNone(parse_numbered_answers("1. a\n1. b", 2))   # duplicate
+        self.assertIsNone(parse_numbered_answers(None, 1))
+
+    def test_group_by_context_keeps_first_appearance_order(self):
+        examples = [example(0, "A"), example(1, "B"), example(2, "A"), example(3, "A")]
+        groups = [[e["id"] for e in g] for g in group_by_context(examples, group_size=2)]
+        self.assertEqual(groups, [["0", "2"], ["3"], ["1"]])
+
+    def test_grouped_prompt_sends_context_once(self):
+        messages = build_grouped_messages([example(0, "Some context"), example(1, "Some context")])
+        self.assertEqual(messages[1]["content"].count("Some context"), 1)
+        self.assertIn("1. Question 0?\n2. Question 1?", messages[1]["content"])
+
+if __name__ == '__main__':
+    unittest.main()
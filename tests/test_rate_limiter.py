@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from rate_limiter import (
+    AdaptiveConcurrency, RateLimiter, RequestFailedError, TokenBucket, parse_retry_after
+)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def api_error(status, headers=None):
+    error = Exception(f"HTTP {status}")
+    error.status_code = status
+    error.response = SimpleNamespace(headers=headers or {})
+    return error
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket_queues_reservations(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        # Bucket is empty: the next two callers wait one and two refill periods.
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+        self.assertAlmostEqual(bucket.reserve(), 1.0)
+        clock.now = 10.0
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after(api_error(429, {"retry-after": "3"})), 3.0)
+        self.assertEqual(parse_retry_after(api_error(429, {"retry-after-ms": "250"})), 0.25)
+        self.assertIsNone(parse_retry_after(api_error(429)))
+
+    def test_aimd_halves_once_per_window(self):
+        concurrency = AdaptiveConcurrency(max_limit=16)
+        epoch = concurrency.epoch
+        concurrency.on_throttle(epoch)
+        concurrency.on_throttle(epoch)  # same overloaded window, ignored
+        self.assertEqual(concurrency.limit, 8.0)
+        for _ in range(8):
+            concurrency.on_success()
+        self.assertAlmostEqual(concurrency.limit, 9.0, delta=0.1)
+
+    def test_call_retries_then_reports_failure(self):
+        limiter = RateLimiter(max_retries=3, base_delay=0.0)
+        attempts = []
+
+        async def throttled():
+            attempts.append(1)
+            raise api_error(429, {"retry-after": "0"})
+
+        with self.assertRaises(RequestFailedError) as ctx:
+            asyncio.run(limiter.call_async(throttled))
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(ctx.exception.attempts, 3)
+        self.assertEqual(limiter.stats["throttles"], 2)
+
+    def test_client_errors_are_not_retried(self):
+        limiter = RateLimiter(max_retries=5, base_delay=0.0)
+        attempts = []
+
+        def bad_request():
+            attempts.append(1)
+            raise api_error(400)
+
+        with self.assertRaises(RequestFailedError):
+            limiter.call(bad_request)
+        self.assertEqual(len(attempts), 1)
+
+if __name__ == '__main__':
+    unittest.main()
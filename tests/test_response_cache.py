@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+from response_cache import ResponseCache, request_key
+from sample_pool import SamplePool
+
+MESSAGES = [{"role": "user", "content": "Context: ...\n\nQuestion: Who?\n\nAnswer:"}]
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.tmp.name, "cache.sqlite"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip_keeps_usage(self):
+        key = request_key("m", MESSAGES, 0.0, 100)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, "m", ["Paris"], {"prompt_tokens": 12, "completion_tokens": 1})
+        cached = self.cache.get(key)
+        self.assertEqual(cached["choices"], ["Paris"])
+        self.assertEqual(cached["usage"], {"prompt_tokens": 12, "completion_tokens": 1})
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_key_covers_full_request(self):
+        base = request_key("m", MESSAGES, 0.7, 100, sample_index=0)
+        self.assertEqual(base, request_key("m", [dict(m) for m in MESSAGES], 0.7, 100, sample_index=0))
+        self.assertNotEqual(base, request_key("m", MESSAGES, 0.7, 100, sample_index=1))
+        self.assertNotEqual(base, request_key("m", MESSAGES, 0.0, 100, sample_index=0))
+        self.assertNotEqual(base, request_key("other", MESSAGES, 0.7, 100, sample_index=0))
+
+    def test_evict_oldest_beyond_size(self):
+        for i in range(5):
+            self.cache.put(str(i), "m", ["x" * 100])
+        removed = self.cache.evict(max_bytes=250)
+        self.assertEqual(removed, 3)
+        self.assertIsNone(self.cache.get("0"))
+        self.assertIsNotNone(self.cache.get("4"))
+        self.assertEqual(self.cache.evict(max_age_seconds=-1), 2)
+
+    def test_model_capabilities_persist(self):
+        self.assertIsNone(self.cache.get_max_n("m"))
+        self.cache.set_max_n("m", 16)
+        self.cache.set_max_n("m", 4)
+        reopened = ResponseCache(self.cache.path)
+        self.assertEqual(reopened.get_max_n("m"), 4)
+
+    def test_sample_pool_reuses_prefix(self):
+        pool = SamplePool(self.cache)
+        for j, text in enumerate(["a", "b", "c"]):
+            pool.store("m", MESSAGES, 0.7, 100, j, text)
+        self.assertEqual(pool.lookup("m", MESSAGES, 0.7, 100, 2), ["a", "b"])
+        self.assertEqual(pool.lookup("m", MESSAGES, 0.7, 100, 5), ["a", "b", "c", None, None])
+        # Slots share keys with the per-sample requests get_response caches.
+        self.assertIsNotNone(self.cache.get(request_key("m", MESSAGES, 0.7, 100, 1, 2)))
+
+if __name__ == '__main__':
+    unittest.main()
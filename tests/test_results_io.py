@@ -0,0 +1,101 @@
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+from results_io import (
+    LazyColumn, ResultWriter, completed_ids, convert_results, iter_results, load_results, read_columns, result_columns
+)
+from analyze_results import load_labels
+
+ROWS = [
+    {"id": "a", "question": "Q?", "is_impossible": False, "greedy_answer": "Paris", "sampled_answers": ["Paris"],
+     "consistency_score": 0.0, "gold_answers": ["Paris"], "consistency_scores_by_k": {"1": 0.0}, "note": {"x": 1}},
+    {"id": "b", "question": "Q?", "is_impossible": True, "greedy_answer": "1889", "sampled_answers": ["1890"],
+     "consistency_score": 1.0, "gold_answers": [], "consistency_scores_by_k": {"1": 1.0}, "note": {"x": 2}},
+    {"id": "c", "question": "Q?", "is_impossible": False, "greedy_answer": "Lyon", "sampled_answers": ["Nice"],
+     "consistency_score": 0.5, "gold_answers": ["Paris"], "consistency_scores_by_k": {"1": 0.5}, "note": {"x": 3}},
+]
+
+class TestResultsIO(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "results", "run.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stream_roundtrip(self):
+        rows = [{"id": str(i), "consistency_score": i / 10} for i in range(3)]
+        with ResultWriter(self.path) as writer:
+            for row in rows:
+                writer.write(row)
+        self.assertEqual(load_results(self.path), rows)
+        self.assertEqual(completed_ids(self.path), {"0", "1", "2"})
+
+    def test_resume_after_truncated_write(self):
+        with ResultWriter(self.path) as writer:
+            writer.write({"id": "a"})
+        with open(self.path, "a") as f:
+            f.write('{"id": "b", "consis')  # crash mid-write
+        self.assertEqual(completed_ids(self.path), {"a"})
+
+        with ResultWriter(self.path, append=True) as writer:
+            writer.write({"id": "b"})
+        self.assertEqual([row["id"] for row in iter_results(self.path)], ["a", "b"])
+
+    def test_reads_legacy_json_array(self):
+        legacy = os.path.join(self.tmp.name, "old.json")
+        with open(legacy, "w") as f:
+            json.dump([{"id": "x"}], f, indent=2)
+        self.assertEqual(load_results(legacy), [{"id": "x"}])
+
+    def test_columnar_roundtrip_and_column_reads(self):
+        with ResultWriter(self.path) as writer:
+            for row in ROWS:
+                writer.write(row)
+        for ext in (".arrow", ".parquet"):
+            dest = self.path.replace(".jsonl", ext)
+            self.assertEqual(convert_results(self.path, dest, batch_rows=2), 3)
+            self.assertIn("is_error", result_columns(dest))
+
+            data = read_columns(dest, ["consistency_score", "is_error", "greedy_answer"])
+            self.assertIsInstance(data["consistency_score"], np.ndarray)
+            self.assertEqual(data["is_error"].tolist(), [False, True, True])
+            self.assertIsInstance(data["greedy_answer"], LazyColumn)
+            self.assertEqual(data["greedy_answer"][2], "Lyon")
+
+            rows = load_results(dest)
+            self.assertEqual(rows[1]["sampled_answers"], ["1890"])
+            self.assertEqual(dict(rows[1]["consistency_scores_by_k"]), {"1": 1.0})
+            self.assertEqual(json.loads(rows[2]["note"]), {"x": 3})
+
+    def test_fields_of_later_rows_are_converted(self):
+        rows = [dict(ROWS[0]), dict(ROWS[1], num_samples_used=4), dict(ROWS[2], num_samples_used=7)]
+        del rows[0]["consistency_scores_by_k"]
+        with ResultWriter(self.path) as writer:
+            for row in rows:
+                writer.write(row)
+        arrow = self.path.replace(".jsonl", ".arrow")
+        convert_results(self.path, arrow)
+        self.assertIn("num_samples_used", result_columns(arrow))
+        from_jsonl = read_columns(self.path, ["num_samples_used"])["num_samples_used"]
+        from_arrow = read_columns(arrow, ["num_samples_used"])["num_samples_used"]
+        np.testing.assert_array_equal(from_jsonl, [np.nan, 4.0, 7.0])
+        np.testing.assert_array_equal(from_arrow, from_jsonl)
+        self.assertEqual(from_arrow.dtype, from_jsonl.dtype)
+        self.assertIsNone(load_results(arrow)[0]["consistency_scores_by_k"])
+
+    def test_labels_match_between_formats(self):
+        with ResultWriter(self.path) as writer:
+            for row in ROWS:
+                writer.write(row)
+        arrow = self.path.replace(".jsonl", ".arrow")
+        convert_results(self.path, arrow)
+        from_jsonl, from_arrow = load_labels(self.path), load_labels(arrow)
+        for name in ("consistency_score", "is_impossible", "is_error"):
+            np.testing.assert_array_equal(from_jsonl[name], from_arrow[name])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+from sklearn.metrics import auc, roc_auc_score
+from selective_metrics import RiskCoverage, IncrementalMetrics
+from live_metrics import follow
+
+class TestSelectiveMetrics(unittest.TestCase):
+
+    def test_matches_per_sample_curve_without_ties(self):
+        rng = np.random.default_rng(0)
+        scores = rng.random(200)
+        errors = rng.random(200) < 0.3
+        rc = RiskCoverage(scores, errors)
+        sorted_errors = errors[np.argsort(scores)]
+        risks = np.cumsum(sorted_errors) / np.arange(1, 201)
+        np.testing.assert_allclose(rc.risk, risks)
+        np.testing.assert_allclose(rc.coverage, np.arange(1, 201) / 200)
+        # Same value the previous per-sample loop got from sklearn.metrics.auc
+        self.assertAlmostEqual(rc.aurc, auc(np.arange(1, 201) / 200, risks))
+
+    def test_tied_scores_share_one_point(self):
+        rc = RiskCoverage([0.0, 0.0, 0.5, 0.5, 1.0], [0, 1, 0, 1, 1])
+        np.testing.assert_array_equal(rc.thresholds, [0.0, 0.5, 1.0])
+        np.testing.assert_allclose(rc.coverage, [0.4, 0.8, 1.0])
+        np.testing.assert_allclose(rc.risk, [0.5, 0.5, 0.6])
+
+    def test_threshold_grid_matches_brute_force(self):
+        rng = np.random.default_rng(1)
+        scores = np.round(rng.random(300), 1)  # plenty of ties
+        errors = rng.random(300) < 0.4
+        thresholds = np.linspace(-0.1, 1, 37)
+        coverage, risk = RiskCoverage(scores, errors).at_thresholds(thresholds)
+        for t, cov, r in zip(thresholds, coverage, risk):
+            answered = scores <= t
+            self.assertAlmostEqual(cov, answered.mean())
+            self.assertAlmostEqual(r, errors[answered].mean() if answered.any() else 0.0)
+
+    def test_selective_accuracy_at_coverage(self):
+        rc = RiskCoverage([0.1, 0.2, 0.3, 0.4], [0, 0, 1, 1])
+        thresholds, coverage, risk, accuracy = rc.at_coverages([0.5, 1.0])
+        np.testing.assert_allclose(thresholds, [0.2, 0.4])
+        np.testing.assert_allclose(coverage, [0.5, 1.0])
+        np.testing.assert_allclose(accuracy, [1.0, 0.5])
+
+    def test_roc_auc_matches_sklearn_with_ties(self):
+        rng = np.random.default_rng(3)
+        scores = np.round(rng.random(400), 1)
+        errors = rng.random(400) < scores
+        self.assertAlmostEqual(RiskCoverage(scores, errors).roc_auc, roc_auc_score(errors, scores))
+
+    def test_recommended_threshold_is_widest_within_target(self):
+        rc = RiskCoverage([0.1, 0.2, 0.3, 0.4], [0, 0, 1, 1])
+        self.assertEqual(rc.recommended_threshold(0.4)["threshold"], 0.3)
+        self.assertEqual(rc.recommended_threshold(0.0)["coverage"], 0.5)
+        missed = RiskCoverage([0.1, 0.2], [1, 1]).recommended_threshold(0.1)
+        self.assertFalse(missed["meets_target"])
+
+class TestIncrementalMetrics(unittest.TestCase):
+
+    def test_matches_batch_metrics_on_discrete_scores(self):
+        rng = np.random.default_rng(2)
+        scores = np.round(rng.random(500), 2)
+        errors = rng.random(500) < scores
+        metrics = IncrementalMetrics()
+        for score, error in zip(scores, errors):
+            metrics.update(score, error)
+        rc = RiskCoverage(scores, errors)
+        self.assertAlmostEqual(metrics.base_error_rate, errors.mean())
+        self.assertAlmostEqual(metrics.roc_auc, roc_auc_score(errors, scores))
+        self.assertAlmostEqual(metrics.aurc, rc.aurc)
+        self.assertEqual(metrics.recommended_threshold(0.2), rc.recommended_threshold(0.2))
+
+    def test_follow_reads_a_finished_file(self):
+        rows = [{"id": str(i), "consistency_score": s, "is_impossible": False,
+                 "greedy_answer": a, "gold_answers": ["Paris"]}
+                for i, (s, a) in enumerate([(0.0, "Paris"), (0.5, "Rome"), (0.9, "Lyon")])]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "results.jsonl")
+            with open(path, "w") as f:
+                f.writelines(json.dumps(row) + "\n" for row in rows)
+            metrics = follow(path, follow=False)
+        self.assertEqual(metrics.n, 3)
+        self.assertAlmostEqual(metrics.base_error_rate, 2 / 3)
+        self.assertEqual(metrics.roc_auc, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import argparse
+import tempfile
+import unittest
+from results_io import ResultWriter, load_results
+from sharding import (
+    MergeError, merge_shards, parse_shard, shard_of, shard_path, shard_positions, write_manifest
+)
+
+IDS = [f"q{i}" for i in range(50)]
+
+class TestSharding(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, "results.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_shard(self, index, num_shards, rows=None):
+        positions = shard_positions(IDS, index, num_shards)
+        path = shard_path(self.output, index, num_shards)
+        write_manifest(path, {"num_shards": num_shards, "ids": [IDS[p] for p in positions], "positions": positions})
+        with ResultWriter(path) as writer:
+            for example_id in rows if rows is not None else [IDS[p] for p in reversed(positions)]:
+                writer.write({"id": example_id})
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        for bad in ["4/4", "-1/4", "1", "a/b"]:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_shard(bad)
+
+    def test_shards_partition_ids(self):
+        shards = [shard_positions(IDS, i, 3) for i in range(3)]
+        self.assertEqual(sorted(p for s in shards for p in s), list(range(len(IDS))))
+        self.assertEqual(shard_of("q7", 3), shard_of("q7", 3))
+
+    def test_merge_restores_dataset_order(self):
+        for i in range(3):
+            self.write_shard(i, 3)
+        self.assertEqual(merge_shards(self.output, 3), len(IDS))
+        self.assertEqual([r["id"] for r in load_results(self.output)], IDS)
+
+    def test_merge_rejects_gaps_and_duplicates(self):
+        own = [IDS[p] for p in shard_positions(IDS, 0, 2)]
+        self.write_shard(0, 2, own[1:] + [own[2]])      # one missing, one duplicated
+        self.write_shard(1, 2)
+        with self.assertRaises(MergeError) as raised:
+            merge_shards(self.output, 2)
+        message = str(raised.exception)
+        self.assertIn("duplicate id", message)
+        self.assertIn("1 of", message)
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_merge_reports_missing_shard(self):
+        self.write_shard(0, 2)
+        with self.assertRaises(MergeError):
+            merge_shards(self.output, 2)
+
+if __name__ == '__main__':
+    unittest.main()
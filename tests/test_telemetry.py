@@ -0,0 +1,66 @@
+import unittest
+from telemetry import LatencyHistogram, Telemetry
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_histogram_quantiles_within_bin_width(self):
+        hist = LatencyHistogram()
+        values = [i / 1000 for i in range(1, 1001)]   # 1ms .. 1s
+        for v in values:
+            hist.record(v)
+        for q in (0.5, 0.95, 0.99):
+            exact = values[int(q * len(values)) - 1]
+            self.assertAlmostEqual(hist.quantile(q) / exact, 1.0, delta=0.06)
+        self.assertEqual(hist.quantile(1.0), 1.0)
+        self.assertIsNone(LatencyHistogram().quantile(0.5))
+
+    def test_summary_counts_retries_tokens_and_cache_hits(self):
+        clock = FakeClock()
+        t = Telemetry(clock=clock)
+        t.record_call("greedy", 0.2, attempts=3, usage={"prompt_tokens": 10, "completion_tokens": 2}, hedges=1)
+        t.record_call("sampled", 0.4, usage={"prompt_tokens": 10, "completion_tokens": 4})
+        t.record_call("sampled", 1.0, attempts=5, failed=True)
+        t.record_cache_hits("sampled", 2)
+        clock.now = 2.0
+        summary = t.summary()
+        self.assertEqual(summary["calls"], 3)
+        self.assertEqual(summary["tokens"], 26)
+        self.assertEqual(summary["tokens_per_second"], 13)
+        # The hedged duplicate is not a retry.
+        self.assertEqual(summary["by_kind"]["greedy"]["retries"], 2)
+        self.assertEqual(summary["by_kind"]["greedy"]["hedges"], 1)
+        self.assertEqual(summary["by_kind"]["sampled"]["failures"], 1)
+        self.assertEqual(summary["by_kind"]["sampled"]["cache_hit_rate"], 0.5)
+        self.assertEqual(t.live()["tok/s"], "13")
+
+    def test_span_hooks_see_duration_and_errors(self):
+        clock = FakeClock()
+        t = Telemetry(clock=clock)
+        spans = []
+        t.add_hook(spans.append)
+        with t.span("call", kind="greedy") as span:
+            clock.now += 0.5
+            span.set_attribute("attempts", 1)
+        with self.assertRaises(ValueError):
+            with t.span("call"):
+                raise ValueError("boom")
+        self.assertEqual(spans[0].duration, 0.5)
+        self.assertEqual(spans[0].attributes, {"kind": "greedy", "attempts": 1})
+        self.assertEqual(spans[1].error, "ValueError: boom")
+
+    def test_timed_phases_accumulate(self):
+        clock = FakeClock()
+        t = Telemetry(clock=clock)
+        for _ in range(3):
+            with t.timed("write"):
+                clock.now += 0.1
+        self.assertAlmostEqual(t.summary()["phases"]["write"], 0.3)
+
+if __name__ == '__main__':
+    unittest.main()